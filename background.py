@@ -0,0 +1,235 @@
+from bitboard import move_name
+from engine import Search
+from transposition import TranspositionTable
+import multiprocessing
+import queue
+import random
+import threading
+import time
+
+###########################################################
+# Background engine
+#
+# Bot moves computed off the caller's thread, so a pygame loop keeps
+# pumping events while the bot thinks. Jobs go to one worker, a process by
+# default since the search holds the interpreter lock, or a thread. The
+# worker sends back progress messages while searching and the move at the
+# end, all through a queue the caller polls once per frame. Every job has
+# a number; cancelling raises the shared cancel number, the search stops
+# at its next limit check and results of cancelled jobs are dropped.
+#
+###########################################################
+
+BOT_TYPES = ["engine", "random"]
+
+# Seconds between progress messages of a search
+PROGRESS_INTERVAL = 0.1
+
+
+def _engine_loop(requests, results, cancelled, hash_mb):
+    """
+    Worker entry point: run jobs until a None job arrives
+    :param requests: queue of (job number, Bitboard, history, bot type,
+    time limit, node limit, max depth, seed)
+    :param results: queue of ("progress", job number, nodes, seconds) and
+    ("move", job number, move name or None, search info)
+    :param cancelled: shared value, jobs numbered up to it are cancelled
+    :param hash_mb: transposition table size in MB, 0 to disable
+    """
+    table = TranspositionTable(hash_mb) if hash_mb else None
+
+    while True:
+        job = requests.get()
+        if job is None:
+            return
+        number, position, history, bot_type, time_limit, node_limit, \
+            max_depth, seed = job
+        if number <= cancelled.value:
+            continue
+
+        if bot_type == "random":
+            moves = position.legal_moves()
+            move = random.Random(seed).choice(moves) if moves else None
+            info = {"depth": 0, "nodes": 0, "seconds": 0.0, "nps": 0.0,
+                    "score": 0}
+        else:
+            last_report = [0.0]
+
+            def report(nodes, seconds):
+                if seconds - last_report[0] >= PROGRESS_INTERVAL:
+                    last_report[0] = seconds
+                    results.put(("progress", number, nodes, seconds))
+
+            search = Search(position, time_limit, node_limit, max_depth,
+                            history, table,
+                            stop=lambda: number <= cancelled.value,
+                            progress=report)
+            move = search.search()
+            info = dict(search.get_info())
+            info.pop("table", None)
+
+        if number > cancelled.value:
+            results.put(("move", number,
+                         move_name(move) if move is not None else None, info))
+
+
+class BackgroundEngine:
+    def __init__(self, bot_type="engine", time_limit=1.0, node_limit=None,
+                 max_depth=64, hash_mb=16, use_process=True, seed=None):
+        """
+        :param bot_type: "engine" searches, "random" plays a random move
+        :param time_limit: seconds per move or None
+        :param node_limit: nodes per move or None
+        :param max_depth: deepest search iteration
+        :param hash_mb: transposition table size of the worker in MB
+        :param use_process: run the worker in a process, otherwise a thread
+        :param seed: seed of the random bot
+        """
+        if bot_type not in BOT_TYPES:
+            raise ValueError("Unknown bot type: " + str(bot_type))
+        self._bot_type = bot_type
+        self._time_limit = time_limit
+        self._node_limit = node_limit
+        self._max_depth = max_depth
+        self._hash_mb = hash_mb
+        self._use_process = use_process
+        self._random = random.Random(seed)
+
+        self._worker = None
+        self._requests = None
+        self._results = None
+        self._cancelled = None
+        self._job = 0
+        self._thinking = False
+        self._progress = None
+        self._info = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        Start the worker, done by the first call to think
+        """
+        if self._worker is not None:
+            return
+        if self._use_process:
+            self._requests = multiprocessing.Queue()
+            self._results = multiprocessing.Queue()
+            self._cancelled = multiprocessing.Value("q", 0)
+            worker_type = multiprocessing.Process
+        else:
+            self._requests = queue.Queue()
+            self._results = queue.Queue()
+            self._cancelled = multiprocessing.Value("q", 0, lock=False)
+            worker_type = threading.Thread
+        self._worker = worker_type(target=_engine_loop, daemon=True,
+                                   args=(self._requests, self._results,
+                                         self._cancelled, self._hash_mb))
+        self._worker.start()
+
+    def close(self):
+        """
+        Cancel the current job and stop the worker
+        """
+        if self._worker is None:
+            return
+        self.cancel()
+        self._requests.put(None)
+        self._worker.join(max(self._time_limit or 0, 1.0) + 1.0)
+        if self._use_process:
+            if self._worker.is_alive():
+                self._worker.terminate()
+                self._worker.join()
+            self._requests.close()
+            self._results.close()
+        self._worker = None
+
+    def think(self, position, history=None):
+        """
+        Start computing a move, cancelling any move still being computed
+        :param position: Bitboard of the side to move, copied
+        :param history: keys of positions already played in the game
+        :return: job number
+        """
+        self.start()
+        self.cancel()
+        self._job += 1
+        self._thinking = True
+        self._progress = {"nodes": 0, "seconds": 0.0, "nps": 0.0}
+        self._requests.put((self._job, position.copy(), list(history or ()),
+                            self._bot_type, self._time_limit,
+                            self._node_limit, self._max_depth,
+                            self._random.randrange(1 << 30)))
+        return self._job
+
+    def cancel(self):
+        """
+        Stop the current job; its move is never returned by poll
+        """
+        if self._cancelled is not None:
+            self._cancelled.value = self._job
+        self._thinking = False
+        self._progress = None
+
+    def is_thinking(self):
+        return self._thinking
+
+    def get_progress(self):
+        """
+        :return: dict of nodes, seconds and nps of the current search, or
+        None when not thinking
+        """
+        return self._progress
+
+    def get_info(self):
+        """
+        Search info of the last move returned by poll
+        """
+        return self._info
+
+    def poll(self):
+        """
+        Take the messages the worker sent so far, without waiting
+        :return: move name of the current job once it is done, otherwise
+        None
+        """
+        if self._results is None:
+            return None
+        while True:
+            try:
+                message = self._results.get_nowait()
+            except queue.Empty:
+                return None
+            if message[1] != self._job or not self._thinking:
+                continue
+
+            if message[0] == "progress":
+                nodes, seconds = message[2:]
+                self._progress = {"nodes": nodes, "seconds": seconds,
+                                  "nps": nodes / seconds if seconds > 0
+                                  else 0.0}
+            else:
+                self._thinking = False
+                self._progress = None
+                self._info = message[3]
+                return message[2]
+
+    def wait(self, timeout=None):
+        """
+        Poll until the current job is done
+        :param timeout: seconds to wait at most, or None
+        :return: move name, or None when not thinking or out of time
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self._thinking:
+            move = self.poll()
+            if move is not None or not self._thinking:
+                return move
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(0.005)
+        return None
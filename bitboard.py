@@ -0,0 +1,877 @@
+###########################################################
+# Bitboard position
+#
+# Alternative position backend storing one 64 bit integer per piece type
+# and color. Squares are numbered 0 - 63 from a1 to h8 (a1 = 0, b1 = 1,
+# ..., h8 = 63). Moves are generated with shifts, masks and attack tables
+# built once at import. GameBoard keeps a Bitboard in sync with its 8x8
+# grid so analysis code can use the fast backend behind the existing API.
+#
+###########################################################
+
+import random
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+EMPTY = -1
+
+COLORS = ["W", "B"]
+PIECE_NAMES = ["Pawn", "Knight", "Bishop", "Rook", "Queen", "King"]
+FILES = "abcdefgh"
+RANKS = "12345678"
+SQUARE_NAMES = [file + rank for rank in RANKS for file in FILES]
+SQUARE_INDEX = {name: square for square, name in enumerate(SQUARE_NAMES)}
+
+FULL_BOARD = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+
+# Castling right bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE = 1, 2
+BLACK_KINGSIDE, BLACK_QUEENSIDE = 4, 8
+
+# Rook start and target squares keyed by the castling king's target square
+CASTLE_ROOK_SQUARES = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}
+
+PROMOTIONS = [QUEEN, ROOK, BISHOP, KNIGHT]
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = "pnbrqk"
+FEN_CASTLING = [(WHITE_KINGSIDE, "K"), (WHITE_QUEENSIDE, "Q"),
+                (BLACK_KINGSIDE, "k"), (BLACK_QUEENSIDE, "q")]
+
+# King and rook home squares each castling right needs
+CASTLING_HOMES = {WHITE_KINGSIDE: (WHITE, 4, 7), WHITE_QUEENSIDE: (WHITE, 4, 0),
+                  BLACK_KINGSIDE: (BLACK, 60, 63),
+                  BLACK_QUEENSIDE: (BLACK, 60, 56)}
+
+
+def square_index(loc):
+    """
+    :param loc: Chess coordinate location, example "a1"
+    :return: square number 0 - 63
+    """
+    return SQUARE_INDEX[loc]
+
+
+def square_name(square):
+    return SQUARE_NAMES[square]
+
+
+def encode_move(from_sq, to_sq, promotion=0):
+    return from_sq | (to_sq << 6) | (promotion << 12)
+
+
+def decode_move(move):
+    """
+    :param move: encoded move
+    :return: from square, to square, promotion piece type or 0
+    """
+    return move & 63, (move >> 6) & 63, move >> 12
+
+
+def move_name(move):
+    """
+    Format a move the way Chess.validate_move expects it, example "e2 e4"
+    """
+    from_sq, to_sq, promotion = decode_move(move)
+    name = SQUARE_NAMES[from_sq] + " " + SQUARE_NAMES[to_sq]
+    if promotion:
+        name += "nbrq"[promotion - 1]
+    return name
+
+
+def move_from_name(name):
+    """
+    Encode a move given the way Chess.validate_move expects it
+    :param name: move such as "e2 e4" or "e7 e8q"
+    :return: encoded move
+    """
+    promotion = "nbrq".index(name[5]) + 1 if len(name) > 5 else 0
+    return encode_move(SQUARE_INDEX[name[:2]], SQUARE_INDEX[name[3:5]],
+                       promotion)
+
+
+def lsb(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def pop_count(bits):
+    return bin(bits).count("1")
+
+
+#####################################################################
+# Attack tables
+#
+# Built once at import
+#
+#####################################################################
+
+# Ray directions as (col step, row step); the first four point towards
+# higher square numbers so the nearest blocker is the lowest set bit
+POSITIVE_DIRECTIONS = [(0, 1), (1, 1), (1, 0), (-1, 1)]
+NEGATIVE_DIRECTIONS = [(0, -1), (-1, -1), (-1, 0), (1, -1)]
+DIRECTIONS = POSITIVE_DIRECTIONS + NEGATIVE_DIRECTIONS
+ROOK_DIRECTIONS = [0, 2, 4, 6]
+BISHOP_DIRECTIONS = [1, 3, 5, 7]
+
+
+def _step_targets(steps, max_steps):
+    table = []
+    for square in range(64):
+        col, row = square % 8, square // 8
+        bits = 0
+        for d_col, d_row in steps:
+            t_col, t_row = col + d_col, row + d_row
+            count = 0
+            while 0 <= t_col < 8 and 0 <= t_row < 8 and count < max_steps:
+                bits |= 1 << (t_col + 8 * t_row)
+                t_col += d_col
+                t_row += d_row
+                count += 1
+        table.append(bits)
+    return table
+
+
+KNIGHT_ATTACKS = _step_targets([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2),
+                                (-2, -1), (-2, 1), (-1, 2)], 1)
+KING_ATTACKS = _step_targets(DIRECTIONS, 1)
+PAWN_ATTACKS = [_step_targets([(-1, 1), (1, 1)], 1),
+                _step_targets([(-1, -1), (1, -1)], 1)]
+RAYS = [_step_targets([direction], 7) for direction in DIRECTIONS]
+
+# Squares strictly between two squares on a shared line, 0 otherwise
+BETWEEN_MASKS = [[0] * 64 for square in range(64)]
+for _direction in range(8):
+    for _square in range(64):
+        for _target in iter_bits(RAYS[_direction][_square]):
+            BETWEEN_MASKS[_square][_target] = RAYS[_direction][_square] & \
+                ~RAYS[_direction][_target] & ~(1 << _target)
+
+# No piece pinned
+NO_PINS = dict()
+
+# Castling rights kept when a piece moves from or to a square
+CASTLE_MASK = [15] * 64
+CASTLE_MASK[4] = 15 ^ (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLE_MASK[0] = 15 ^ WHITE_QUEENSIDE
+CASTLE_MASK[7] = 15 ^ WHITE_KINGSIDE
+CASTLE_MASK[60] = 15 ^ (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLE_MASK[56] = 15 ^ BLACK_QUEENSIDE
+CASTLE_MASK[63] = 15 ^ BLACK_KINGSIDE
+
+
+#####################################################################
+# Zobrist keys
+#
+# Fixed seed so keys are identical across processes and runs, which lets
+# hashes be stored on disk
+#
+#####################################################################
+
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for square in range(64)]
+                  for code in range(12)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for rights in range(16)]
+ZOBRIST_EP_FILE = [_zobrist_random.getrandbits(64) for file in range(8)]
+
+
+def nearest_square(bits, direction):
+    """
+    :return: square of the set bit closest to the start of a ray
+    """
+    if direction < 4:
+        return (bits & -bits).bit_length() - 1
+    return bits.bit_length() - 1
+
+
+def slider_attacks(square, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if direction < 4:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(square, occupied):
+    return slider_attacks(square, occupied, BISHOP_DIRECTIONS)
+
+
+def rook_attacks(square, occupied):
+    return slider_attacks(square, occupied, ROOK_DIRECTIONS)
+
+
+class Bitboard:
+    def __init__(self):
+        """
+        Creates the standard starting position
+        """
+        self._pieces = [[0] * 6, [0] * 6]
+        self._occupied = [0, 0]
+        self._board = [EMPTY] * 64
+        self._side = WHITE
+        self._castling = 15
+        self._ep_square = -1
+        self._halfmove = 0
+        self._fullmove = 1
+        self._history = []
+        self._key = 0
+
+        back_rank = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+        for col, piece_type in enumerate(back_rank):
+            self.put_piece(WHITE, piece_type, col)
+            self.put_piece(WHITE, PAWN, col + 8)
+            self.put_piece(BLACK, PAWN, col + 48)
+            self.put_piece(BLACK, piece_type, col + 56)
+        self._key = self.compute_hash()
+
+    @classmethod
+    def empty(cls):
+        position = cls()
+        position.clear()
+        return position
+
+    @classmethod
+    def from_game_board(cls, board, side_color):
+        """
+        Build a bitboard position from a GameBoard
+        :param board: GameBoard
+        :param side_color: color to move, "W" or "B"
+        :return: Bitboard
+        """
+        position = cls.empty()
+        castling = 0
+        rights = {(WHITE, 7): WHITE_KINGSIDE, (WHITE, 0): WHITE_QUEENSIDE,
+                  (BLACK, 63): BLACK_KINGSIDE, (BLACK, 56): BLACK_QUEENSIDE}
+        kings_home = dict()
+
+        for piece in board.get_board():
+            if piece is None:
+                continue
+            color = COLORS.index(piece.get_color())
+            piece_type = PIECE_NAMES.index(piece.get_name())
+            square = piece.get_location()
+            position.put_piece(color, piece_type, square)
+
+            if piece_type == KING and not piece.has_moved():
+                kings_home[color] = square == (4 if color == WHITE else 60)
+            elif piece_type == ROOK and not piece.has_moved():
+                castling |= rights.get((color, square), 0)
+
+            if piece_type == PAWN and piece.available_en_passant():
+                position._ep_square = piece.get_en_passant_moves()["Move"]
+
+        for color, mask in (WHITE, WHITE_KINGSIDE | WHITE_QUEENSIDE), \
+                           (BLACK, BLACK_KINGSIDE | BLACK_QUEENSIDE):
+            if not kings_home.get(color, False):
+                castling &= ~mask
+
+        position._castling = castling
+        position._side = COLORS.index(side_color)
+        position._key = position.compute_hash()
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Build a position from Forsyth-Edwards Notation
+        :param fen: FEN string; the move clocks may be left out
+        :return: Bitboard
+        """
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        position = cls.empty()
+
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        for rank_index, rank in enumerate(ranks):
+            row = 7 - rank_index
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                elif char.lower() in FEN_PIECES and col < 8:
+                    color = WHITE if char.isupper() else BLACK
+                    position.put_piece(color, FEN_PIECES.index(char.lower()),
+                                       col + 8 * row)
+                    col += 1
+                else:
+                    raise ValueError("Bad FEN board: " + fen)
+            if col != 8:
+                raise ValueError("FEN rank needs 8 squares: " + fen)
+
+        for color in WHITE, BLACK:
+            if pop_count(position._pieces[color][KING]) != 1:
+                raise ValueError("FEN needs one king per side: " + fen)
+
+        if fields[1] not in ("w", "b"):
+            raise ValueError("Bad FEN side to move: " + fen)
+        position._side = WHITE if fields[1] == "w" else BLACK
+        if position.in_check(position._side ^ 1):
+            raise ValueError("FEN side not to move is in check: " + fen)
+
+        # Rights whose king or rook has left its home square are dropped
+        for right, char in FEN_CASTLING:
+            color, king_sq, rook_sq = CASTLING_HOMES[right]
+            if char in fields[2] and \
+                    position._pieces[color][KING] >> king_sq & 1 and \
+                    position._pieces[color][ROOK] >> rook_sq & 1:
+                position._castling |= right
+
+        # The square must be behind a pawn of the side not to move that has
+        # just made a double step
+        if fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in FILES or \
+                    fields[3][1] != ("6" if position._side == WHITE else "3"):
+                raise ValueError("Bad FEN en passant square: " + fen)
+            ep_square = square_index(fields[3])
+            forward = 8 if position._side == WHITE else -8
+            if position._board[ep_square - forward] != \
+                    (position._side ^ 1) * 6 + PAWN or \
+                    position._board[ep_square] != EMPTY or \
+                    position._board[ep_square + forward] != EMPTY:
+                raise ValueError("FEN en passant square without a double "
+                                 "pawn step: " + fen)
+            position._ep_square = ep_square
+
+        if len(fields) > 4:
+            position._halfmove = int(fields[4])
+        if len(fields) > 5:
+            position._fullmove = int(fields[5])
+
+        position._key = position.compute_hash()
+        return position
+
+    def to_fen(self):
+        """
+        :return: Forsyth-Edwards Notation of the position
+        """
+        ranks = []
+        for row in range(7, -1, -1):
+            rank = ""
+            empty = 0
+            for col in range(8):
+                code = self._board[col + 8 * row]
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                char = FEN_PIECES[code % 6]
+                rank += char.upper() if code < 6 else char
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        castling = "".join(char for right, char in FEN_CASTLING
+                           if self._castling & right) or "-"
+        ep = SQUARE_NAMES[self._ep_square] if self._ep_square != -1 else "-"
+        return "{} {} {} {} {} {}".format("/".join(ranks),
+                                          "w" if self._side == WHITE else "b",
+                                          castling, ep, self._halfmove,
+                                          self._fullmove)
+
+    def get_clocks(self):
+        """
+        :return: halfmove clock and fullmove number
+        """
+        return self._halfmove, self._fullmove
+
+    def clear(self):
+        self._pieces = [[0] * 6, [0] * 6]
+        self._occupied = [0, 0]
+        self._board = [EMPTY] * 64
+        self._castling = 0
+        self._ep_square = -1
+        self._history = []
+        self._key = 0
+
+    def copy(self):
+        position = Bitboard.empty()
+        position._pieces = [list(self._pieces[0]), list(self._pieces[1])]
+        position._occupied = list(self._occupied)
+        position._board = list(self._board)
+        position._side = self._side
+        position._castling = self._castling
+        position._ep_square = self._ep_square
+        position._halfmove = self._halfmove
+        position._fullmove = self._fullmove
+        position._key = self._key
+        return position
+
+    def get_side(self):
+        return self._side
+
+    def get_castling(self):
+        return self._castling
+
+    def get_ep_square(self):
+        return self._ep_square
+
+    def get_hash(self):
+        return self._key
+
+    def compute_hash(self):
+        """
+        Zobrist key computed from scratch; make_move keeps the same key
+        up to date incrementally
+        :return: 64 bit key
+        """
+        key = 0
+        for square, code in enumerate(self._board):
+            if code != EMPTY:
+                key ^= ZOBRIST_PIECES[code][square]
+        if self._side == BLACK:
+            key ^= ZOBRIST_SIDE
+        key ^= ZOBRIST_CASTLING[self._castling]
+        return key ^ self.ep_hash()
+
+    def ep_hash(self):
+        """
+        The en passant file is only part of the key when the side to move
+        has a pawn that can capture en passant
+        """
+        ep_square = self._ep_square
+        if ep_square != -1 and PAWN_ATTACKS[self._side ^ 1][ep_square] & \
+                self._pieces[self._side][PAWN]:
+            return ZOBRIST_EP_FILE[ep_square % 8]
+        return 0
+
+    def get_placement(self):
+        return tuple(self._board)
+
+    def get_piece(self, square):
+        """
+        :param square: square number 0 - 63
+        :return: (color, piece type) or None for an empty square
+        """
+        code = self._board[square]
+        if code == EMPTY:
+            return None
+        return divmod(code, 6)
+
+    def get_pieces(self, color, piece_type):
+        return self._pieces[color][piece_type]
+
+    def get_occupied(self, color=None):
+        if color is None:
+            return self._occupied[WHITE] | self._occupied[BLACK]
+        return self._occupied[color]
+
+    def put_piece(self, color, piece_type, square):
+        bit = 1 << square
+        code = color * 6 + piece_type
+        self._pieces[color][piece_type] |= bit
+        self._occupied[color] |= bit
+        self._board[square] = code
+        self._key ^= ZOBRIST_PIECES[code][square]
+
+    def remove_piece(self, square):
+        code = self._board[square]
+        color, piece_type = divmod(code, 6)
+        bit = 1 << square
+        self._pieces[color][piece_type] ^= bit
+        self._occupied[color] ^= bit
+        self._board[square] = EMPTY
+        self._key ^= ZOBRIST_PIECES[code][square]
+
+    #####################################################################
+    # Attacks
+    #####################################################################
+
+    def is_attacked(self, square, by_color):
+        """
+        :param square: square number 0 - 63
+        :param by_color: attacking color
+        :return: True if any piece of by_color attacks the square
+        """
+        pieces = self._pieces[by_color]
+        if PAWN_ATTACKS[by_color ^ 1][square] & pieces[PAWN]:
+            return True
+        if KNIGHT_ATTACKS[square] & pieces[KNIGHT]:
+            return True
+        if KING_ATTACKS[square] & pieces[KING]:
+            return True
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        diagonal = pieces[BISHOP] | pieces[QUEEN]
+        if diagonal and bishop_attacks(square, occupied) & diagonal:
+            return True
+        straight = pieces[ROOK] | pieces[QUEEN]
+        if straight and rook_attacks(square, occupied) & straight:
+            return True
+        return False
+
+    def attackers(self, square, by_color, occupied):
+        """
+        :param square: square number 0 - 63
+        :param by_color: attacking color
+        :param occupied: mask of the squares sliders are blocked by
+        :return: mask of the pieces of by_color attacking the square
+        """
+        pieces = self._pieces[by_color]
+        return PAWN_ATTACKS[by_color ^ 1][square] & pieces[PAWN] | \
+            KNIGHT_ATTACKS[square] & pieces[KNIGHT] | \
+            KING_ATTACKS[square] & pieces[KING] | \
+            bishop_attacks(square, occupied) & \
+            (pieces[BISHOP] | pieces[QUEEN]) | \
+            rook_attacks(square, occupied) & (pieces[ROOK] | pieces[QUEEN])
+
+    def king_square(self, color):
+        return lsb(self._pieces[color][KING])
+
+    def in_check(self, color=None):
+        if color is None:
+            color = self._side
+        king = self._pieces[color][KING]
+        if not king:
+            return False
+        return self.is_attacked(lsb(king), color ^ 1)
+
+    #####################################################################
+    # Move generation
+    #####################################################################
+
+    def pseudo_legal_moves(self):
+        """
+        Generate moves that follow piece movement rules but may leave the
+        mover's king in check
+        :return: list of encoded moves
+        """
+        moves = []
+        side = self._side
+        not_own = ~self._occupied[side] & FULL_BOARD
+        self.pawn_moves(moves, FULL_BOARD, NO_PINS)
+        pawns = self._pieces[side][PAWN]
+        if self._ep_square != -1:
+            attackers = PAWN_ATTACKS[side ^ 1][self._ep_square] & pawns
+            for from_sq in iter_bits(attackers):
+                moves.append(from_sq | (self._ep_square << 6))
+
+        self.piece_moves(moves, FULL_BOARD, NO_PINS)
+        for from_sq in iter_bits(self._pieces[side][KING]):
+            for to_sq in iter_bits(KING_ATTACKS[from_sq] & not_own):
+                moves.append(from_sq | (to_sq << 6))
+
+        # Castling; the king's target square is tested by the legality check
+        moves.extend(self.castle_moves())
+
+        return moves
+
+    def pawn_moves(self, moves, evasions, pins):
+        """
+        Add pawn pushes and captures other than en passant
+        :param moves: list the encoded moves are appended to
+        :param evasions: mask of the target squares allowed
+        :param pins: dict of pinned square to the mask it may move in
+        :return: None
+        """
+        side = self._side
+        pawns = self._pieces[side][PAWN]
+        enemy = self._occupied[side ^ 1]
+        empty = ~(self._occupied[side] | enemy) & FULL_BOARD
+
+        if side == WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            left = (pawns << 7) & ~FILE_H & enemy
+            right = (pawns << 9) & ~FILE_A & enemy
+            push, capture_left, capture_right = 8, 7, 9
+            last_rank = RANK_8
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            left = (pawns >> 9) & ~FILE_H & enemy
+            right = (pawns >> 7) & ~FILE_A & enemy
+            push, capture_left, capture_right = -8, -9, -7
+            last_rank = RANK_1
+
+        for targets, offset in (single, push), (left, capture_left), \
+                               (right, capture_right), (double, 2 * push):
+            targets &= evasions
+            for to_sq in iter_bits(targets):
+                from_sq = to_sq - offset
+                if from_sq in pins and not pins[from_sq] >> to_sq & 1:
+                    continue
+                if last_rank >> to_sq & 1:
+                    for promotion in PROMOTIONS:
+                        moves.append(from_sq | (to_sq << 6) |
+                                     (promotion << 12))
+                else:
+                    moves.append(from_sq | (to_sq << 6))
+
+    def piece_moves(self, moves, evasions, pins):
+        """
+        Add knight, bishop, rook and queen moves
+        :param moves: list the encoded moves are appended to
+        :param evasions: mask of the target squares allowed
+        :param pins: dict of pinned square to the mask it may move in
+        :return: None
+        """
+        side = self._side
+        pieces = self._pieces[side]
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        allowed = ~self._occupied[side] & evasions
+
+        for from_sq in iter_bits(pieces[KNIGHT]):
+            # A pinned knight never stays on its pin ray
+            if from_sq not in pins:
+                for to_sq in iter_bits(KNIGHT_ATTACKS[from_sq] & allowed):
+                    moves.append(from_sq | (to_sq << 6))
+        for from_sq in iter_bits(pieces[BISHOP]):
+            for to_sq in iter_bits(bishop_attacks(from_sq, occupied) &
+                                   allowed & pins.get(from_sq, FULL_BOARD)):
+                moves.append(from_sq | (to_sq << 6))
+        for from_sq in iter_bits(pieces[ROOK]):
+            for to_sq in iter_bits(rook_attacks(from_sq, occupied) &
+                                   allowed & pins.get(from_sq, FULL_BOARD)):
+                moves.append(from_sq | (to_sq << 6))
+        for from_sq in iter_bits(pieces[QUEEN]):
+            attacks = bishop_attacks(from_sq, occupied) | \
+                rook_attacks(from_sq, occupied)
+            for to_sq in iter_bits(attacks & allowed &
+                                   pins.get(from_sq, FULL_BOARD)):
+                moves.append(from_sq | (to_sq << 6))
+
+    def castle_moves(self):
+        moves = []
+        side = self._side
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        if side == WHITE:
+            options = [(WHITE_KINGSIDE, 4, 6, 0x60),
+                       (WHITE_QUEENSIDE, 4, 2, 0x0E)]
+        else:
+            options = [(BLACK_KINGSIDE, 60, 62, 0x60 << 56),
+                       (BLACK_QUEENSIDE, 60, 58, 0x0E << 56)]
+
+        rooks = self._pieces[side][ROOK]
+        for right, king_sq, to_sq, between in options:
+            if not self._castling & right or occupied & between:
+                continue
+            if not rooks >> CASTLE_ROOK_SQUARES[to_sq][0] & 1:
+                continue
+            if self.is_attacked(king_sq, side ^ 1):
+                continue
+            if self.is_attacked((king_sq + to_sq) // 2, side ^ 1):
+                continue
+            moves.append(king_sq | (to_sq << 6))
+        return moves
+
+    def legal_moves(self):
+        """
+        Generate every legal move for the side to move. With one checker
+        other pieces must capture it or block; with two only the king moves.
+        Pinned pieces keep to their pin ray and the king avoids attacked
+        squares, found with the king taken off the board so it cannot hide
+        behind itself. Only en passant, which can open a rank, is tried on
+        the board
+        :return: list of encoded moves
+        """
+        moves = []
+        side = self._side
+        king_sq = lsb(self._pieces[side][KING])
+        occupied = self._occupied[WHITE] | self._occupied[BLACK]
+        checkers = self.attackers(king_sq, side ^ 1, occupied)
+
+        if not checkers:
+            evasions = FULL_BOARD
+        elif checkers & (checkers - 1):
+            evasions = 0
+        else:
+            evasions = BETWEEN_MASKS[king_sq][lsb(checkers)] | checkers
+
+        if evasions:
+            pins = self.pins(king_sq)
+            self.pawn_moves(moves, evasions, pins)
+            if self._ep_square != -1:
+                attackers = PAWN_ATTACKS[side ^ 1][self._ep_square] & \
+                    self._pieces[side][PAWN]
+                for from_sq in iter_bits(attackers):
+                    move = from_sq | (self._ep_square << 6)
+                    self.make_move(move)
+                    if not self.in_check(side):
+                        moves.append(move)
+                    self.unmake_move()
+            self.piece_moves(moves, evasions, pins)
+
+        without_king = occupied ^ (1 << king_sq)
+        for to_sq in iter_bits(KING_ATTACKS[king_sq] &
+                               ~self._occupied[side]):
+            if not self.attackers(to_sq, side ^ 1, without_king):
+                moves.append(king_sq | (to_sq << 6))
+
+        if not checkers:
+            for move in self.castle_moves():
+                if not self.is_attacked(move >> 6, side ^ 1):
+                    moves.append(move)
+        return moves
+
+    def pins(self, king_sq):
+        """
+        :param king_sq: square of the king of the side to move
+        :return: dict of the square of each piece pinned to the king to
+        the squares between the king and the pinner, the pinner included
+        """
+        pins = dict()
+        side = self._side
+        own = self._occupied[side]
+        occupied = own | self._occupied[side ^ 1]
+        enemy = self._pieces[side ^ 1]
+        for directions, sliders in \
+                (ROOK_DIRECTIONS, enemy[ROOK] | enemy[QUEEN]), \
+                (BISHOP_DIRECTIONS, enemy[BISHOP] | enemy[QUEEN]):
+            for direction in directions:
+                if not RAYS[direction][king_sq] & sliders:
+                    continue
+                blocker = nearest_square(
+                    RAYS[direction][king_sq] & occupied, direction)
+                if not own >> blocker & 1:
+                    continue
+                beyond = RAYS[direction][blocker] & occupied
+                if not beyond:
+                    continue
+                pinner = nearest_square(beyond, direction)
+                if sliders >> pinner & 1:
+                    pins[blocker] = \
+                        BETWEEN_MASKS[king_sq][pinner] | 1 << pinner
+        return pins
+
+    #####################################################################
+    # Make / unmake
+    #####################################################################
+
+    def make_move(self, move):
+        """
+        Make an encoded move, pushing an undo record
+        :param move: encoded move
+        :return: None
+        """
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        promotion = move >> 12
+        side = self._side
+        color, piece_type = divmod(self._board[from_sq], 6)
+
+        captured = self._board[to_sq]
+        capture_sq = to_sq
+        if piece_type == PAWN and to_sq == self._ep_square:
+            capture_sq = to_sq - 8 if side == WHITE else to_sq + 8
+            captured = self._board[capture_sq]
+
+        self._history.append((move, captured, capture_sq, self._castling,
+                              self._ep_square, self._halfmove, self._key))
+        self._key ^= self.ep_hash() ^ ZOBRIST_CASTLING[self._castling] ^ \
+            ZOBRIST_SIDE
+
+        if captured != EMPTY:
+            self.remove_piece(capture_sq)
+        self.remove_piece(from_sq)
+        if promotion:
+            self.put_piece(color, promotion, to_sq)
+        else:
+            self.put_piece(color, piece_type, to_sq)
+
+        if piece_type == KING and abs(to_sq - from_sq) == 2:
+            rook_from, rook_to = CASTLE_ROOK_SQUARES[to_sq]
+            self.remove_piece(rook_from)
+            self.put_piece(color, ROOK, rook_to)
+
+        self._ep_square = -1
+        if piece_type == PAWN and abs(to_sq - from_sq) == 16:
+            self._ep_square = (from_sq + to_sq) // 2
+
+        self._castling &= CASTLE_MASK[from_sq] & CASTLE_MASK[to_sq]
+
+        if piece_type == PAWN or captured != EMPTY:
+            self._halfmove = 0
+        else:
+            self._halfmove += 1
+        if side == BLACK:
+            self._fullmove += 1
+        self._side = side ^ 1
+        self._key ^= self.ep_hash() ^ ZOBRIST_CASTLING[self._castling]
+
+    def unmake_move(self):
+        """
+        Revert the last move made with make_move
+        :return: None
+        """
+        move, captured, capture_sq, castling, ep_square, halfmove, key = \
+            self._history.pop()
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        promotion = move >> 12
+
+        self._side ^= 1
+        side = self._side
+        if side == BLACK:
+            self._fullmove -= 1
+
+        piece_type = self._board[to_sq] % 6
+        self.remove_piece(to_sq)
+        self.put_piece(side, PAWN if promotion else piece_type, from_sq)
+
+        if piece_type == KING and abs(to_sq - from_sq) == 2:
+            rook_from, rook_to = CASTLE_ROOK_SQUARES[to_sq]
+            self.remove_piece(rook_to)
+            self.put_piece(side, ROOK, rook_from)
+
+        if captured != EMPTY:
+            self.put_piece(captured // 6, captured % 6, capture_sq)
+
+        self._castling = castling
+        self._ep_square = ep_square
+        self._halfmove = halfmove
+        self._key = key
+
+    #####################################################################
+    # Perft
+    #####################################################################
+
+    def perft(self, depth):
+        """
+        Count the leaf nodes of the legal move tree
+        :param depth: number of plies
+        :return: number of leaf nodes
+        """
+        if depth == 0:
+            return 1
+        moves = self.legal_moves()
+        if depth == 1:
+            return len(moves)
+
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def divide(self, depth):
+        results = dict()
+        for move in self.legal_moves():
+            self.make_move(move)
+            results[move_name(move)] = self.perft(depth - 1)
+            self.unmake_move()
+        return results
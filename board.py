@@ -1,16 +1,62 @@
 from pieces import *
 from rules import ChessRules
+from bitboard import *
+
+# Debug switch: when True, every incremental move update is checked against a
+# full recompute of all pieces and a RuntimeError is raised on any mismatch
+VERIFY_INCREMENTAL = False
+
+
+class MoveRecord:
+    """
+    Undo information pushed by GameBoard.make_move for each move. Games are
+    kept in memory with their full history, so the record is slotted
+    """
+    __slots__ = ("piece", "from_loc", "to_loc", "captured", "capture_loc",
+                 "rook", "rook_has_moved", "promoted",
+                 "en_passant", "castle", "has_moved", "pawn_en_passant",
+                 "changed", "moved")
+
+    def __init__(self, piece, from_loc, to_loc, en_passant, castle, has_moved,
+                 pawn_en_passant, changed, moved):
+        self.piece = piece
+        self.from_loc = from_loc
+        self.to_loc = to_loc
+        self.captured = None
+        self.capture_loc = None
+        self.rook = None
+        self.rook_has_moved = None
+        self.promoted = None
+        self.en_passant = en_passant
+        self.castle = castle
+        self.has_moved = has_moved
+        self.pawn_en_passant = pawn_en_passant
+        self.changed = changed
+        self.moved = moved
 
 
 class GameBoard:
     def __init__(self, player_1, player_2):
-        self._cols = "abcdefgh"
-        self._rows = "12345678"
         self._p1 = player_1
         self._p2 = player_2
         self._rules = ChessRules()
 
-        self._game_board = []
+        # Incremental move regeneration; each piece keeps a mask of the
+        # squares its move set depends on
+        self._incremental = True
+        self._verify_incremental = VERIFY_INCREMENTAL
+
+        # Undo records pushed by make_move and popped by unmake_move
+        self._undo_stack = []
+
+        # Squares are numbered 0 - 63 from a1 to h8; algebraic names are
+        # only used at the Chess.validate_move and interface boundary
+        self._game_board = [None] * 64
+        self._position = None
+
+        # Squares attacked by each player, indexed by player number and
+        # rebuilt whenever the possible moves are updated
+        self._attack_maps = [0, 0, 0]
         self.set_up_board()
 
         self._en_passant = False
@@ -20,49 +66,46 @@ class GameBoard:
         return self._game_board
 
     def get_cols_and_rows(self):
-        return self._cols, self._rows
+        return FILES, RANKS
 
     def set_castle(self, value):
         self._castle = value
 
+    def get_castle(self):
+        return self._castle
+
     def set_en_passant(self, value):
         self._en_passant = value
 
-    def get_location_format(self, col, row):
-        return self._cols[col] + self._rows[row]
+    def get_en_passant(self):
+        return self._en_passant
 
-    def get_board_col_row(self, loc):
-        """
-        Returns board grid coordinates for given location
-        :param loc: Chess coordinate location, example "a1"
-        :return: Grid coordinates for given location
-        """
-        col, row = loc[0], loc[1]
-        return self._cols.index(col), self._rows.index(row)
+    def set_incremental(self, value):
+        self._incremental = value
+
+    def set_verify_incremental(self, value):
+        self._verify_incremental = value
 
     def get_board_loc(self, loc):
         """
         Retrieves value at given board location
-        :param loc: Chess coordinate location, example "a1"
+        :param loc: square number 0 - 63, a1 = 0
         :return: Piece if piece at given location, otherwise None
         """
-        col, row = self.get_board_col_row(loc)
-        return self._game_board[row][col]
+        return self._game_board[loc]
 
     def move_board_piece(self, cur_loc, tar_loc):
         """
         Sets the given board location to a new value
-        :param cur_loc: Chess coordinate location, example "a1"
-        :param tar_loc: Piece or None if space is to be cleared
+        :param cur_loc: square number of the piece to move
+        :param tar_loc: square number the piece moves to
         :return: None
         """
-        cur_col, cur_row = self.get_board_col_row(cur_loc)
-        tar_col, tar_row = self.get_board_col_row(tar_loc)
-        cur_piece = self.get_board_loc(cur_loc)
+        cur_piece = self._game_board[cur_loc]
 
-        self._game_board[tar_row][tar_col] = cur_piece
+        self._game_board[tar_loc] = cur_piece
         cur_piece.set_location(tar_loc)
-        self._game_board[cur_row][cur_col] = None
+        self._game_board[cur_loc] = None
 
         if cur_piece.get_name() in ["King", "Rook", "Pawn"]:
             cur_piece.set_has_moved()
@@ -80,8 +123,7 @@ class GameBoard:
             self._p2.remove_piece(piece)
 
         # Remove captured piece from board
-        col, row = self.get_board_col_row(loc)
-        self._game_board[row][col] = None
+        self._game_board[loc] = None
 
         return
 
@@ -90,15 +132,14 @@ class GameBoard:
         Get neighbor location of piece; used for en passant
         :param cur_loc: location of piece
         :param col_dist: col distance from current piece to neighbor
-        :param row_dist: row distance from current piece to neighbor
+        :param row_dist: row distance from current piece to neighbor, towards
+        rank 8 when positive
         :return: neighbor or none
         """
-        cur_col, cur_row = self.get_board_col_row(cur_loc)
-        cur_col += col_dist
-        cur_row += row_dist
+        cur_col = (cur_loc & 7) + col_dist
+        cur_row = (cur_loc >> 3) + row_dist
         if cur_col in range(8) and cur_row in range(8):
-            tar_loc = self._cols[cur_col] + self._rows[cur_row]
-            return tar_loc
+            return cur_row * 8 + cur_col
         else:
             return None
 
@@ -112,101 +153,405 @@ class GameBoard:
         self._p1.set_roster(piece_set.get_roster(self._p1))
         self._p2.set_roster(piece_set.get_roster(self._p2))
 
-        self._game_board = [
-            [piece for piece in self._p1.get_roster()[:8]],
-            [piece for piece in self._p1.get_roster()[8:]],
-            [None] * 8, [None] * 8, [None] * 8, [None] * 8,
-            [piece for piece in self._p2.get_roster()[8:]],
-            [piece for piece in self._p2.get_roster()[:8]]
-        ]
-
-        if self._p1.get_color() == "B":
-            self.reverse_board()
+        self._game_board = [None] * 64
+        for piece in self._p1.get_roster() + self._p2.get_roster():
+            self._game_board[piece.get_location()] = piece
 
         self.set_all_possible_moves()
 
-    def reverse_board(self):
+        # Bitboard backend kept in sync with the grid, white moves first
+        self._position = Bitboard.from_game_board(self, "W")
+
+    @classmethod
+    def from_fen(cls, fen, player_1, player_2):
         """
-        Reverse board, used for interface
+        Create a board set up from Forsyth-Edwards Notation
+        :param fen: FEN string
+        :param player_1: Player 1
+        :param player_2: Player 2
+        :return: GameBoard
+        """
+        board = cls(player_1, player_2)
+        board.load_fen(fen)
+        return board
+
+    def load_fen(self, fen):
+        """
+        Replace the position with one given in Forsyth-Edwards Notation.
+        Has moved bits are derived from castling rights and pawn ranks,
+        en passant from the en passant square
+        :param fen: FEN string
         :return: None
         """
-        for row in self._game_board:
-            row.reverse()
-        self._cols = self._cols[::-1]
-        self._rows = self._rows[::-1]
+        position = Bitboard.from_fen(fen)
+        piece_types = {"Pawn": Pawn, "Knight": Knight, "Bishop": Bishop,
+                       "Rook": Rook, "Queen": Queen, "King": King}
+        players = {self._p1.get_color(): self._p1,
+                   self._p2.get_color(): self._p2}
+        rosters = {"W": [], "B": []}
+        castling = position.get_castling()
+        unmoved_rooks = {7: castling & WHITE_KINGSIDE,
+                         0: castling & WHITE_QUEENSIDE,
+                         63: castling & BLACK_KINGSIDE,
+                         56: castling & BLACK_QUEENSIDE}
+        king_rights = {"W": castling & (WHITE_KINGSIDE | WHITE_QUEENSIDE),
+                       "B": castling & (BLACK_KINGSIDE | BLACK_QUEENSIDE)}
+        pawn_rows = {"W": 1, "B": 6}
+
+        self._game_board = [None] * 64
+        for square in range(64):
+            piece_info = position.get_piece(square)
+            if piece_info is None:
+                continue
+            color = COLORS[piece_info[0]]
+            name = PIECE_NAMES[piece_info[1]]
+
+            piece = piece_types[name](square)
+            piece.set_player(players[color].get_turn())
+            piece.set_image_path(color)
+
+            if name == "Pawn":
+                piece.set_has_moved(square >> 3 != pawn_rows[color])
+            elif name == "Rook":
+                piece.set_has_moved(not unmoved_rooks.get(square))
+            elif name == "King":
+                piece.set_has_moved(not king_rights[color])
+
+            self._game_board[square] = piece
+            rosters[color].append(piece)
+
+        for color, player in players.items():
+            player.set_roster(rosters[color])
+            player.clear_captured_pieces()
+
+        self._en_passant = False
+        self._castle = False
+        self._undo_stack = []
+
+        # Pawn that just moved two squares sits beyond the en passant square
+        ep_square = position.get_ep_square()
+        if ep_square != -1:
+            pawn_square = ep_square + 8 if ep_square < 32 else ep_square - 8
+            start_square = 2 * ep_square - pawn_square
+            pawn = self._game_board[pawn_square]
+            if pawn is not None and pawn.get_name() == "Pawn":
+                self._rules.en_passant(pawn, start_square, pawn_square, self)
+
+        self.set_all_possible_moves()
+        self._position = position
+
+    def to_fen(self):
+        """
+        :return: Forsyth-Edwards Notation of the position, including side to
+        move, castling, en passant and the move clocks
+        """
+        return self._position.to_fen()
+
+    def get_position(self):
+        """
+        Bitboard position mirroring this board, used by analysis code that
+        needs fast move generation
+        :return: Bitboard
+        """
+        return self._position
+
+    def get_hash(self):
+        """
+        64 bit Zobrist key of the position, covering pieces, side to move,
+        castling rights and en passant file; updated by make_move
+        :return: int
+        """
+        return self._position.get_hash()
 
     def set_all_possible_moves(self):
         """
         Set all possible moves for a given piece
         :return: None
         """
-        for row in self._game_board:
-            for piece in row:
-                if piece is not None:
-                    piece.set_possible_moves(self)
+        attack_maps = [0, 0, 0]
+        for piece in self._game_board:
+            if piece is not None:
+                self.update_piece_moves(piece)
+                attack_maps[piece.get_player()] |= piece.get_attack_mask()
+        self._attack_maps = attack_maps
+
+    def get_attack_map(self, player):
+        """
+        :param player: player number
+        :return: bit mask of the squares attacked by the player's pieces
+        """
+        return self._attack_maps[player]
+
+    def is_square_attacked(self, loc, player):
+        """
+        Checks the attack map of a player, kept up to date with the position
+        :param loc: square number 0 - 63
+        :param player: player number of the attacking player
+        :return: True if a piece of the player attacks the square
+        """
+        return self._attack_maps[player] >> loc & 1 == 1
+
+    def update_piece_moves(self, piece):
+        """
+        Regenerate the possible moves of a single piece, which also records
+        the squares its move set depends on
+        :param piece: piece on the board
+        :return: None
+        """
+        piece.set_possible_moves(self)
+
+    def update_changed_squares(self, changed_locs, moved_pieces):
+        """
+        Regenerate only the pieces affected by a move: the moved pieces and
+        every piece whose move set looked at one of the changed squares.
+        The attack maps are rebuilt in the same pass
+        :param changed_locs: squares whose contents changed
+        :param moved_pieces: pieces that changed location
+        :return: None
+        """
+        changed = 0
+        for loc in changed_locs:
+            changed |= 1 << loc
+
+        # The rosters hold exactly the pieces on the board
+        attack_maps = [0, 0, 0]
+        for player in self._p1, self._p2:
+            attacks = 0
+            for piece in player.get_roster():
+                if piece.get_watched_mask() & changed or \
+                        piece in moved_pieces:
+                    self.update_piece_moves(piece)
+                attacks |= piece.get_attack_mask()
+            attack_maps[player.get_turn()] = attacks
+        self._attack_maps = attack_maps
+
+        if self._verify_incremental:
+            self.verify_possible_moves()
+            self.verify_position()
+
+    def verify_possible_moves(self):
+        """
+        Debug check comparing the incrementally updated moves to a full
+        recompute of every piece on the board
+        :return: None
+        """
+        incremental = dict()
+        for piece in self._game_board:
+            if piece is not None:
+                incremental[piece] = set(piece.get_possible_moves())
+        attack_maps = self._attack_maps
+
+        self.set_all_possible_moves()
+
+        if attack_maps != self._attack_maps:
+            raise RuntimeError("Incremental attack maps do not match full "
+                               "recompute")
+
+        for piece, moves in incremental.items():
+            if moves != piece.get_possible_moves():
+                raise RuntimeError(
+                    "Incremental moves for {} do not match full recompute: "
+                    "{} != {}".format(piece, moves,
+                                      piece.get_possible_moves()))
 
     def castle_move(self, tar_loc):
         """
         Moves pieces when a castle is performed
         :param tar_loc: target location
-        :return: none
+        :return: rook, rook start location, rook target location
         """
         self.set_castle(False)
-        rook_locs = {
-            "g1": {"MOVE": "f1", "LOC": "h1"},
-            "c1": {"MOVE": "d1", "LOC": "a1"},
-            "g8": {"MOVE": "f8", "LOC": "h8"},
-            "c8": {"MOVE": "d8", "LOC": "a8"}
-        }
 
-        rook_loc = rook_locs[tar_loc]["LOC"]
-        rook_move = rook_locs[tar_loc]["MOVE"]
+        rook_loc, rook_move = CASTLE_ROOK_SQUARES[tar_loc]
+        rook = self._game_board[rook_loc]
 
-        self.get_board_loc(rook_loc).set_location(rook_move)
+        rook.set_location(rook_move)
         self.move_board_piece(rook_loc, rook_move)
 
-    def make_move(self, cur_loc, tar_loc):
+        return rook, rook_loc, rook_move
+
+    def verify_position(self):
+        """
+        Debug check comparing the bitboard mirror to the grid
+        :return: None
+        """
+        side = "W" if self._position.get_side() == 0 else "B"
+        expected = Bitboard.from_game_board(self, side).get_placement()
+        if self._position.get_placement() != expected:
+            raise RuntimeError("Bitboard position does not match the board")
+
+    def make_move(self, cur_loc, tar_loc, promotion=None):
         """
-        Change the board to match a verified move
+        Change the board to match a verified move. An undo record is pushed
+        so the move can be reverted with unmake_move
         :param cur_loc: Location of piece to be moved on board
         :param tar_loc: Location of square piece is moving to
+        :param promotion: Name of the piece a pawn reaching the last row
+        transforms into, "Queen" if not given
         :return: None
         """
         # Move pieces on board
         cur_piece = self.get_board_loc(cur_loc)
+        changed_locs = [cur_loc, tar_loc]
+        moved_pieces = [cur_piece]
+
+        undo = MoveRecord(cur_piece, cur_loc, tar_loc, self._en_passant,
+                          self._castle, cur_piece.has_moved(),
+                          self.get_en_passant_state(), changed_locs,
+                          moved_pieces)
 
         # Special moving sequence for en passant
         if self._en_passant is True:
             self._en_passant = False
             cap_loc = cur_piece.get_en_passant_moves()["Capture"]
             tar_piece = self.get_board_loc(cap_loc)
+            changed_locs.append(cap_loc)
         else:
             cap_loc = tar_loc
             tar_piece = self.get_board_loc(cap_loc)
 
         if self._castle is True:
-            self.castle_move(tar_loc)
+            rook = self._game_board[CASTLE_ROOK_SQUARES[tar_loc][0]]
+            undo.rook_has_moved = rook.has_moved()
+            rook, rook_loc, rook_move = self.castle_move(tar_loc)
+            changed_locs += [rook_loc, rook_move]
+            moved_pieces.append(rook)
+            undo.rook = (rook, rook_loc, rook_move)
 
         # Remove captured piece from opposing players roster
         if tar_piece is not None:
+            undo.captured = tar_piece
+            undo.capture_loc = cap_loc
             self.remove_captured_piece(cap_loc)
 
         # Move piece to new location
         self.move_board_piece(cur_loc, tar_loc)
 
+        promotion_type = 0
+        if self.is_promotion(cur_piece, tar_loc):
+            if promotion is None:
+                promotion = "Queen"
+            new_piece = self._rules.pawn_transform(cur_piece, promotion)
+            self.get_piece_owner(cur_piece).replace_piece(cur_piece, new_piece)
+            self.set_board_loc(tar_loc, new_piece)
+            moved_pieces[0] = new_piece
+            undo.promoted = new_piece
+            promotion_type = PIECE_NAMES.index(promotion)
+
         # Must be reset every turn
         self.reset_en_passant()
 
         self._rules.en_passant(cur_piece, cur_loc, tar_loc, self)
 
+        self._undo_stack.append(undo)
+        self._position.make_move(encode_move(cur_loc, tar_loc,
+                                             promotion_type))
+
         # reset board after moved piece
-        self.set_all_possible_moves()
+        if self._incremental:
+            self.update_changed_squares(changed_locs, moved_pieces)
+        else:
+            self.set_all_possible_moves()
+
+    def unmake_move(self):
+        """
+        Revert the last move made with make_move, restoring the captured
+        piece, en passant state, castle flags and has moved bits
+        :return: None
+        """
+        undo = self._undo_stack.pop()
+        cur_piece = undo.piece
+        cur_loc = undo.from_loc
+        tar_loc = undo.to_loc
+
+        new_piece = undo.promoted
+        if new_piece is not None:
+            self.get_piece_owner(cur_piece).replace_piece(new_piece, cur_piece)
+
+        # Move piece back to its starting location
+        self.set_board_loc(tar_loc, None)
+        self.set_board_loc(cur_loc, cur_piece)
+        cur_piece.set_location(cur_loc)
+        cur_piece.set_has_moved(undo.has_moved)
+
+        if undo.rook is not None:
+            rook, rook_loc, rook_move = undo.rook
+            self.set_board_loc(rook_move, None)
+            self.set_board_loc(rook_loc, rook)
+            rook.set_location(rook_loc)
+            rook.set_has_moved(undo.rook_has_moved)
+
+        # Return captured piece to the board and its owners roster
+        moved_pieces = list(undo.moved) + [cur_piece]
+        captured = undo.captured
+        if captured is not None:
+            self.set_board_loc(undo.capture_loc, captured)
+            self.get_piece_owner(captured).restore_piece(captured)
+            moved_pieces.append(captured)
+
+        self._en_passant = undo.en_passant
+        self._castle = undo.castle
+        self.set_en_passant_state(undo.pawn_en_passant)
+        self._position.unmake_move()
+
+        if self._incremental:
+            self.update_changed_squares(undo.changed, moved_pieces)
+        else:
+            self.set_all_possible_moves()
+
+    def is_promotion(self, piece, tar_loc):
+        """
+        Pawn reaching the far row; white pawns move towards rank 8
+        :param piece: moving piece
+        :param tar_loc: target location
+        :return: True if the pawn transforms
+        """
+        if piece.get_name() != "Pawn":
+            return False
+        return tar_loc >> 3 == (7 if piece.get_color() == "W" else 0)
+
+    def get_undo_depth(self):
+        return len(self._undo_stack)
+
+    def get_piece_owner(self, piece):
+        if piece.get_player() == 1:
+            return self._p1
+        else:
+            return self._p2
+
+    def set_board_loc(self, loc, piece):
+        self._game_board[loc] = piece
+
+    def get_en_passant_state(self):
+        """
+        Collect the pawns that can currently capture en passant
+        :return: list of (pawn, capture location, move location)
+        """
+        state = []
+        for piece in self._game_board:
+            if piece is not None and piece.get_name() == "Pawn" and \
+                    piece.available_en_passant():
+                locs = piece.get_en_passant_moves()
+                state.append((piece, locs["Capture"], locs["Move"]))
+        return state
+
+    def set_en_passant_state(self, state):
+        """
+        Restore en passant state collected by get_en_passant_state
+        :param state: list of (pawn, capture location, move location)
+        :return: None
+        """
+        for piece in self._game_board:
+            if piece is not None and piece.get_name() == "Pawn":
+                piece.clear_en_passant()
+
+        for pawn, capture_loc, move_loc in state:
+            pawn.set_en_passant(capture_loc, move_loc)
 
     def reset_en_passant(self):
         # Reset en passant
         self._en_passant = False
 
-        for row in self._game_board:
-            for piece in row:
-                if piece is not None and piece.get_name() == "Pawn":
-                    piece.clear_en_passant()
+        for piece in self._game_board:
+            if piece is not None and piece.get_name() == "Pawn":
+                piece.clear_en_passant()
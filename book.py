@@ -0,0 +1,253 @@
+from bitboard import move_name, move_from_name
+import pgn
+import argparse
+import mmap
+import os
+import struct
+import time
+
+###########################################################
+# Opening book
+#
+# Binary book of (position hash, move, weight) records sorted by hash.
+# The file is memory mapped and searched in place with a binary search,
+# so opening a book parses nothing but the header and every process
+# using the same book shares its pages through the page cache. Books
+# are compiled from PGN games; the weight of a move is the number of
+# games that played it, capped at 65535.
+#
+# Layout, little endian:
+#   header  8 byte magic, 8 byte record count
+#   record  8 byte Zobrist hash, 2 byte encoded move, 2 byte weight
+#
+###########################################################
+
+BOOK_MAGIC = b"CHSBOOK1"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<QHH")
+MAX_WEIGHT = 0xFFFF
+
+
+class BookError(Exception):
+    """
+    File that is not a valid opening book
+    """
+
+
+def write_book(weights, path):
+    """
+    Write book records sorted by hash, heaviest move first
+    :param weights: dict of (hash, encoded move) to weight
+    :param path: book file
+    :return: number of records
+    """
+    records = sorted(weights.items(), key=lambda item: (item[0][0],
+                                                        -item[1]))
+    with open(path, "wb") as book_file:
+        book_file.write(HEADER.pack(BOOK_MAGIC, len(records)))
+        for (key, move), weight in records:
+            book_file.write(RECORD.pack(key, move, min(weight, MAX_WEIGHT)))
+    return len(records)
+
+
+def collect_weights(lines, max_plies=20, weights=None):
+    """
+    Count how often each move is played in each position of the PGN
+    games, up to max_plies into every game
+    :param lines: iterable of PGN lines
+    :param weights: dict to add to, example from an earlier call
+    :return: (dict of (hash, encoded move) to weight, games, errors)
+    """
+    if weights is None:
+        weights = dict()
+    games = errors = 0
+
+    for headers, movetext in pgn.read_games(lines):
+        games += 1
+        try:
+            game = pgn.new_game(headers)
+            san_moves = pgn.parse_movetext(movetext)[0]
+            for san in san_moves[:max_plies]:
+                move = pgn.san_to_move(game, san)
+                if not game.validate_move(move):
+                    raise pgn.PgnError("Rules engine rejected " + san)
+                entry = (game.get_hash(), move_from_name(move))
+                weights[entry] = weights.get(entry, 0) + 1
+                game.make_move(move)
+                game.set_player_turn()
+        except (pgn.PgnError, ValueError):
+            # Moves before the error are kept
+            errors += 1
+
+    return weights, games, errors
+
+
+def build_book(lines, path, max_plies=20):
+    """
+    Compile a book from PGN games
+    :param lines: iterable of PGN lines
+    :param path: book file to write
+    :param max_plies: plies of every game added to the book
+    :return: dict with games, errors and records
+    """
+    weights, games, errors = collect_weights(lines, max_plies)
+    records = write_book(weights, path)
+    return {"games": games, "errors": errors, "records": records}
+
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Map a book file; only the header is read
+        :param path: book file
+        """
+        self._map = None
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise BookError("Book file too short: " + path)
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, self._count = HEADER.unpack_from(self._map, 0)
+        if magic != BOOK_MAGIC or \
+                size != HEADER.size + self._count * RECORD.size:
+            self.close()
+            raise BookError("Not an opening book: " + path)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def get_record(self, index):
+        """
+        :return: (hash, encoded move, weight) of the record at an index
+        """
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def find(self, key):
+        """
+        Binary search for the first record of a hash
+        :param key: 64 bit position hash
+        :return: index of the first record with a hash not below key
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, key):
+        """
+        :param key: 64 bit position hash
+        :return: list of (move, weight), heaviest first; moves in the
+        format "e2 e4"
+        """
+        moves = []
+        index = self.find(key)
+        while index < self._count:
+            record_key, move, weight = self.get_record(index)
+            if record_key != key:
+                break
+            moves.append((move_name(move), weight))
+            index += 1
+        return moves
+
+    def get_move(self, game, rng=None):
+        """
+        Book move for the player to move in a game
+        :param game: Chess game
+        :param rng: random.Random picking moves in proportion to their
+        weight; the heaviest move is played when None
+        :return: move in the format "e2 e4", or None when out of book
+        """
+        legal_moves = game.get_legal_moves(game.get_turn())
+
+        # A hash collision could suggest a move of another position
+        moves = [(move, weight) for move, weight in
+                 self.lookup(game.get_hash()) if move in legal_moves]
+        if not moves:
+            return None
+        if rng is None:
+            return moves[0][0]
+
+        pick = rng.uniform(0, sum(weight for move, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick <= 0:
+                return move
+        return moves[-1][0]
+
+
+def run_probe(path, moves=None, lookups=10000, out=print):
+    """
+    Report the book moves after a sequence of moves and the lookup time
+    :param moves: list of moves in the format "e2 e4" from the start
+    :return: dict with moves, a list of (move, weight), and
+    microseconds per lookup
+    """
+    from perft import new_game
+    game = new_game(moves)
+    key = game.get_hash()
+
+    with OpeningBook(path) as book:
+        start = time.perf_counter()
+        for lookup in range(lookups):
+            book.lookup(key)
+        micros = (time.perf_counter() - start) / lookups * 1e6
+        book_moves = book.lookup(key)
+        out("Records {} lookup {:.2f}us".format(len(book), micros))
+
+    for move, weight in book_moves:
+        out("{} {}".format(move, weight))
+    return {"moves": book_moves, "micros": micros}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Opening book tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="compile a book from PGN")
+    build.add_argument("pgn", help="PGN file, optionally gzip compressed")
+    build.add_argument("book", help="book file to write")
+    build.add_argument("--plies", type=int, default=20,
+                       help="plies of every game added to the book")
+
+    probe = commands.add_parser("probe", help="book moves of a position")
+    probe.add_argument("book", help="book file")
+    probe.add_argument("moves", nargs="*",
+                       help='moves from the start, example "e2 e4"')
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        with pgn.open_pgn(args.pgn) as lines:
+            result = build_book(lines, args.book, args.plies)
+        print("Games {} errors {} records {} time {:.3f}s".format(
+            result["games"], result["errors"], result["records"],
+            time.perf_counter() - start))
+    else:
+        run_probe(args.book, args.moves)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
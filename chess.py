@@ -1,5 +1,12 @@
 from board import GameBoard
 from rules import ChessRules
+from player import Player
+from bitboard import SQUARE_INDEX, SQUARE_NAMES
+import instrument
+
+# Promotion suffix letters, example "e7 e8q"
+PROMOTION_NAMES = {"q": "Queen", "r": "Rook", "b": "Bishop", "n": "Knight"}
+PROMOTION_LETTERS = {name: letter for letter, name in PROMOTION_NAMES.items()}
 
 
 class Chess:
@@ -20,8 +27,63 @@ class Chess:
 
         self._rules = ChessRules()
 
+        # Undo records for the check status changed by make_move
+        self._undo_stack = []
+
+        # Number of times each position key has occurred
+        self._position_counts = {self._board.get_hash(): 1}
+
+        # Legal moves of one player in one position, kept until either the
+        # position or the player changes
+        self._legal_key = None
+        self._legal_moves = None
+
+    @classmethod
+    def from_fen(cls, fen, p1=None, p2=None):
+        """
+        Create a game from Forsyth-Edwards Notation
+        :param fen: FEN string
+        :param p1: Player 1, defaults to a white Player
+        :param p2: Player 2, defaults to a black Player
+        :return: Chess
+        """
+        if p1 is None:
+            p1 = Player(1, "W")
+        if p2 is None:
+            p2 = Player(2, "B" if p1.get_color() == "W" else "W")
+        game = cls(p1, p2)
+        game.load_fen(fen)
+        return game
+
+    def load_fen(self, fen):
+        """
+        Replace the game position, resetting the game status and history
+        :param fen: FEN string
+        :return: None
+        """
+        self._board.load_fen(fen)
+        side = "W" if self._board.get_position().get_side() == 0 else "B"
+        self._player_turn = 1 if self._p1_color == side else 2
+        self._game_status = "INCOMPLETE"
+        self._undo_stack = []
+        self._position_counts = {self._board.get_hash(): 1}
+        self._p1.set_in_check(False)
+        self._p2.set_in_check(False)
+
+        # Status of the player to move
+        self.set_player_turn()
+        self.king_check_status()
+        self.set_player_turn()
+
+    def to_fen(self):
+        return self._board.to_fen()
+
     def get_board_location(self, loc):
-        return self._board.get_board_loc(loc)
+        """
+        :param loc: Chess coordinate location, example "a1"
+        :return: Piece if piece at given location, otherwise None
+        """
+        return self._board.get_board_loc(SQUARE_INDEX[loc])
 
     def get_turn(self):
         return self._player_turn
@@ -35,6 +97,21 @@ class Chess:
     def get_board(self):
         return self._board.get_board()
 
+    def get_game_board(self):
+        return self._board
+
+    def get_position(self):
+        return self._board.get_position()
+
+    def get_hash(self):
+        return self._board.get_hash()
+
+    def get_position_counts(self):
+        return self._position_counts
+
+    def get_repetition_count(self):
+        return self._position_counts.get(self._board.get_hash(), 0)
+
     def get_player(self, player):
         if player == 1:
             return self._p1
@@ -50,6 +127,15 @@ class Chess:
     def get_game_status(self):
         return self._game_status
 
+    def stats(self):
+        """
+        Call counts and timings of the instrumented rules engine methods,
+        counted over every game in the process while instrumentation is
+        switched on with instrument.enable
+        :return: dict, see instrument.stats; instrument.to_json exports it
+        """
+        return instrument.stats()
+
     def king_check_status(self):
         # CHECK
         if self._player_turn == 1:
@@ -59,15 +145,64 @@ class Chess:
             atk_player = self._p2
             def_player = self._p1
 
-        status = self._rules.check(atk_player, def_player)
+        legal_moves = self.get_legal_moves(def_player.get_turn())
+        status = self._rules.check(atk_player, def_player, self._board,
+                                   legal_moves)
         if status == "CHECK":
             def_player.set_in_check(status)
         elif status == "CHECKMATE":
             def_player.set_in_check(status)
             self._game_status = "Player " + str(atk_player.get_turn()) + " Wins"
+        elif status == "STALEMATE":
+            def_player.set_in_check(False)
+            self._game_status = "Draw"
         else:
             def_player.set_in_check(False)
 
+    def is_square_attacked(self, loc, player):
+        """
+        :param loc: Chess coordinate location, example "e4"
+        :param player: player number of the attacking player
+        :return: True if a piece of the player attacks the square
+        """
+        return self._board.is_square_attacked(SQUARE_INDEX[loc], player)
+
+    def get_legal_moves(self, player_turn):
+        """
+        Legal moves of a player in the current position, generated once and
+        reused until the position changes
+        :param player_turn: player number
+        :return: dict of move, example "e7 e8q", to "En Passant", "Castle"
+        or None
+        """
+        key = (player_turn, self._board.get_hash())
+        if key != self._legal_key:
+            player = self.get_player(player_turn)
+            opponent = self.get_player(2 if player_turn == 1 else 1)
+            legal_moves = dict()
+            for cur_loc, tar_loc, promotion, special in \
+                    self._rules.legal_moves(player, opponent, self._board):
+                move = SQUARE_NAMES[cur_loc] + " " + SQUARE_NAMES[tar_loc]
+                if promotion is not None:
+                    move += PROMOTION_LETTERS[promotion]
+                legal_moves[move] = special
+            self._legal_key = key
+            self._legal_moves = legal_moves
+        return self._legal_moves
+
+    def legal_moves(self):
+        """
+        :return: list of the legal moves of the player to move, in the
+        format "e2 e4" with a suffix for each promotion piece, "e7 e8q"
+        """
+        return list(self.get_legal_moves(self._player_turn))
+
+    def legal_move_count(self):
+        """
+        :return: number of legal moves of the player to move
+        """
+        return len(self.get_legal_moves(self._player_turn))
+
     def game_incomplete(self):
         return self._game_status == "INCOMPLETE"
 
@@ -81,64 +216,68 @@ class Chess:
         return self._player_turn
 
     def get_board_piece(self, location):
-        return self._board.get_board_loc(location)
+        return self._board.get_board_loc(SQUARE_INDEX[location])
 
     def make_move(self, move):
-        current_loc = move[:2]
-        target_loc = move[-2:]
-        self._board.make_move(current_loc, target_loc)
+        current_loc = SQUARE_INDEX[move[:2]]
+        target_loc = SQUARE_INDEX[move[3:5]]
+        promotion = PROMOTION_NAMES.get(move[5:])
+        self._undo_stack.append((self._p1.get_in_check(),
+                                 self._p2.get_in_check(),
+                                 self._game_status))
+        self._board.make_move(current_loc, target_loc, promotion)
         self.king_check_status()
 
-    def validate_en_passant(self, pawn, target_piece, target_loc):
-        if pawn.available_en_passant:
-            move_list = pawn.get_en_passant_moves()
-            if target_loc == move_list["Move"]:
-
-                if target_piece is not None:
-                    return False
-                else:
-                    self._board.set_en_passant(True)
-                    return True
-        return False
+        key = self._board.get_hash()
+        self._position_counts[key] = self._position_counts.get(key, 0) + 1
+        if self.game_incomplete() and \
+                self._rules.threefold_repetition(self._position_counts[key]):
+            self._game_status = "Draw"
+
+    def unmake_move(self):
+        """
+        Revert the last move made with make_move. The player turn is not
+        changed by make_move and is therefore left as is
+        :return: None
+        """
+        p1_in_check, p2_in_check, game_status = self._undo_stack.pop()
+
+        key = self._board.get_hash()
+        self._position_counts[key] -= 1
+        if self._position_counts[key] == 0:
+            del self._position_counts[key]
+
+        self._board.unmake_move()
+        self._p1.set_in_check(p1_in_check)
+        self._p2.set_in_check(p2_in_check)
+        self._game_status = game_status
 
     def validate_move(self, move):
-        current_loc = move[:2]
-        target_loc = move[-2:]
-
-        cur_piece = self._board.get_board_loc(current_loc)
-        target_piece = self._board.get_board_loc(target_loc)
-
-        # Selected empty board location for start
-        if cur_piece is None:
-            return False
-
-        # Not players turn
-        if cur_piece.get_player() != self._player_turn:  # Not player turn
-            return False
-
-        # En passant
-        if cur_piece.get_name() == "Pawn":
-            if self.validate_en_passant(cur_piece, target_piece, target_loc):
-                return True
-
-        if cur_piece.get_name() == "King":
-            opp_roster = self.get_opponent().get_roster()
-
-            if self._rules.self_into_check(target_loc, opp_roster):
+        """
+        Look the move up in the legal moves of the player to move and flag
+        castling and en passant for make_move
+        :param move: move in the format "e2 e4", with a promotion suffix
+        such as "e7 e8q"; a promotion without suffix becomes a queen
+        :return: True if the move is legal
+        """
+        # Special move flags are only kept for the move validated last
+        self._board.set_en_passant(False)
+        self._board.set_castle(False)
+
+        legal_moves = self.get_legal_moves(self._player_turn)
+        if move not in legal_moves:
+            move += "q"
+            if move not in legal_moves:
                 return False
 
-            if self._rules.castle(current_loc, target_loc, self._board):
-                self._board.set_castle(True)
-                return True
+        special = legal_moves[move]
+        if special == "En Passant":
+            self._board.set_en_passant(True)
+        elif special == "Castle":
+            self._board.set_castle(True)
 
-        move_list = cur_piece.get_possible_moves()
-
-        # Move location is not in piece's move set
-        if target_loc not in move_list:
-            return False
+        return True
 
-        current_player = self.get_player(self._player_turn)
-        if self._rules.still_in_check(move, self) is False:
-            return False
 
-        return True
+instrument.register("Chess.make_move", [Chess])
+instrument.register("Chess.validate_move", [Chess])
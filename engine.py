@@ -0,0 +1,393 @@
+from bitboard import *
+from transposition import EXACT, LOWER, UPPER
+import time
+
+###########################################################
+# Engine
+#
+# Negamax alpha-beta search with iterative deepening over the bitboard
+# backend. Scores are in centipawns from the point of view of the side
+# to move.
+#
+###########################################################
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+
+# Piece square bonuses for white, from a1 to h8; black uses the mirror
+PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    0, 0, 0, 0, 0, 0, 0, 0]
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+ROOK_TABLE = [
+    0, 0, 0, 5, 5, 0, 0, 0,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0]
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20]
+KING_TABLE = [
+    20, 30, 10, 0, 0, 10, 30, 20,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30]
+
+# Combined value of a piece code (color * 6 + piece type) on each square,
+# positive for white
+PIECE_SQUARE_VALUES = []
+for _color in WHITE, BLACK:
+    for _piece_type, _table in enumerate([PAWN_TABLE, KNIGHT_TABLE,
+                                          BISHOP_TABLE, ROOK_TABLE,
+                                          QUEEN_TABLE, KING_TABLE]):
+        _values = []
+        for _square in range(64):
+            if _color == WHITE:
+                _values.append(PIECE_VALUES[_piece_type] + _table[_square])
+            else:
+                _values.append(-PIECE_VALUES[_piece_type] -
+                               _table[_square ^ 56])
+        PIECE_SQUARE_VALUES.append(_values)
+
+# Nodes searched between time checks
+CHECK_INTERVAL = 1024
+
+# Scores beyond this are mate scores, stored relative to the node
+MATE_BOUND = MATE_SCORE - 1000
+
+
+class SearchStopped(Exception):
+    """
+    Raised inside the search when the time or node budget runs out
+    """
+
+
+def score_to_table(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def evaluate(position):
+    """
+    Material and piece square evaluation
+    :param position: Bitboard
+    :return: score for the side to move
+    """
+    score = 0
+    for square, code in enumerate(position.get_placement()):
+        if code != EMPTY:
+            score += PIECE_SQUARE_VALUES[code][square]
+    return score if position.get_side() == WHITE else -score
+
+
+class Search:
+    def __init__(self, position, time_limit=None, node_limit=None,
+                 max_depth=64, history=None, table=None, root_moves=None,
+                 stop=None, progress=None):
+        """
+        :param position: Bitboard to search, searched in place and left
+        unchanged unless the search is stopped
+        :param time_limit: seconds per search or None
+        :param node_limit: nodes per search or None
+        :param max_depth: deepest iteration
+        :param history: keys of positions already played in the game
+        :param table: TranspositionTable shared between searches or None
+        :param root_moves: encoded root moves to search, defaults to every
+        legal move
+        :param stop: callable returning True to stop the search, checked
+        with the limits
+        :param progress: callable taking the nodes searched and the seconds
+        elapsed, called with the limit checks
+        """
+        self._position = position
+        self._table = table
+        self._root_moves = root_moves
+        self._time_limit = time_limit
+        self._node_limit = node_limit
+        self._max_depth = max_depth
+        self._stop = stop
+        self._progress = progress
+        self._start = None
+        self._history = set(history or ())
+        self._path = []
+        self._nodes = 0
+        self._deadline = None
+        self._info = dict()
+        self._iterations = []
+
+    def get_info(self):
+        return self._info
+
+    def get_nodes(self):
+        return self._nodes
+
+    def search(self):
+        """
+        Iterative deepening search
+        :return: best encoded move, or None when there are no legal moves
+        """
+        start = time.perf_counter()
+        self._start = start
+        if self._time_limit is not None:
+            self._deadline = start + self._time_limit
+        self._nodes = 0
+
+        if self._root_moves is None:
+            root_moves = self._position.legal_moves()
+            root_subset = False
+        else:
+            root_moves = list(self._root_moves)
+            root_subset = True
+        best_move = root_moves[0] if root_moves else None
+        best_score = 0
+        depth_reached = 0
+        self._iterations = []
+
+        if len(root_moves) > 1 or (root_subset and root_moves):
+            for depth in range(1, self._max_depth + 1):
+                try:
+                    score, move = self.search_root(root_moves, depth)
+                except SearchStopped:
+                    break
+                best_score, best_move, depth_reached = score, move, depth
+                self._iterations.append((depth, score, move))
+                # Search the best move first in the next iteration
+                root_moves.remove(move)
+                root_moves.insert(0, move)
+                if abs(score) >= MATE_SCORE - self._max_depth:
+                    break
+
+        seconds = time.perf_counter() - start
+        self._info = {
+            "depth": depth_reached,
+            "nodes": self._nodes,
+            "seconds": seconds,
+            "nps": self._nodes / seconds if seconds > 0 else 0.0,
+            "score": best_score,
+            "move": move_name(best_move) if best_move is not None else None,
+            "iterations": self._iterations
+        }
+        if self._table is not None:
+            self._info["table"] = self._table.get_stats()
+        return best_move
+
+    def search_root(self, root_moves, depth):
+        alpha, beta = -INFINITY, INFINITY
+        best_move = root_moves[0]
+        for move in root_moves:
+            self._position.make_move(move)
+            self._path.append(self._position.get_hash())
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, 1)
+            finally:
+                self._path.pop()
+                self._position.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+
+        if self._table is not None:
+            self._table.store(self._position.get_hash(), depth,
+                              score_to_table(alpha, 0), EXACT, best_move)
+        return alpha, best_move
+
+    def count_node(self):
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0:
+            if self._node_limit is not None and \
+                    self._nodes >= self._node_limit:
+                raise SearchStopped()
+            if self._deadline is not None and \
+                    time.perf_counter() >= self._deadline:
+                raise SearchStopped()
+            if self._stop is not None and self._stop():
+                raise SearchStopped()
+            if self._progress is not None:
+                self._progress(self._nodes,
+                               time.perf_counter() - self._start)
+
+    def is_repetition(self):
+        key = self._position.get_hash()
+        return key in self._history or self._path.count(key) > 1
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.count_node()
+
+        if self.is_repetition():
+            return 0
+        if depth <= 0:
+            return self.quiescence(alpha, beta)
+
+        position = self._position
+        side = position.get_side()
+        key = position.get_hash()
+        table = self._table
+
+        table_move = 0
+        if table is not None:
+            entry = table.probe(key)
+            if entry is not None:
+                entry_depth, entry_score, bound, table_move = entry
+                if entry_depth >= depth:
+                    entry_score = score_from_table(entry_score, ply)
+                    if bound == EXACT:
+                        return entry_score
+                    if bound == LOWER and entry_score >= beta:
+                        return entry_score
+                    if bound == UPPER and entry_score <= alpha:
+                        return entry_score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+
+        for move in self.order_moves(position.pseudo_legal_moves(),
+                                     table_move):
+            position.make_move(move)
+            if position.in_check(side):
+                position.unmake_move()
+                continue
+            self._path.append(position.get_hash())
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                self._path.pop()
+                position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_move == 0:
+            if position.in_check(side):
+                return -MATE_SCORE + ply
+            return 0
+
+        if table is not None:
+            if best_score <= original_alpha:
+                bound = UPPER
+            elif best_score >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            table.store(key, depth, score_to_table(best_score, ply), bound,
+                        best_move)
+        return best_score
+
+    def quiescence(self, alpha, beta):
+        self.count_node()
+        position = self._position
+        stand_pat = evaluate(position)
+        if stand_pat >= beta:
+            return beta
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        side = position.get_side()
+        for move in self.order_moves(self.noisy_moves()):
+            position.make_move(move)
+            if position.in_check(side):
+                position.unmake_move()
+                continue
+            try:
+                score = -self.quiescence(-beta, -alpha)
+            finally:
+                position.unmake_move()
+
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def noisy_moves(self):
+        """
+        Captures and promotions for the quiescence search
+        """
+        position = self._position
+        enemy = position.get_occupied(position.get_side() ^ 1)
+        ep_square = position.get_ep_square()
+        noisy = []
+        for move in position.pseudo_legal_moves():
+            to_sq = (move >> 6) & 63
+            if (enemy >> to_sq) & 1 or move >> 12 or (
+                    to_sq == ep_square and
+                    position.get_piece(move & 63)[1] == PAWN):
+                noisy.append(move)
+        return noisy
+
+    def order_moves(self, moves, first_move=0):
+        """
+        Most valuable victim / least valuable attacker ordering
+        :param first_move: move searched first, such as the best move
+        stored in the transposition table
+        """
+        board = self._position.get_placement()
+
+        def order_key(move):
+            if move == first_move:
+                return -INFINITY
+            victim = board[(move >> 6) & 63]
+            score = 0
+            if victim != EMPTY:
+                score = 10 * PIECE_VALUES[victim % 6] - \
+                    PIECE_VALUES[board[move & 63] % 6] // 10 + 10000
+            if move >> 12:
+                score += PIECE_VALUES[move >> 12]
+            return -score
+
+        return sorted(moves, key=order_key)
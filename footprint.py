@@ -0,0 +1,75 @@
+from perft import new_game
+import argparse
+import gc
+import tracemalloc
+
+###########################################################
+# Memory footprint
+#
+# Measures the memory held by live Chess games, which limits how many
+# games one process can keep. A batch of games is created and replayed
+# while tracemalloc traces allocations, and the memory still held
+# afterwards is divided by the number of games.
+#
+###########################################################
+
+# Ruy Lopez, closed variation
+SAMPLE_MOVES = ["e2 e4", "e7 e5", "g1 f3", "b8 c6", "f1 b5", "a7 a6",
+                "b5 a4", "g8 f6", "e1 g1", "f8 e7", "f1 e1", "b7 b5",
+                "a4 b3", "d7 d6", "c2 c3", "e8 g8", "h2 h3", "c6 b8",
+                "d2 d4", "b8 d7"]
+
+
+def bytes_per_game(games=100, moves=None):
+    """
+    Average memory held per live game
+    :param games: number of games kept alive at once
+    :param moves: moves replayed in every game, defaults to SAMPLE_MOVES
+    :return: bytes per game
+    """
+    if moves is None:
+        moves = SAMPLE_MOVES
+
+    # Build one game first so module level tables are not counted
+    new_game(moves)
+    gc.collect()
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    held = [new_game(moves) for game in range(games)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+
+    if not tracing:
+        tracemalloc.stop()
+    del held
+    return (after - before) / games
+
+
+def run_footprint(games=100, out=print):
+    """
+    Report bytes per game at the start position and after SAMPLE_MOVES
+    :return: dict of plies to bytes per game
+    """
+    results = dict()
+    for moves in [], SAMPLE_MOVES:
+        size = bytes_per_game(games, moves)
+        results[len(moves)] = size
+        out("Plies {} bytes/game {:.0f}".format(len(moves), size))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory held per game")
+    parser.add_argument("--games", type=int, default=100,
+                        help="number of live games to measure")
+    args = parser.parse_args(argv)
+    run_footprint(args.games)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
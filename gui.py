@@ -6,9 +6,131 @@ from pygame.locals import *
 # Required for Chess
 from chess import Chess
 from player import *
+from bitboard import Bitboard, SQUARE_NAMES, SQUARE_INDEX
+from background import BackgroundEngine, BOT_TYPES
 
 # Other imports
+import argparse
 import os
+import time
+
+
+def resolve_asset(path):
+    """
+    Find an asset whose file name differs only in case, so names written
+    on case insensitive file systems load everywhere
+    :param path: asset path, example "Assets/W_Pawn.PNG"
+    :return: path of the existing file, or the path unchanged
+    """
+    if os.path.exists(path):
+        return path
+    directory, name = os.path.split(path)
+    for entry in os.listdir(directory or "."):
+        if entry.lower() == name.lower():
+            return os.path.join(directory, entry)
+    return path
+
+
+class SpriteCache:
+    def __init__(self, tile_size, capture_size=30):
+        """
+        Piece images decoded once and kept scaled to the board tile size and
+        to the captured piece size. The tile images are rebuilt only when
+        the tile size changes
+        :param tile_size: width of a board square in pixels
+        :param capture_size: width of a captured piece in pixels
+        """
+        self._tile_size = tile_size
+        self._capture_size = capture_size
+        self._images = dict()
+        self._tile_images = dict()
+        self._capture_images = dict()
+        self._load_count = 0
+
+    def get_tile_size(self):
+        return self._tile_size
+
+    def set_tile_size(self, tile_size):
+        if tile_size != self._tile_size:
+            self._tile_size = tile_size
+            self._tile_images.clear()
+
+    def get_load_count(self):
+        """
+        :return: number of image files decoded
+        """
+        return self._load_count
+
+    def get_image(self, path):
+        """
+        :param path: image file path
+        :return: decoded image, converted to the display format once a
+        display exists
+        """
+        image = self._images.get(path)
+        if image is None:
+            image = pg.image.load(resolve_asset(path))
+            if pg.display.get_surface() is not None:
+                image = image.convert_alpha()
+            self._images[path] = image
+            self._load_count += 1
+        return image
+
+    def scaled_image(self, images, path, size):
+        image = images.get(path)
+        if image is None:
+            image = pg.transform.scale(self.get_image(path), (size, size))
+            images[path] = image
+        return image
+
+    def get_tile_image(self, path):
+        return self.scaled_image(self._tile_images, path, self._tile_size)
+
+    def get_capture_image(self, path):
+        return self.scaled_image(self._capture_images, path,
+                                 self._capture_size)
+
+
+class TextCache:
+    def __init__(self):
+        """
+        Fonts looked up once per name and size, and rendered text kept per
+        font, text and color, so drawing a label is a dictionary lookup
+        """
+        self._fonts = dict()
+        self._texts = dict()
+        self._lookup_count = 0
+        self._render_count = 0
+
+    def get_counts(self):
+        """
+        :return: dict of font lookups and text renders done
+        """
+        return {"fonts": self._lookup_count, "renders": self._render_count}
+
+    def get_font(self, name, size):
+        font = self._fonts.get((name, size))
+        if font is None:
+            font = pg.font.SysFont(name, size)
+            self._fonts[(name, size)] = font
+            self._lookup_count += 1
+        return font
+
+    def render(self, name, size, text, color):
+        """
+        :param name: font name
+        :param size: font size
+        :param text: text to render
+        :param color: color name or RGB tuple
+        :return: Surface of the text
+        """
+        key = (name, size, text, color)
+        surface = self._texts.get(key)
+        if surface is None:
+            surface = self.get_font(name, size).render(text, False, color)
+            self._texts[key] = surface
+            self._render_count += 1
+        return surface
 
 
 class ChessInterface:
@@ -21,7 +143,9 @@ class ChessInterface:
         self._win_height = 600
         self._win = pg.display.set_mode((self._win_width, self._win_height))
         self._fps = 60
-        self._font = pg.font.SysFont("Comic Sans MS", 30)
+        self._text = TextCache()
+        self._font_size = 30
+        self._font = self._text.get_font("Comic Sans MS", self._font_size)
 
         # Colors
         self._color_main_bg = (211, 211, 211)
@@ -32,6 +156,7 @@ class ChessInterface:
         self._color_inactive_text = "black"
         self._color_active_button = "yellow"
         self._color_inactive_button = "white"
+        self._color_move_hint = (90, 90, 90)
         self._font_type = "Comic Sans MS"
 
         # Images
@@ -45,14 +170,77 @@ class ChessInterface:
         self._tile_size = int(self._board_size / 8)
         self._board_origin = ((self._win_width - self._board_size)/2-(self._win_width-self._win_height)/2, (self._win_height-self._board_size)/2)
         self._colors = None
-        self._cols = None
-        self._rows = None
-        self._piece_images = dict()
+        self._flipped = False
+        self._sprites = SpriteCache(self._tile_size)
+
+        # Game screen frames: mouse position from the last mouse event,
+        # frame counters and an optional callback run once per frame
+        self._mouse_pos = (0, 0)
+        self._frame_stats = None
+        self._frame_hook = None
+
+        # Side panel, recomposed when the captured pieces or check change
+        self._panel = None
+        self._panel_key = None
+
+        # Computer opponent: a BackgroundEngine playing one player number
+        self._engine = None
+        self._computer_player = None
+        self._thinking_text = None
+        self._placement = None
         self._chess = None
         self._display_board = None
         self._p1 = None
         self._p2 = None
 
+    def get_sprite_cache(self):
+        return self._sprites
+
+    def get_text_cache(self):
+        return self._text
+
+    def get_panel_surface(self):
+        return self._panel
+
+    def set_computer(self, engine, player=2):
+        """
+        Let a computer play one side of the game
+        :param engine: BackgroundEngine, or None for two human players
+        :param player: player number the computer plays
+        """
+        self._engine = engine
+        self._computer_player = player
+
+    def set_colors(self, colors):
+        """
+        :param colors: player 1 and player 2 colors, example ("W", "B")
+        """
+        self._colors = colors
+
+    def set_fps(self, fps):
+        self._fps = fps
+
+    def set_frame_hook(self, hook):
+        """
+        :param hook: called with the frame number at the start of every
+        game screen frame, or None
+        """
+        self._frame_hook = hook
+
+    def get_frame_stats(self):
+        """
+        Counters of the last game screen: frames run, frames redrawn,
+        frames per second and process CPU time per frame
+        :return: dict
+        """
+        stats = dict(self._frame_stats)
+        frames = max(stats["frames"], 1)
+        stats["fps"] = stats["frames"] / max(stats["seconds"], 1e-9)
+        stats["cpu_ms_per_frame"] = stats["cpu_seconds"] * 1000 / frames
+        stats["cpu_percent"] = \
+            100 * stats["cpu_seconds"] / max(stats["seconds"], 1e-9)
+        return stats
+
     def load_images(self):
         scale = (100, 100)
         # Load piece images for color selection
@@ -64,7 +252,8 @@ class ChessInterface:
 
         # Load image for start background
         scale = (self._win_width, self._win_height)
-        bg = pg.image.load(os.path.join("Assets", "Start_Background.PNG"))
+        bg = pg.image.load(resolve_asset(
+            os.path.join("Assets", "Start_Background.PNG")))
         self._image_bg = pg.transform.scale(bg, scale)
 
 
@@ -91,10 +280,18 @@ class ChessInterface:
             else:
                 run = False
 
+        if self._engine is not None:
+            self._engine.close()
         pg.quit()
 
     def play_chess(self):
-
+        """
+        Game screen. Frames are capped at the frame rate and only the
+        rectangles that changed are drawn and pushed to the display: the
+        dragged piece, the selected square and its move hints, the squares
+        changed by a move and the side panel. Idle frames draw nothing
+        :return: True when the game ends, False when the window is closed
+        """
         # Initialize game
         self.initialize_game(self._colors[0], self._colors[1])
         run = True
@@ -103,43 +300,193 @@ class ChessInterface:
         # draw board
         self.initialize_board()
 
+        clock = pg.time.Clock()
+        self._placement = list(self._chess.get_board())
+        self._thinking_text = None
+        if self._engine is not None:
+            self._engine.cancel()
+        dirty = [self._win.get_rect()]
+        drag_rect = None
+        self._frame_stats = {"frames": 0, "redraws": 0, "seconds": 0.0,
+                             "cpu_seconds": 0.0}
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+
         while run:
-            self._win.fill(self._color_main_bg)
-            self.draw_board()
-            self.set_pieces(selected_piece)
-            self.player_display()
+            clock.tick(self._fps)
+            if self._frame_hook is not None:
+                self._frame_hook(self._frame_stats["frames"])
+
             for event in pg.event.get():
 
                 # User exits game by clicking X
                 if event.type == pg.QUIT:
+                    if self._engine is not None:
+                        self._engine.cancel()
                     return False
 
-                elif event.type == pg.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        loc = self.get_square_coordinate()
+                if hasattr(event, "pos"):
+                    self._mouse_pos = event.pos
+
+                if event.type == pg.MOUSEBUTTONDOWN:
+                    if event.button == 1 and not self.computer_to_move():
+                        loc = self.get_square_coordinate(event.pos)
                         if loc is not None:
                             selected_piece = self._chess.get_board_location(loc)
                             start_loc = loc
+                            if selected_piece is not None:
+                                dirty += self.hint_rects(start_loc)
 
                 elif event.type == pg.MOUSEBUTTONUP:
                     if event.button == 1:
+                        if selected_piece is not None:
+                            dirty += self.hint_rects(start_loc)
                         selected_piece = None
-                        end_loc = self.get_square_coordinate()
+                        end_loc = self.get_square_coordinate(event.pos)
                         if start_loc is not None and end_loc is not None:
                             move = start_loc + " " + end_loc
 
-                            valid_move = self._chess.validate_move(move)
-                            if valid_move:
-                                self._chess.make_move(move)
-                                self._chess.king_check_status()
-                                if self._chess.get_game_status() != "INCOMPLETE":
-                                    run = False
-                                self._chess.set_player_turn()
-
-            pg.display.update()
-
+                            changed = self.apply_move(move)
+                            if changed is not None:
+                                dirty += changed
+                                run = self._chess.game_incomplete()
+
+            # The computer moves once its worker is done
+            if self._engine is not None and run and self.computer_to_move():
+                if not self._engine.is_thinking():
+                    self._engine.think(self.computer_position(),
+                                       self._chess.get_position_counts())
+                move = self._engine.poll()
+                if move is not None:
+                    changed = self.apply_move(move)
+                    if changed is not None:
+                        dirty += changed
+                        run = self._chess.game_incomplete()
+                    else:
+                        # Move of a stale position, think again on this one
+                        self._engine.think(self.computer_position(),
+                                           self._chess.get_position_counts())
+
+            thinking_text = self.thinking_text()
+            if thinking_text != self._thinking_text:
+                self._thinking_text = thinking_text
+                dirty.append(self.panel_rect())
+
+            # The dragged piece leaves its last place and covers a new one
+            new_drag_rect = None
+            if selected_piece is not None:
+                new_drag_rect = self.drag_rect(selected_piece)
+            if new_drag_rect != drag_rect:
+                dirty += [rect for rect in (drag_rect, new_drag_rect)
+                          if rect is not None]
+                drag_rect = new_drag_rect
+
+            if dirty:
+                self.draw_frame(selected_piece, start_loc, dirty)
+                self._frame_stats["redraws"] += 1
+                dirty = []
+
+            self._frame_stats["frames"] += 1
+            self._frame_stats["seconds"] = time.perf_counter() - start_time
+            self._frame_stats["cpu_seconds"] = time.process_time() - start_cpu
+
+        if self._engine is not None:
+            self._engine.cancel()
         return True
 
+    def apply_move(self, move):
+        """
+        Play a move for the player to move
+        :param move: move in the format "e2 e4"
+        :return: list of Rects of the squares the move changed and the side
+        panel, or None if the move is not legal
+        """
+        if not self._chess.validate_move(move):
+            return None
+        self._chess.make_move(move)
+        self._chess.king_check_status()
+        self._chess.set_player_turn()
+
+        placement = list(self._chess.get_board())
+        changed = [self.square_rect(SQUARE_NAMES[square]) for square in range(64)
+                   if placement[square] is not self._placement[square]]
+        self._placement = placement
+        return changed + [self.panel_rect()]
+
+    def computer_to_move(self):
+        return self._engine is not None and \
+            self._chess.get_player_turn() == self._computer_player
+
+    def computer_position(self):
+        """
+        :return: Bitboard of the game position with the computer to move
+        """
+        color = self._chess.get_player(self._computer_player).get_color()
+        return Bitboard.from_game_board(self._chess.get_game_board(), color)
+
+    def thinking_text(self):
+        """
+        :return: thinking indicator of the side panel, or None
+        """
+        if self._engine is None or not self._engine.is_thinking():
+            return None
+        nps = self._engine.get_progress()["nps"]
+        if nps >= 1000:
+            return "Thinking {:.1f}k nps".format(nps / 1000)
+        return "Thinking..."
+
+    def draw_frame(self, selected_piece, start_loc, dirty):
+        """
+        Draw the game screen inside the dirty rectangles and push only those
+        to the display
+        :param selected_piece: piece being dragged or None
+        :param start_loc: Chess coordinate of the selected piece
+        :param dirty: list of pygame Rects
+        :return: None
+        """
+        self._win.set_clip(dirty[0].unionall(dirty[1:]))
+        self._win.fill(self._color_main_bg)
+        self.draw_board()
+        if selected_piece is not None:
+            self.draw_move_hints(start_loc)
+        self.set_pieces(selected_piece)
+        self.player_display()
+        self._win.set_clip(None)
+        pg.display.update(dirty)
+
+    def square_rect(self, loc):
+        """
+        :param loc: Chess coordinate location, example "e2"
+        :return: screen Rect of the square
+        """
+        x, y = self.convert_chess_cord(SQUARE_INDEX[loc])
+        return pg.Rect(self._board_origin[0] + x, self._board_origin[1] + y,
+                       self._tile_size, self._tile_size)
+
+    def hint_rects(self, start_loc):
+        """
+        :return: Rects of a square and the squares its piece can move to
+        """
+        return [self.square_rect(start_loc)] + \
+            [self.square_rect(move[3:5]) for move in self._chess.legal_moves()
+             if move[:2] == start_loc]
+
+    def drag_rect(self, selected_piece):
+        """
+        :return: Rect covered by the dragged piece, one pixel wider on each
+        side to cover rounding of the image position
+        """
+        image = self._sprites.get_tile_image(selected_piece.get_image_path())
+        rect = image.get_rect(center=self._mouse_pos)
+        return rect.inflate(2, 2)
+
+    def panel_rect(self):
+        """
+        :return: Rect of the side panel right of the board
+        """
+        left = int(self._board_origin[0] + self._board_size)
+        return pg.Rect(left, 0, self._win_width - left, self._win_height)
+
     def start_window(self):
         # Create window
         width = self._win_width
@@ -245,8 +592,8 @@ class ChessInterface:
         p1 = Player(1, p1_color)
         p2 = Player(2, p2_color)
         chess = Chess(p1, p2)
-        self._cols = chess.get_cols_and_rows()[0]
-        self._rows = chess.get_cols_and_rows()[1][::-1]
+        # Player 1 is drawn at the bottom of the screen
+        self._flipped = p1_color == "B"
         self._chess = chess
         self._p1 = p1
         self._p2 = p2
@@ -271,68 +618,144 @@ class ChessInterface:
     def draw_board(self):
         self._win.blit(self._display_board, self._board_origin)
 
+    def draw_move_hints(self, start_loc):
+        """
+        Mark the squares the selected piece can legally move to
+        :param start_loc: Chess coordinate of the selected piece, example "e2"
+        :return: None
+        """
+        radius = self._tile_size // 6
+        for move in self._chess.legal_moves():
+            if move[:2] == start_loc:
+                x, y = self.convert_chess_cord(SQUARE_INDEX[move[3:5]])
+                center = (self._board_origin[0] + x + self._tile_size / 2,
+                          self._board_origin[1] + y + self._tile_size / 2)
+                pg.draw.circle(self._win, self._color_move_hint, center,
+                               radius)
+
     def set_pieces(self, selected_piece):
         game_board = self._chess.get_board()
-
-        for row in game_board:
-            for piece in row:
-                if piece is not None:
-                    image = pygame.image.load(piece.get_image_path())
-
-                    if piece == selected_piece:
-                        mos_pos_x, mos_pos_y = pg.mouse.get_pos()
-                        mos_pos_x -= image.get_width() / 2
-                        mos_pos_y -= image.get_height() / 2
-                        piece_loc = mos_pos_x, mos_pos_y
-                        self._win.blit(image, piece_loc)
-
-                    else:
-                        x_offset = self._board_origin[0] + (
-                                self._tile_size - image.get_size()[0]) / 2
-                        y_offset = self._board_origin[0] + (
-                                self._tile_size - image.get_size()[1]) / 2
-                        x, y = self.convert_chess_cord(piece.get_location())
-                        x += x_offset
-                        y += y_offset
-
-                        self._win.blit(image, (x, y))
-
-    def convert_chess_cord(self, chess_cord):
-        col = self._cols.index(chess_cord[0]) * self._tile_size
-        row = self._rows.index(chess_cord[1]) * self._tile_size
+        self._sprites.set_tile_size(self._tile_size)
+
+        for piece in game_board:
+            if piece is not None:
+                image = self._sprites.get_tile_image(piece.get_image_path())
+
+                if piece == selected_piece:
+                    mos_pos_x, mos_pos_y = self._mouse_pos
+                    mos_pos_x -= image.get_width() / 2
+                    mos_pos_y -= image.get_height() / 2
+                    piece_loc = mos_pos_x, mos_pos_y
+                    self._win.blit(image, piece_loc)
+
+                else:
+                    x_offset = self._board_origin[0] + (
+                            self._tile_size - image.get_size()[0]) / 2
+                    y_offset = self._board_origin[0] + (
+                            self._tile_size - image.get_size()[1]) / 2
+                    x, y = self.convert_chess_cord(piece.get_location())
+                    x += x_offset
+                    y += y_offset
+
+                    self._win.blit(image, (x, y))
+
+    def square_to_view(self, square):
+        """
+        Screen column and row of a square; row 0 is the top of the screen
+        :param square: square number 0 - 63, a1 = 0
+        :return: col, row
+        """
+        col, row = square & 7, 7 - (square >> 3)
+        if self._flipped:
+            col, row = 7 - col, 7 - row
         return col, row
 
-    def get_square_coordinate(self):
-        mouse_pos = pg.mouse.get_pos()
+    def view_to_square(self, col, row):
+        """
+        Square number shown at a screen column and row
+        :return: square number 0 - 63
+        """
+        if self._flipped:
+            col, row = 7 - col, 7 - row
+        return (7 - row) * 8 + col
+
+    def convert_chess_cord(self, square):
+        col, row = self.square_to_view(square)
+        return col * self._tile_size, row * self._tile_size
+
+    def get_square_coordinate(self, mouse_pos=None):
+        """
+        :param mouse_pos: screen position, defaults to the mouse position
+        :return: Chess coordinate of the square under the position or None
+        """
+        if mouse_pos is None:
+            mouse_pos = pg.mouse.get_pos()
         board_pos = None
 
         col_pos = int((mouse_pos[0] - self._board_origin[0]) // self._tile_size)
         row_pos = int((mouse_pos[1] - self._board_origin[1]) // self._tile_size)
 
         if col_pos in range(8) and row_pos in range(8):
-            board_pos = self._cols[col_pos] + self._rows[row_pos]
+            board_pos = SQUARE_NAMES[self.view_to_square(col_pos, row_pos)]
         else:
             print("Out of range")
 
         return board_pos
 
     def player_display(self):
-        font = pg.font.SysFont(self._font_type, 27)
+        """
+        Draw the side panel, composed again only when the captured pieces or
+        the check status of either player change
+        :return: None
+        """
+        key = (tuple(piece.get_name() for piece in self._p1.get_captured_pieces()),
+               tuple(piece.get_name() for piece in self._p2.get_captured_pieces()),
+               self._p1.get_in_check(), self._p2.get_in_check(),
+               self._tile_size, self._thinking_text)
+        if key != self._panel_key:
+            self._panel = self.compose_panel()
+            self._panel_key = key
+        self._win.blit(self._panel, self.panel_rect())
+
+    def compose_panel(self):
+        """
+        :return: Surface of the side panel with the player names, check
+        status and captured pieces
+        """
+        panel_rect = self.panel_rect()
+        panel = pg.Surface(panel_rect.size)
+        panel.fill(self._color_main_bg)
+
+        font = self._text.get_font(self._font_type, 27)
         text_height = font.get_height()
-        left_edge = self._board_origin[0] + self._board_size + self._tile_size/4
+        left_edge = self._board_origin[0] + self._board_size + self._tile_size/4 - panel_rect.left
         top_height = self._board_origin[1]
         bot_height = top_height + self._board_size - text_height
 
-        p1_text = font.render("Player 1", False, self._color_inactive_text)
-        self._win.blit(p1_text, (left_edge, bot_height))
-
-        p2_text = font.render("Player 2", False, self._color_inactive_text)
-        self._win.blit(p2_text, (left_edge, top_height))
-
-        self.display_captured_pieces(left_edge, bot_height - text_height, self._p2.get_captured_pieces())
-        self.display_captured_pieces(left_edge, top_height + text_height, self._p1.get_captured_pieces())
-
-    def display_captured_pieces(self, left_edge, height, captured_pieces):
+        panel.blit(self.player_label(self._p1), (left_edge, bot_height))
+        panel.blit(self.player_label(self._p2), (left_edge, top_height))
+
+        self.display_captured_pieces(left_edge, bot_height - text_height, self._p2.get_captured_pieces(), panel)
+        self.display_captured_pieces(left_edge, top_height + text_height, self._p1.get_captured_pieces(), panel)
+
+        if self._thinking_text is not None:
+            thinking = self._text.render(self._font_type, 20, self._thinking_text,
+                                         self._color_inactive_text)
+            middle = (panel_rect.height - thinking.get_height()) / 2
+            panel.blit(thinking, (left_edge, middle))
+        return panel
+
+    def player_label(self, player):
+        text = "Player " + str(player.get_turn())
+        if player.get_in_check() == "CHECK":
+            text += ": Check"
+        elif player.get_in_check() == "CHECKMATE":
+            text += ": Mate"
+        return self._text.render(self._font_type, 27, text,
+                                  self._color_inactive_text)
+
+    def display_captured_pieces(self, left_edge, height, captured_pieces,
+                                surface=None):
         pieces = {
             "Pawn": [],
             "Bishop": [],
@@ -341,16 +764,18 @@ class ChessInterface:
             "Queen": []
         }
 
+        if surface is None:
+            surface = self._win
         offset = left_edge-8
         p1_captures = captured_pieces
 
         for piece in p1_captures:
-            image = pg.transform.scale(pg.image.load(piece.get_image_path()), (30, 30))
+            image = self._sprites.get_capture_image(piece.get_image_path())
             pieces[piece.get_name()].append(image)
 
         for piece_type in pieces:
             for image in pieces[piece_type]:
-                self._win.blit(image, (offset, height))
+                surface.blit(image, (offset, height))
                 offset += image.get_width() * .2
             if len(pieces[piece_type]) > 0:
                 offset += self._tile_size * .3
@@ -440,15 +865,79 @@ class ChessInterface:
             active = inactive
 
         if button_rect.collidepoint(mos_x, mos_y):
-            button = self._font.render(text, False, active)
+            button = self._text.render(self._font_type, self._font_size, text,
+                                       active)
         else:
-            button = self._font.render(text, False, inactive)
+            button = self._text.render(self._font_type, self._font_size, text,
+                                       inactive)
 
         surface.blit(button, (x, y))
 
         return button_rect
 
 
+def benchmark(seconds=2.0, drag=False, fps=60):
+    """
+    Run the game screen without a window on SDL's dummy video driver
+    :param seconds: length of the run
+    :param drag: keep dragging the e2 pawn around instead of sitting idle
+    :param fps: frame rate cap
+    :return: frame stats, see ChessInterface.get_frame_stats
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    interface = ChessInterface()
+    interface.set_colors(("W", "B"))
+    interface.set_fps(fps)
+    start = interface.square_rect("e2").center
+    start_time = time.perf_counter()
+
+    def post_events(frame):
+        if drag:
+            if frame == 0:
+                pg.event.post(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1,
+                                             pos=start))
+            else:
+                step = frame % 100
+                pg.event.post(pg.event.Event(
+                    pg.MOUSEMOTION, pos=(start[0] + step, start[1] - step),
+                    rel=(1, -1), buttons=(1, 0, 0)))
+        if time.perf_counter() - start_time >= seconds:
+            pg.event.post(pg.event.Event(pg.QUIT))
+
+    interface.set_frame_hook(post_events)
+    interface.play_chess()
+    stats = interface.get_frame_stats()
+    pg.quit()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess")
+    parser.add_argument("--benchmark", type=float, metavar="SECONDS",
+                        help="measure the game screen headless")
+    parser.add_argument("--drag", action="store_true",
+                        help="drag a piece during the benchmark")
+    parser.add_argument("--fps", type=int, default=60,
+                        help="frame rate cap of the benchmark")
+    parser.add_argument("--computer", choices=BOT_TYPES,
+                        help="play against the computer, which plays player 2")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="seconds the computer thinks per move")
+    args = parser.parse_args(argv)
+
+    if args.benchmark is None:
+        game = ChessInterface()
+        if args.computer is not None:
+            game.set_computer(BackgroundEngine(args.computer, args.think))
+        game.run_game()
+        return 0
+
+    stats = benchmark(args.benchmark, args.drag, args.fps)
+    print("frames {frames} redraws {redraws} fps {fps:.1f} "
+          "cpu/frame {cpu_ms_per_frame:.3f} ms cpu {cpu_percent:.1f}%".format(
+              **stats))
+    return 0
+
+
 if __name__ == "__main__":
-    game = ChessInterface()
-    game.run_game()
+    raise SystemExit(main())
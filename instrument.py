@@ -0,0 +1,241 @@
+from pieces import GamePiece, Pawn
+from board import GameBoard
+from rules import ChessRules
+import argparse
+import collections
+import json
+import math
+import os
+import time
+
+###########################################################
+# Instrumentation
+#
+# Call counters and timers for the hot paths of the rules engine. While
+# off nothing is wrapped and the methods run untouched. Switching on
+# replaces each instrumented method on its class with a wrapper that times
+# the call; switching off puts the original methods back. Timings are
+# inclusive, so a check that generates legal moves also counts the legal
+# move time. The last SAMPLE_SIZE durations of every counter are kept for
+# percentiles. Set CHESS_STATS=1 in the environment to switch on at import.
+#
+###########################################################
+
+SAMPLE_SIZE = 4096
+PERCENTILES = [0.5, 0.9, 0.99]
+
+# Counter name to the classes whose method it wraps; overrides in
+# subclasses are wrapped under the same name
+TARGETS = {
+    "GamePiece.set_possible_moves": [GamePiece, Pawn],
+    "GameBoard.make_move": [GameBoard],
+    "GameBoard.unmake_move": [GameBoard],
+    "ChessRules.check": [ChessRules],
+    "ChessRules.legal_moves": [ChessRules],
+}
+
+_originals = dict()
+_counters = dict()
+
+
+class Counter:
+    __slots__ = ("calls", "total_ns", "min_ns", "max_ns", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.samples = collections.deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, duration_ns):
+        self.calls += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.samples.append(duration_ns)
+
+    def summary(self):
+        """
+        :return: dict of calls and timings in microseconds
+        """
+        summary = {
+            "calls": self.calls,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.total_ns / self.calls / 1e3 if self.calls else 0.0,
+            "min_us": (self.min_ns or 0) / 1e3,
+            "max_us": self.max_ns / 1e3
+        }
+        for fraction in PERCENTILES:
+            key = "p{:g}_us".format(fraction * 100)
+            summary[key] = percentile(self.samples, fraction) / 1e3
+        return summary
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile
+    :param values: iterable of numbers
+    :param fraction: 0.5 for the median, 0.99 for p99
+    :return: value, or 0.0 for none
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def timed(name, method):
+    counter = _counters[name]
+    clock = time.perf_counter_ns
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            counter.add(clock() - start)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def register(name, classes):
+    """
+    Instrument another method, wrapped at once when counting is on
+    :param name: "Class.method"
+    :param classes: classes defining the method
+    """
+    TARGETS[name] = classes
+    if _originals:
+        wrap(name, classes)
+
+
+def wrap(name, classes):
+    method_name = name.split(".")[1]
+    _counters.setdefault(name, Counter())
+    for cls in classes:
+        method = cls.__dict__.get(method_name)
+        if method is not None:
+            _originals[(cls, method_name)] = method
+            setattr(cls, method_name, timed(name, method))
+
+
+def enable():
+    """
+    Start counting; counters keep their values from earlier runs
+    """
+    if _originals:
+        return
+    for name, classes in TARGETS.items():
+        wrap(name, classes)
+
+
+def disable():
+    """
+    Stop counting and restore the original methods
+    """
+    for (cls, method_name), method in _originals.items():
+        setattr(cls, method_name, method)
+    _originals.clear()
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def reset():
+    for name in _counters:
+        _counters[name] = Counter()
+    if _originals:
+        # Wrappers hold their counter, so wrap again with the new ones
+        disable()
+        enable()
+
+
+def snapshot():
+    """
+    :return: dict of counter name to summary, for counters with calls
+    """
+    return {name: counter.summary() for name, counter in
+            sorted(_counters.items()) if counter.calls}
+
+
+def stats():
+    """
+    Counters with the time of each one spread over the moves played,
+    counted over every game in the process
+    :return: dict of "enabled", "moves" and "counters"; counters maps names
+    to calls, total_ms, mean_us, min_us, max_us, percentiles and per_move_us
+    """
+    counters = snapshot()
+    moves = counters.get("Chess.make_move", {}).get("calls", 0)
+    for summary in counters.values():
+        summary["per_move_us"] = \
+            summary["total_ms"] * 1000 / moves if moves else 0.0
+    return {"enabled": is_enabled(), "moves": moves, "counters": counters}
+
+
+def to_json(stats, indent=2):
+    return json.dumps(stats, indent=indent, sort_keys=True)
+
+
+def run_games(games, max_plies=200, seed=None, out=print):
+    """
+    Play random games with the counters on
+    :return: stats counted over all games
+    """
+    from selfplay import play_game
+
+    was_enabled = is_enabled()
+    reset()
+    enable()
+    try:
+        for number in range(games):
+            play_game(number, "random", "random", max_plies,
+                      None if seed is None else seed + number)
+        game_stats = stats()
+    finally:
+        if not was_enabled:
+            disable()
+    out(to_json(game_stats))
+    return game_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the rules engine over random games")
+    parser.add_argument("--games", type=int, default=10,
+                        help="number of games")
+    parser.add_argument("--max-plies", type=int, default=200,
+                        help="longest game")
+    parser.add_argument("--seed", type=int, help="seed of the first game")
+    parser.add_argument("--out", help="JSON file, default standard output")
+    args = parser.parse_args(argv)
+
+    # Run as a script this is __main__; chess registers its methods with
+    # the imported module, so count through that one
+    import instrument
+
+    if args.out is None:
+        instrument.run_games(args.games, args.max_plies, args.seed)
+        return 0
+
+    with open(args.out, "w") as out_file:
+        instrument.run_games(args.games, args.max_plies, args.seed,
+                             lambda text: out_file.write(text + "\n"))
+    return 0
+
+
+if os.environ.get("CHESS_STATS", "") not in ("", "0") and \
+        __name__ != "__main__":
+    enable()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
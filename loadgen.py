@@ -0,0 +1,145 @@
+from server import GameServer
+from instrument import percentile
+import argparse
+import asyncio
+import json
+import random
+import time
+
+###########################################################
+# Load generator
+#
+# Plays many concurrent games against the game server, one connection
+# per game, each side making random legal moves. Every MOVE round trip is
+# timed and the p50 and p99 latency are reported together with the
+# overall move rate.
+#
+###########################################################
+
+
+class ServerError(Exception):
+    """
+    ERR reply from the server
+    """
+
+
+async def request(reader, writer, line):
+    """
+    Send one command and wait for its reply, skipping EVENT lines
+    :return: reply dict
+    """
+    writer.write((line + "\n").encode())
+    await writer.drain()
+    while True:
+        reply = (await reader.readline()).decode().strip()
+        if reply.startswith("OK "):
+            return json.loads(reply[3:])
+        if reply.startswith("ERR ") or not reply:
+            raise ServerError(reply[4:] or "connection closed")
+
+
+async def connect(host, port, path):
+    if path is not None:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def play_session(host, port, path, max_plies, rng, latencies):
+    """
+    Create a game and play random moves until it ends or reaches
+    max_plies
+    :param latencies: list the MOVE round trip seconds are appended to
+    :return: number of moves made
+    """
+    reader, writer = await connect(host, port, path)
+    plies = 0
+    try:
+        game_id = (await request(reader, writer, "NEW"))["game"]
+        while plies < max_plies:
+            moves = (await request(reader, writer,
+                                   "MOVES {}".format(game_id)))["moves"]
+            if not moves:
+                break
+
+            start = time.perf_counter()
+            state = await request(reader, writer, "MOVE {} {}".format(
+                game_id, rng.choice(moves)))
+            latencies.append(time.perf_counter() - start)
+            plies += 1
+
+            if state["status"] != "INCOMPLETE":
+                break
+        await request(reader, writer, "CLOSE {}".format(game_id))
+    finally:
+        writer.write(b"QUIT\n")
+        writer.close()
+    return plies
+
+
+async def run_load(games, host="127.0.0.1", port=8765, path=None,
+                   max_plies=100, seed=None, out=print):
+    """
+    Play games concurrently against a running server
+    :param games: number of concurrent games
+    :return: dict with games, moves, seconds, moves_per_sec, p50 and p99
+    in milliseconds
+    """
+    rng = random.Random(seed)
+    latencies = []
+    start = time.perf_counter()
+    plies = await asyncio.gather(*[
+        play_session(host, port, path, max_plies,
+                     random.Random(rng.getrandbits(32)), latencies)
+        for game in range(games)])
+    seconds = time.perf_counter() - start
+
+    moves = sum(plies)
+    result = {"games": games, "moves": moves, "seconds": seconds,
+              "moves_per_sec": moves / seconds if seconds > 0 else 0.0,
+              "p50": percentile(latencies, 0.5) * 1000,
+              "p99": percentile(latencies, 0.99) * 1000}
+    out("Games {} moves {} time {:.3f}s moves/sec {:.0f} p50 {:.2f}ms "
+        "p99 {:.2f}ms".format(games, moves, seconds, result["moves_per_sec"],
+                              result["p50"], result["p99"]))
+    return result
+
+
+async def run_local(games, max_plies=100, seed=None, out=print):
+    """
+    Start a server in this process on a free port and load it
+    """
+    server = GameServer()
+    await server.start()
+    try:
+        return await run_load(games, port=server.get_port(),
+                              max_plies=max_plies, seed=seed, out=out)
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Concurrent game load generator for the game server")
+    parser.add_argument("--games", type=int, default=100,
+                        help="number of concurrent games")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None,
+                        help="Unix socket path instead of TCP")
+    parser.add_argument("--max-plies", type=int, default=100,
+                        help="moves per game")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--local", action="store_true",
+                        help="start a server in this process")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        asyncio.run(run_local(args.games, args.max_plies, args.seed))
+    else:
+        asyncio.run(run_load(args.games, args.host, args.port, args.unix,
+                             args.max_plies, args.seed))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
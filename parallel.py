@@ -0,0 +1,191 @@
+from bitboard import Bitboard, move_name
+from engine import Search
+from transposition import TranspositionTable, table_bytes
+import argparse
+import ctypes
+import multiprocessing
+import os
+import time
+
+###########################################################
+# Parallel search
+#
+# Root splitting across a process pool. The legal root moves are dealt
+# out between the workers, every worker runs iterative deepening over its
+# share and all workers use one transposition table in shared memory, so
+# positions reached through different root moves are only searched once.
+# The result is taken from the deepest iteration every worker completed.
+#
+###########################################################
+
+# Shared transposition table of this worker process
+_worker_table = None
+
+
+def _init_worker(memory, size_mb):
+    global _worker_table
+    if memory is not None:
+        _worker_table = TranspositionTable(size_mb, memory)
+
+
+def _search_share(job):
+    """
+    Worker entry point
+    :param job: (position, root moves, time limit, node limit, max depth,
+    history)
+    :return: search info dict of the worker
+    """
+    position, root_moves, time_limit, node_limit, max_depth, history = job
+    table = _worker_table
+    if table is not None:
+        table.reset_stats()
+
+    search = Search(position, time_limit, node_limit, max_depth, history,
+                    table, root_moves)
+    search.search()
+    info = dict(search.get_info())
+    info["pid"] = os.getpid()
+    return info
+
+
+class ParallelSearch:
+    def __init__(self, workers=None, hash_mb=16):
+        """
+        :param workers: number of worker processes, defaults to the number
+        of cores
+        :param hash_mb: shared transposition table size in MB, 0 to disable
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._hash_mb = hash_mb
+        self._memory = None
+        if hash_mb:
+            # Zero filled shared memory handed to the workers at start up
+            self._memory = multiprocessing.RawArray(
+                ctypes.c_uint64, table_bytes(hash_mb) // 8)
+        self._pool = multiprocessing.Pool(self._workers, _init_worker,
+                                          (self._memory, hash_mb))
+        self._info = dict()
+
+    def get_workers(self):
+        return self._workers
+
+    def get_info(self):
+        return self._info
+
+    def get_table(self):
+        """
+        View of the shared transposition table, None when disabled
+        """
+        if self._memory is None:
+            return None
+        return TranspositionTable(self._hash_mb, self._memory)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def search(self, position, time_limit=None, node_limit=None,
+               max_depth=64, history=None):
+        """
+        Search a position with every worker
+        :param position: Bitboard, left unchanged
+        :param node_limit: total node budget split evenly between workers
+        :return: best encoded move, or None when there are no legal moves
+        """
+        start = time.perf_counter()
+        root_moves = position.legal_moves()
+        if not root_moves:
+            self._info = {"depth": 0, "nodes": 0, "seconds": 0.0,
+                          "nps": 0.0, "score": 0, "move": None,
+                          "workers": self._workers}
+            return None
+
+        shares = [root_moves[index::self._workers]
+                  for index in range(self._workers)]
+        shares = [share for share in shares if share]
+        if node_limit is not None:
+            node_limit = max(1, node_limit // len(shares))
+
+        jobs = [(position.copy(), share, time_limit, node_limit, max_depth,
+                 history) for share in shares]
+        results = self._pool.map(_search_share, jobs)
+        seconds = time.perf_counter() - start
+
+        # Deepest iteration completed by every worker
+        depth = min(result["depth"] for result in results)
+        best_score, best_move = None, root_moves[0]
+        for result in results:
+            for iteration in result["iterations"]:
+                if iteration[0] == depth and (best_score is None or
+                                              iteration[1] > best_score):
+                    best_score, best_move = iteration[1], iteration[2]
+
+        nodes = sum(result["nodes"] for result in results)
+        self._info = {
+            "depth": depth,
+            "nodes": nodes,
+            "seconds": seconds,
+            "nps": nodes / seconds if seconds > 0 else 0.0,
+            "score": best_score if best_score is not None else 0,
+            "move": move_name(best_move),
+            "workers": len(shares)
+        }
+        return best_move
+
+
+def benchmark(max_workers, time_limit=2.0, max_depth=64, hash_mb=16,
+              position=None, out=print):
+    """
+    Measure nodes per second for 1, 2, 4, ... max_workers workers
+    :return: list of (workers, nps, speedup) tuples
+    """
+    if position is None:
+        position = Bitboard()
+
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    curve = []
+    base_nps = None
+    for workers in counts:
+        with ParallelSearch(workers, hash_mb) as search:
+            search.search(position, time_limit, max_depth=max_depth)
+            info = search.get_info()
+        if base_nps is None:
+            base_nps = info["nps"] or 1.0
+        speedup = info["nps"] / base_nps
+        curve.append((workers, info["nps"], speedup))
+        out("workers {:3d} depth {:2d} nodes {:9d} nps {:9.0f} "
+            "speedup {:5.2f}".format(workers, info["depth"], info["nodes"],
+                                     info["nps"], speedup))
+    return curve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Parallel search speedup benchmark")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="largest worker count to measure")
+    parser.add_argument("--time", type=float, default=2.0,
+                        help="seconds per search")
+    parser.add_argument("--hash", type=int, default=16,
+                        help="shared transposition table size in MB")
+    args = parser.parse_args(argv)
+
+    benchmark(args.workers, args.time, hash_mb=args.hash)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,200 @@
+from chess import Chess
+from player import Player
+from bitboard import Bitboard
+import argparse
+import time
+
+###########################################################
+# Perft
+#
+# Counts the leaf nodes of the legal move tree to a fixed depth. The
+# counts are compared against published results to prove the move
+# generator correct, and nodes per second is used as the move generation
+# throughput benchmark.
+#
+###########################################################
+
+# FEN of the published perft test positions
+PERFT_POSITIONS = {
+    "startpos": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R "
+                "w KQkq - 0 1",
+    "position3": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "position4": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 "
+                 "w kq - 0 1",
+    "position5": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8"
+}
+
+# Published perft results keyed by position name, then depth
+PERFT_RESULTS = {
+    "startpos": {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609,
+                 6: 119060324},
+    "kiwipete": {1: 48, 2: 2039, 3: 97862, 4: 4085603},
+    "position3": {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624},
+    "position4": {1: 6, 2: 264, 3: 9467, 4: 422333},
+    "position5": {1: 44, 2: 1486, 3: 62379, 4: 2103487}
+}
+
+
+def perft(game, depth):
+    """
+    Count the leaf nodes of the legal move tree
+    :param game: Chess game, left unchanged on return
+    :param depth: number of plies to search
+    :return: number of leaf nodes
+    """
+    if depth == 0:
+        return 1
+
+    moves = game.legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        # validate_move sets the castle/en passant flags make_move relies
+        # on, so each move is made straight after it is validated
+        game.validate_move(move)
+        game.make_move(move)
+        game.set_player_turn()
+        nodes += perft(game, depth - 1)
+        game.set_player_turn()
+        game.unmake_move()
+
+    return nodes
+
+
+def divide(game, depth):
+    """
+    Perft split by root move
+    :param game: Chess game, left unchanged on return
+    :param depth: number of plies to search, at least 1
+    :return: dict of root move to leaf node count
+    """
+    results = dict()
+    for move in game.legal_moves():
+        game.validate_move(move)
+        game.make_move(move)
+        game.set_player_turn()
+        results[move] = perft(game, depth - 1)
+        game.set_player_turn()
+        game.unmake_move()
+
+    return results
+
+
+def game_position(game):
+    """
+    Bitboard copy of the game position with the side to move set from the
+    game's player turn
+    :param game: Chess game
+    :return: Bitboard
+    """
+    color = game.get_player(game.get_turn()).get_color()
+    return Bitboard.from_game_board(game.get_game_board(), color)
+
+
+def new_game(moves=None, p1_color="W", fen=None):
+    """
+    Create a game and replay the given moves
+    :param moves: list of moves in the format "e2 e4"
+    :param p1_color: color of player 1, "W" or "B"
+    :param fen: starting position, defaults to the standard start
+    :return: Chess game
+    """
+    p2_color = "B" if p1_color == "W" else "W"
+    if fen is None:
+        game = Chess(Player(1, p1_color), Player(2, p2_color))
+    else:
+        game = Chess.from_fen(fen, Player(1, p1_color), Player(2, p2_color))
+
+    for move in moves or []:
+        if not game.validate_move(move):
+            raise ValueError("Illegal move in position setup: " + move)
+        game.make_move(move)
+        game.set_player_turn()
+
+    return game
+
+
+def run_perft(game, depth, show_divide=False, expected=None, out=print,
+              backend="board"):
+    """
+    Run perft and report node counts, nodes per second and whether the
+    count matches the expected result
+    :param backend: "board" to use Chess.validate_move/make_move or
+    "bitboard" to use the bitboard position backend
+    :return: dict with depth, nodes, seconds, nps and match
+    """
+    if backend == "bitboard":
+        game = game_position(game)
+
+    start = time.perf_counter()
+    if show_divide:
+        results = game.divide(depth) if backend == "bitboard" else \
+            divide(game, depth)
+        nodes = sum(results.values())
+    else:
+        results = None
+        nodes = game.perft(depth) if backend == "bitboard" else \
+            perft(game, depth)
+    seconds = time.perf_counter() - start
+    nps = nodes / seconds if seconds > 0 else 0.0
+
+    if results is not None:
+        for move in sorted(results):
+            out("{}: {}".format(move, results[move]))
+        out("Moves: {}".format(len(results)))
+
+    match = None
+    if expected is not None:
+        match = nodes == expected
+
+    line = "Depth {} nodes {} time {:.3f}s nps {:.0f}".format(
+        depth, nodes, seconds, nps)
+    if match is not None:
+        line += " expected {} {}".format(expected, "OK" if match else "FAIL")
+    out(line)
+
+    return {"depth": depth, "nodes": nodes, "seconds": seconds, "nps": nps,
+            "match": match}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess perft benchmark")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--moves", nargs="*", default=[],
+                        help='moves from the start position, e.g. "e2 e4"')
+    parser.add_argument("--fen", default="startpos",
+                        help="FEN or the name of a published position: " +
+                        ", ".join(PERFT_POSITIONS))
+    parser.add_argument("--black", action="store_true",
+                        help="player 1 plays black")
+    parser.add_argument("--divide", action="store_true",
+                        help="show node counts per root move")
+    parser.add_argument("--all", action="store_true",
+                        help="run every depth from 1 to depth")
+    parser.add_argument("--backend", choices=["board", "bitboard"],
+                        default="board", help="move generation backend")
+    args = parser.parse_args(argv)
+
+    p1_color = "B" if args.black else "W"
+    depths = range(1, args.depth + 1) if args.all else [args.depth]
+    failed = False
+
+    fen = PERFT_POSITIONS.get(args.fen, args.fen)
+
+    for depth in depths:
+        game = new_game(args.moves, p1_color, fen)
+        expected = None
+        if not args.moves and args.fen in PERFT_RESULTS:
+            expected = PERFT_RESULTS[args.fen].get(depth)
+        result = run_perft(game, depth, args.divide, expected,
+                           backend=args.backend)
+        failed = failed or result["match"] is False
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
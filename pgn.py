@@ -0,0 +1,292 @@
+from chess import Chess
+from bitboard import *
+import argparse
+import gzip
+import re
+import time
+
+###########################################################
+# PGN
+#
+# Streaming reader for Portable Game Notation files. Games are read one
+# at a time from any iterable of lines, so memory use stays constant
+# however large the file is. Moves in Standard Algebraic Notation are
+# matched against the legal move list of the position and replayed
+# through Chess.validate_move / Chess.make_move in the board's "e2 e4"
+# format.
+#
+###########################################################
+
+HEADER_RE = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+
+# Comments, variations, NAGs, move numbers, results and SAN moves
+TOKEN_RE = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|"
+                      r"\d+\.+|[^\s(){};$]+")
+
+SAN_RE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])"
+                    r"(?:=?([NBRQ]))?[+#]?[!?]*$")
+CASTLE_RE = re.compile(r"^([O0]-[O0](?:-[O0])?)[+#]?[!?]*$")
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+SAN_PIECES = {None: PAWN, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN,
+              "K": KING}
+
+
+class PgnError(Exception):
+    """
+    Raised for a move that cannot be read or is illegal in the position
+    """
+
+
+def open_pgn(path):
+    """
+    Open a PGN file for reading line by line, decompressing gzip files
+    :param path: file path, gzip compressed if it ends in ".gz"
+    :return: text file object
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def read_games(lines):
+    """
+    Split a stream of PGN lines into games
+    :param lines: iterable of lines, such as an open file
+    :return: generator of (headers dict, movetext string); movetext keeps
+    its line breaks, which end ";" comments
+    """
+    headers = dict()
+    movetext = []
+    headers_ended = False
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("%"):
+            continue
+
+        match = HEADER_RE.match(line)
+        if match is not None:
+            # A header after movetext, or after a blank line closing the
+            # headers of a game without moves, starts the next game
+            if movetext or headers_ended:
+                yield headers, "\n".join(movetext)
+                headers = dict()
+                movetext = []
+                headers_ended = False
+            headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif line:
+            movetext.append(line)
+        elif headers:
+            headers_ended = True
+
+    if headers or movetext:
+        yield headers, "\n".join(movetext)
+
+
+def parse_movetext(movetext):
+    """
+    Extract the main line from PGN movetext, skipping comments,
+    variations, annotation glyphs and move numbers
+    :param movetext: movetext string
+    :return: (list of SAN moves, result or None)
+    """
+    moves = []
+    result = None
+    variation_depth = 0
+
+    for token in TOKEN_RE.findall(movetext):
+        if token == "(":
+            variation_depth += 1
+        elif token == ")":
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth or token[0] in "{;$" or token[0].isdigit() and \
+                token.endswith("."):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+
+    return moves, result
+
+
+def san_to_move(game, san):
+    """
+    Convert a SAN move to the board's move format by matching it against
+    the legal moves of the position
+    :param game: Chess game with the player to move set
+    :param san: move in Standard Algebraic Notation, example "Nbd7"
+    :return: move in the format "e2 e4", with a promotion suffix if any
+    """
+    position = game.get_position()
+    side = position.get_side()
+    castle = CASTLE_RE.match(san)
+
+    if castle is not None:
+        king_square = 4 if side == WHITE else 60
+        long_castle = castle.group(1).count("-") == 2
+        piece_type = KING
+        target = king_square - 2 if long_castle else king_square + 2
+        from_file = from_rank = promotion = None
+    else:
+        match = SAN_RE.match(san)
+        if match is None:
+            raise PgnError("Unreadable move " + san)
+        piece_type = SAN_PIECES[match.group(1)]
+        from_file = match.group(2)
+        from_rank = match.group(3)
+        target = square_index(match.group(4))
+        promotion = SAN_PIECES[match.group(5)] if match.group(5) else 0
+
+    found = []
+    for move in position.legal_moves():
+        from_sq, to_sq, move_promotion = decode_move(move)
+        if to_sq != target or position.get_piece(from_sq)[1] != piece_type:
+            continue
+        if from_file is not None and SQUARE_NAMES[from_sq][0] != from_file:
+            continue
+        if from_rank is not None and SQUARE_NAMES[from_sq][1] != from_rank:
+            continue
+        if promotion is not None and move_promotion != promotion:
+            continue
+        found.append(move)
+
+    if not found:
+        raise PgnError("Illegal move " + san)
+    if len(found) > 1:
+        raise PgnError("Ambiguous move " + san)
+    return move_name(found[0])
+
+
+def new_game(headers):
+    """
+    :param headers: PGN headers, a FEN header sets the start position
+    :return: Chess game at the start position of the PGN game
+    """
+    if "FEN" in headers:
+        return Chess.from_fen(headers["FEN"])
+    return Chess.from_fen(START_FEN)
+
+
+def replay_game(headers, movetext):
+    """
+    Replay a game through the rules engine, one position at a time
+    :param headers: PGN headers
+    :param movetext: PGN movetext
+    :return: generator of (ply, SAN move, board move, game) after each move;
+    the game is updated in place. Raises PgnError at the first move that
+    cannot be read or is rejected by the rules engine
+    """
+    game = new_game(headers)
+    san_moves = parse_movetext(movetext)[0]
+
+    for ply, san in enumerate(san_moves, 1):
+        move = san_to_move(game, san)
+        if not game.validate_move(move):
+            raise PgnError("Rules engine rejected " + san + " (" + move + ")")
+        game.make_move(move)
+        game.set_player_turn()
+        yield ply, san, move, game
+
+
+def replay_games(lines):
+    """
+    Replay every game in a PGN stream
+    :param lines: iterable of PGN lines
+    :return: generator of dicts with the game number, headers, board moves,
+    plies replayed, result, final FEN and error message or None
+    """
+    for number, (headers, movetext) in enumerate(read_games(lines), 1):
+        moves = []
+        error = None
+        game = None
+        try:
+            for ply, san, move, game in replay_game(headers, movetext):
+                moves.append(move)
+        except (PgnError, ValueError) as exception:
+            error = "Ply {}: {}".format(len(moves) + 1, exception)
+
+        yield {
+            "game": number,
+            "headers": headers,
+            "moves": moves,
+            "plies": len(moves),
+            "result": headers.get("Result"),
+            "fen": game.to_fen() if game is not None else None,
+            "error": error
+        }
+
+
+def iter_positions(lines):
+    """
+    Extract the position after every move of every game. Games with an
+    error stop at the last legal position
+    :param lines: iterable of PGN lines
+    :return: generator of (game number, ply, FEN)
+    """
+    for number, (headers, movetext) in enumerate(read_games(lines), 1):
+        try:
+            for ply, san, move, game in replay_game(headers, movetext):
+                yield number, ply, game.to_fen()
+        except (PgnError, ValueError):
+            continue
+
+
+def run_replay(lines, limit=None, out=print, show_errors=True):
+    """
+    Replay games and report throughput
+    :param lines: iterable of PGN lines
+    :param limit: maximum number of games or None
+    :return: dict with games, plies, errors, seconds, games_per_sec and
+    plies_per_sec
+    """
+    games = plies = errors = 0
+    start = time.perf_counter()
+
+    for record in replay_games(lines):
+        games += 1
+        plies += record["plies"]
+        if record["error"] is not None:
+            errors += 1
+            if show_errors:
+                out("Game {}: {}".format(record["game"], record["error"]))
+        if limit is not None and games >= limit:
+            break
+
+    seconds = time.perf_counter() - start
+    games_per_sec = games / seconds if seconds > 0 else 0.0
+    plies_per_sec = plies / seconds if seconds > 0 else 0.0
+    out("Games {} plies {} errors {} time {:.3f}s games/sec {:.1f} "
+        "plies/sec {:.0f}".format(games, plies, errors, seconds,
+                                  games_per_sec, plies_per_sec))
+
+    return {"games": games, "plies": plies, "errors": errors,
+            "seconds": seconds, "games_per_sec": games_per_sec,
+            "plies_per_sec": plies_per_sec}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay PGN games")
+    parser.add_argument("path", help="PGN file, optionally gzip compressed")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="stop after this many games")
+    parser.add_argument("--positions", action="store_true",
+                        help="print the FEN after every move instead")
+    args = parser.parse_args(argv)
+
+    with open_pgn(args.path) as lines:
+        if args.positions:
+            for number, ply, fen in iter_positions(lines):
+                if args.limit is not None and number > args.limit:
+                    break
+                print("{} {} {}".format(number, ply, fen))
+            return 0
+        result = run_replay(lines, args.limit)
+
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,125 @@
-from copy import deepcopy
+from bitboard import SQUARE_NAMES
 import os
+import time
+
+# Move directions as (col, row) steps; row 0 is rank 1
+ROOK_MOVES = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_MOVES = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+QUEEN_MOVES = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0),
+               (-1, 1)]
+KNIGHT_MOVES = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1),
+                (-2, 1), (-1, 2)]
+
+###########################################################
+# Move tables
+#
+# Target squares for every piece type and square, built once at import so
+# move generation only iterates lists and never checks the board edges.
+# Sliding pieces get one ray per direction, ordered away from the piece;
+# knights and kings get one single square ray per target. The between
+# table gives the squares strictly between two squares on a line, so move
+# paths are only built when asked for.
+#
+###########################################################
+
+
+def step_ray(square, step, max_steps=7):
+    """
+    Squares reached by repeating a step until the edge of the board
+    :param square: square number 0 - 63
+    :param step: (col, row) step
+    :param max_steps: longest ray
+    :return: list of square numbers ordered away from the square
+    """
+    col, row = square & 7, square >> 3
+    ray = []
+    for count in range(max_steps):
+        col += step[0]
+        row += step[1]
+        if col not in range(8) or row not in range(8):
+            break
+        ray.append(row * 8 + col)
+    return ray
+
+
+def build_move_tables():
+    """
+    :return: dict of table name to per square list
+    """
+    rays = {step: [step_ray(square, step) for square in range(64)]
+            for step in QUEEN_MOVES}
+
+    def slider_rays(steps):
+        return [[rays[step][square] for step in steps if rays[step][square]]
+                for square in range(64)]
+
+    def single_steps(steps):
+        return [[target for step in steps
+                 for target in step_ray(square, step, 1)]
+                for square in range(64)]
+
+    def square_masks(table):
+        masks = []
+        for squares in table:
+            mask = 0
+            for square in squares:
+                mask |= 1 << square
+            masks.append(mask)
+        return masks
+
+    knight_targets = single_steps(KNIGHT_MOVES)
+    king_targets = single_steps(QUEEN_MOVES)
+    pawn_captures = {"W": single_steps([(-1, 1), (1, 1)]),
+                     "B": single_steps([(-1, -1), (1, -1)])}
+
+    # Squares not on a shared line share one empty list
+    no_squares = []
+    between = [[no_squares] * 64 for square in range(64)]
+    for step in QUEEN_MOVES:
+        for square in range(64):
+            ray = rays[step][square]
+            for index, target in enumerate(ray):
+                if index:
+                    between[square][target] = ray[:index]
+
+    return {
+        "DIRECTION_RAYS": rays,
+        "ROOK_RAYS": slider_rays(ROOK_MOVES),
+        "BISHOP_RAYS": slider_rays(BISHOP_MOVES),
+        "QUEEN_RAYS": slider_rays(QUEEN_MOVES),
+        "KNIGHT_TARGETS": knight_targets,
+        "KING_TARGETS": king_targets,
+        "KNIGHT_RAYS": [[[target] for target in targets]
+                        for targets in knight_targets],
+        "KING_RAYS": [[[target] for target in targets]
+                      for targets in king_targets],
+        # Pushes hold up to two squares; a pawn that has moved uses one
+        "PAWN_PUSHES": {
+            "W": [step_ray(square, (0, 1), 2) for square in range(64)],
+            "B": [step_ray(square, (0, -1), 2) for square in range(64)]},
+        "PAWN_CAPTURES": pawn_captures,
+        "PAWN_ATTACK_MASKS": {color: square_masks(captures)
+                              for color, captures in pawn_captures.items()},
+        "BETWEEN": between
+    }
+
+
+_table_start = time.perf_counter()
+_tables = build_move_tables()
+TABLE_BUILD_SECONDS = time.perf_counter() - _table_start
+
+DIRECTION_RAYS = _tables["DIRECTION_RAYS"]
+ROOK_RAYS = _tables["ROOK_RAYS"]
+BISHOP_RAYS = _tables["BISHOP_RAYS"]
+QUEEN_RAYS = _tables["QUEEN_RAYS"]
+KNIGHT_TARGETS = _tables["KNIGHT_TARGETS"]
+KING_TARGETS = _tables["KING_TARGETS"]
+KNIGHT_RAYS = _tables["KNIGHT_RAYS"]
+KING_RAYS = _tables["KING_RAYS"]
+PAWN_PUSHES = _tables["PAWN_PUSHES"]
+PAWN_CAPTURES = _tables["PAWN_CAPTURES"]
+PAWN_ATTACK_MASKS = _tables["PAWN_ATTACK_MASKS"]
+BETWEEN = _tables["BETWEEN"]
 
 
 class PieceSet:
@@ -7,17 +127,16 @@ class PieceSet:
         """
         Creates a roster for player 1 and 2 to use at the beginning of the game
         """
+        back_row = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
 
+        # Squares are numbered 0 - 63 from a1 to h8
         self._roster = {
-                    "W":  [Rook("a1"), Knight("b1"), Bishop("c1"), Queen("d1"),
-                           King("e1"), Bishop("f1"), Knight("g1"), Rook("h1"),
-                           Pawn("a2"), Pawn("b2"), Pawn("c2"), Pawn("d2"),
-                           Pawn("e2"), Pawn("f2"), Pawn("g2"), Pawn("h2")],
-
-                    "B":  [Rook("a8"), Knight("b8"), Bishop("c8"), Queen("d8"),
-                           King("e8"), Bishop("f8"), Knight("g8"), Rook("h8"),
-                           Pawn("a7"), Pawn("b7"), Pawn("c7"), Pawn("d7"),
-                           Pawn("e7"), Pawn("f7"), Pawn("g7"), Pawn("h7")]
+                    "W":  [piece(col) for col, piece in enumerate(back_row)] +
+                          [Pawn(8 + col) for col in range(8)],
+
+                    "B":  [piece(56 + col) for col, piece in
+                           enumerate(back_row)] +
+                          [Pawn(48 + col) for col in range(8)]
         }
 
     def get_roster(self, player):
@@ -33,41 +152,55 @@ class PieceSet:
 
 
 class GamePiece:
+    # Pieces are slotted to keep the memory per game small; the name and
+    # move tables are shared by every piece of a type
+    __slots__ = ("_player", "_cur_loc", "_possible_moves", "_watched",
+                 "_has_moved", "_color", "_roster_index")
+    _name = None
+    _ray_table = []
+
     def __init__(self, location):
-        self._image_path = None
         self._player = None
-        self._name = None
         self._cur_loc = location
-        self._max_move = 7
-        self._possible_moves = dict()
-        self._move_set = []
+        self._possible_moves = set()
+        self._watched = 0
         self._has_moved = False
         self._color = None
-        self._image_path = None
+        self._roster_index = None
 
     def __repr__(self):
-        return repr(
-            "P" + str(self._player) + "-" + self._name + "-" + self._cur_loc)
+        return repr("P" + str(self._player) + "-" + self._name + "-" +
+                    SQUARE_NAMES[self._cur_loc])
 
     def set_image_path(self, color):
         """
         Image files from:
         https://commons.wikimedia.org/wiki/Category:PNG_chess_pieces/Standard_transparent
+        The path is built from the color and name when asked for
         :param color:
         :return:
         """
+        self.set_color(color)
+
+    def set_color(self, color):
         self._color = color
-        path = os.path.join("Assets", color + "_" + self._name + ".PNG")
-        self._image_path = path
 
-    def set_has_moved(self):
-        self._piece_has_moved = True
+    def set_has_moved(self, value=True):
+        self._has_moved = value
 
     def has_moved(self):
         return self._has_moved
 
+    def get_roster_index(self):
+        return self._roster_index
+
+    def set_roster_index(self, index):
+        self._roster_index = index
+
     def get_image_path(self):
-        return self._image_path
+        if self._color is None:
+            return None
+        return os.path.join("Assets", self._color + "_" + self._name + ".PNG")
 
     def set_player(self, player):
         self._player = player
@@ -87,149 +220,159 @@ class GamePiece:
     def get_color(self):
         return self._color
 
-    def valid_move(self, target, move):
-        if target is not None:
-            if target.get_player() != self._player:
-                return True
-            else:
-                return False
-        else:
-            return True
-
     def get_possible_moves(self):
+        """
+        :return: set of target squares
+        """
         return self._possible_moves
 
-### PIECES CAN JUMP OVER ENEMY PIECES
-    def set_possible_moves(self, board):
-        self._possible_moves.clear()
+    def get_path(self, target_loc):
+        """
+        Squares the piece crosses to reach a target, ending with the target;
+        knight and single step moves have the target only
+        :param target_loc: square number of a possible move
+        :return: list of square numbers ordered away from the piece
+        """
+        return BETWEEN[self._cur_loc][target_loc] + [target_loc]
 
-        for move in self._move_set:
-            path = []
-            valid_move = True
-            capture_found = False
-            move_count = 0
+    def get_watched_mask(self):
+        """
+        Squares examined by the last call to set_possible_moves; the move set
+        can only change when the contents of one of these squares change
+        :return: bit mask with bit n set for square n
+        """
+        return self._watched
 
-            col, row = board.get_board_col_row(self._cur_loc)
-            col += move[0]  # starting loc
-            row += move[1]
+    def get_attack_mask(self):
+        """
+        Squares the piece attacks, whether empty or holding a piece of either
+        player. A ray stops at the first piece, so for every piece but the
+        pawn these are the watched squares
+        :return: bit mask with bit n set for square n
+        """
+        return self._watched
 
-            while valid_move is True and capture_found is False:
-                # Move is of board
-                if col not in range(8) or row not in range(8):
-                    valid_move = False
+    def set_possible_moves(self, board):
+        """
+        Walk the precomputed rays from the current square; a ray stops at
+        the first piece, which is included if it belongs to the opponent
+        :param board: GameBoard
+        :return: set of target squares
+        """
+        self._possible_moves.clear()
+        watched = 0
+        game_board = board.get_board()
 
-                # Piece's moves exceeded
-                elif move_count >= self._max_move:
-                    valid_move = False
+        for ray in self._ray_table[self._cur_loc]:
+            for target_loc in ray:
+                target_piece = game_board[target_loc]
+                watched |= 1 << target_loc
 
+                if target_piece is None:
+                    self._possible_moves.add(target_loc)
                 else:
-                    target_loc = board.get_location_format(col, row)
-                    target_piece = board.get_board_loc(target_loc)
-
-                    move_is_valid = self.valid_move(target_piece, move)
-
-                    if move_is_valid:
-                        path.append(target_loc)
-                        self._possible_moves[target_loc] = deepcopy(path)
-                    else:
-                        valid_move = False
-
-                    if target_piece is not None:
-                        capture_found = True
-
-                move_count += 1
-                col += move[0]  # starting loc
-                row += move[1]
+                    if target_piece.get_player() != self._player:
+                        self._possible_moves.add(target_loc)
+                    break
 
+        self._watched = watched
         return self._possible_moves
 
 
 class Queen(GamePiece):
-    def __init__(self, location):
-        super().__init__(location)
-        self._name = "Queen"
-        self._move_set = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1),
-                          (-1, 0), (-1, 1)]
+    __slots__ = ()
+    _name = "Queen"
+    _ray_table = QUEEN_RAYS
 
 
 class King(GamePiece):
-    def __init__(self, location):
-        super().__init__(location)
-        self._name = "King"
-        self._move_set = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1),
-                          (-1, 0), (-1, 1)]
-        self._max_move = 1
+    __slots__ = ()
+    _name = "King"
+    _ray_table = KING_RAYS
 
 
 class Pawn(GamePiece):  ### Need capture move and en passant  ## need transformation
+    __slots__ = ("_max_move", "_en_passant_capture", "_en_passant_move")
+    _name = "Pawn"
+
     def __init__(self, location):
         super().__init__(location)
-        self._name = "Pawn"
-        self._first_move_made = False
         self._max_move = 2
-        self._move_set = []
-        self._en_passant = False
-        self._en_passant_locs = {"Capture": None, "Move": None}
-
-    def valid_move(self, target, move):
-        if move == (0, 1) or move == (0, -1):
-            if target is None:
-                return True
-            else:
-                return False
-        else:
-            if target is not None:
-                if target.get_player() != self._player:
-                    return True
-            return False
+        self._en_passant_capture = None
+        self._en_passant_move = None
+
+    def set_possible_moves(self, board):
+        """
+        Pushes stop at the first piece; captures need an opponent piece
+        :param board: GameBoard
+        :return: set of target squares
+        """
+        self._possible_moves.clear()
+        watched = 0
+        game_board = board.get_board()
+
+        pushes = PAWN_PUSHES[self._color][self._cur_loc][:self._max_move]
+        for target_loc in pushes:
+            watched |= 1 << target_loc
+            if game_board[target_loc] is not None:
+                break
+            self._possible_moves.add(target_loc)
+
+        for target_loc in PAWN_CAPTURES[self._color][self._cur_loc]:
+            target_piece = game_board[target_loc]
+            watched |= 1 << target_loc
+            if target_piece is not None and \
+                    target_piece.get_player() != self._player:
+                self._possible_moves.add(target_loc)
+
+        self._watched = watched
+        return self._possible_moves
+
+    def get_attack_mask(self):
+        """
+        Pawns attack the two diagonal squares ahead, not the push squares
+        :return: bit mask with bit n set for square n
+        """
+        return PAWN_ATTACK_MASKS[self._color][self._cur_loc]
 
     def set_en_passant(self, capture_loc, move_loc):
-        self._en_passant = True
-        self._en_passant_locs["Capture"] = capture_loc
-        self._en_passant_locs["Move"] = move_loc
+        self._en_passant_capture = capture_loc
+        self._en_passant_move = move_loc
 
     def clear_en_passant(self):
-        self._en_passant = False
-        self._en_passant_locs["Capture"] = None
-        self._en_passant_locs["Move"] = None
+        self._en_passant_capture = None
+        self._en_passant_move = None
 
     def available_en_passant(self):
-        return self._en_passant
+        return self._en_passant_capture is not None
 
     def get_en_passant_moves(self):
-        return self._en_passant_locs
+        return {"Capture": self._en_passant_capture,
+                "Move": self._en_passant_move}
 
-    def set_player(self, player):
-        self._player = player
-
-        if self._player == 1:
-            self._move_set = [(0, 1), (-1, 1), (1, 1)]
-        else:
-            self._move_set = [(0, -1), (-1, -1), (1, -1)]
-
-    def has_moved(self):
-        self._max_move = 1
-        self._first_move_made = True
+    def set_has_moved(self, value=True):
+        """
+        A pawn can only advance two squares on its first move
+        :param value: True once the pawn has moved
+        :return: None
+        """
+        self._has_moved = value
+        self._max_move = 1 if value else 2
 
 
 class Knight(GamePiece):
-    def __init__(self, location):
-        super().__init__(location)
-        self._move_set = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1),
-                          (-2, 1), (-1, 2)]
-        self._max_move = 1
-        self._name = "Knight"
+    __slots__ = ()
+    _name = "Knight"
+    _ray_table = KNIGHT_RAYS
 
 
 class Rook(GamePiece):
-    def __init__(self, location):
-        super().__init__(location)
-        self._name = "Rook"
-        self._move_set = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    __slots__ = ()
+    _name = "Rook"
+    _ray_table = ROOK_RAYS
 
 
 class Bishop(GamePiece):
-    def __init__(self, location):
-        super().__init__(location)
-        self._name = "Bishop"
-        self._move_set = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+    __slots__ = ()
+    _name = "Bishop"
+    _ray_table = BISHOP_RAYS
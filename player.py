@@ -1,16 +1,22 @@
 from pieces import *
+from bitboard import Bitboard, move_name
+from engine import Search
+from transposition import TranspositionTable
+from parallel import ParallelSearch
 import random
 import time
 
 
 class Player:
+    __slots__ = ("_player_turn", "_color", "_roster", "_king", "_in_check",
+                 "_captured_pieces")
+
     def __init__(self, player_turn, player_color):
         self._player_turn = player_turn
         self._color = player_color
         self._roster = None
         self._king = None
         self._in_check = False
-        self._possible_moves = []
         self._captured_pieces = []
 
     def __repr__(self):
@@ -23,8 +29,46 @@ class Player:
         return self._in_check
 
     def remove_piece(self, piece):
+        """
+        The last piece of the roster takes the place of the captured one,
+        which keeps its roster index for restore_piece
+        :param piece: captured piece
+        :return: None
+        """
         self._captured_pieces.append(piece)
-        self._roster.remove(piece)
+        last = self._roster.pop()
+        if last is not piece:
+            index = piece.get_roster_index()
+            self._roster[index] = last
+            last.set_roster_index(index)
+
+    def restore_piece(self, piece):
+        """
+        Undo the last capture, returning the piece to its place in the
+        roster and the piece that took it to the end
+        :param piece: captured piece
+        :return: None
+        """
+        self._captured_pieces.pop()
+        index = piece.get_roster_index()
+        if index < len(self._roster):
+            last = self._roster[index]
+            last.set_roster_index(len(self._roster))
+            self._roster.append(last)
+            self._roster[index] = piece
+        else:
+            self._roster.append(piece)
+
+    def replace_piece(self, piece, new_piece):
+        """
+        Swap a piece in the roster, used for pawn transformation
+        :param piece: piece currently in the roster
+        :param new_piece: piece taking its place
+        :return: None
+        """
+        index = piece.get_roster_index()
+        self._roster[index] = new_piece
+        new_piece.set_roster_index(index)
 
     def get_captured_pieces(self):
         return self._captured_pieces
@@ -43,30 +87,142 @@ class Player:
 
     def set_roster(self, roster):
         self._roster = roster
-        self._king = roster[4]
-
-    def get_pos_moves(self):
-        return self._possible_moves
+        for index, piece in enumerate(roster):
+            piece.set_roster_index(index)
+            if piece.get_name() == "King":
+                self._king = piece
 
-    def set_pos_moves(self, possible_moves):
-        self._possible_moves = possible_moves
+    def clear_captured_pieces(self):
+        self._captured_pieces = []
 
 
 class RandomBot(Player):
-    def __init__(self, player_turn, player_color):
-        super().__init__(player_turn, player_color)
+    __slots__ = ("_game", "_random")
 
-    def get_move(self):
-        moves = []
-        piece = None
-        while len(moves) < 1:
-            piece = random.choice(self._roster)
-            moves = piece.get_possible_moves()
-
-        move = random.choice(list(moves.keys()))
-        start_loc = piece.get_location()
-        end_loc = move
-
-        print(move)
-
-        return start_loc + " " + end_loc
+    def __init__(self, player_turn, player_color, seed=None):
+        """
+        :param seed: seed of the bot's random number generator, for games
+        that can be replayed
+        """
+        super().__init__(player_turn, player_color)
+        self._game = None
+        self._random = random.Random(seed)
+
+    def set_game(self, game):
+        self._game = game
+
+    def get_move(self, game=None):
+        """
+        Pick a random legal move
+        :param game: Chess game, defaults to the game set with set_game
+        :return: move in the format "e2 e4", or None if there are no moves
+        """
+        if game is None:
+            game = self._game
+
+        moves = game.legal_moves()
+        if not moves:
+            return None
+        return self._random.choice(moves)
+
+
+class EngineBot(Player):
+    __slots__ = ("_game", "_hash_mb", "_table", "_workers", "_parallel",
+                 "_time_limit", "_node_limit", "_max_depth", "_search_info",
+                 "_book", "_tablebase")
+
+    def __init__(self, player_turn, player_color, time_limit=1.0,
+                 node_limit=None, max_depth=64, hash_mb=16, workers=1,
+                 book=None, tablebase=None):
+        """
+        Computer player using an alpha-beta search with iterative deepening
+        :param time_limit: seconds per move or None
+        :param node_limit: nodes per move or None
+        :param max_depth: deepest search iteration
+        :param hash_mb: transposition table size in MB, 0 to disable
+        :param workers: number of search processes; more than one searches
+        in parallel over a process pool
+        :param book: OpeningBook played from without searching while the
+        position is in the book
+        :param tablebase: Tablebase played from without searching once the
+        position is in an ending it covers
+        """
+        super().__init__(player_turn, player_color)
+        self._game = None
+        self._hash_mb = hash_mb
+        self._table = None
+        self._workers = workers
+        self._parallel = None
+        self._time_limit = time_limit
+        self._node_limit = node_limit
+        self._max_depth = max_depth
+        self._search_info = dict()
+        self._book = book
+        self._tablebase = tablebase
+
+    def set_game(self, game):
+        self._game = game
+
+    def close(self):
+        """
+        Stop the worker processes of a parallel search
+        """
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+
+    def get_search_info(self):
+        """
+        Statistics of the last search: depth, nodes, seconds, nps, score
+        and move
+        """
+        return self._search_info
+
+    def get_move(self, game=None):
+        """
+        Search the game position for the best move
+        :param game: Chess game, defaults to the game set with set_game
+        :return: move in the format "e2 e4", or None if there are no moves
+        """
+        if game is None:
+            game = self._game
+
+        if self._book is not None:
+            move = self._book.get_move(game)
+            if move is not None:
+                self._search_info = {"depth": 0, "nodes": 0, "seconds": 0.0,
+                                     "nps": 0.0, "score": 0, "move": move,
+                                     "book": True}
+                return move
+
+        position = Bitboard.from_game_board(game.get_game_board(),
+                                            self._color)
+        if self._tablebase is not None:
+            move = self._tablebase.best_move(position)
+            if move is not None:
+                self._search_info = {"depth": 0, "nodes": 0, "seconds": 0.0,
+                                     "nps": 0.0, "score": 0,
+                                     "move": move_name(move),
+                                     "tablebase": True}
+                return move_name(move)
+
+        if self._workers > 1:
+            if self._parallel is None:
+                self._parallel = ParallelSearch(self._workers, self._hash_mb)
+            move = self._parallel.search(position, self._time_limit,
+                                         self._node_limit, self._max_depth,
+                                         game.get_position_counts())
+            self._search_info = self._parallel.get_info()
+        else:
+            if self._table is None and self._hash_mb:
+                self._table = TranspositionTable(self._hash_mb)
+
+            search = Search(position, self._time_limit, self._node_limit,
+                            self._max_depth, game.get_position_counts(),
+                            self._table)
+            move = search.search()
+            self._search_info = search.get_info()
+
+        if move is None:
+            return None
+        return move_name(move)
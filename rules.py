@@ -1,6 +1,5 @@
 from pieces import *
 import logging
-from copy import deepcopy
 
 ###########################################################
 # Chess Rules
@@ -8,109 +7,244 @@ from copy import deepcopy
 # Contains all rules of chess included in this project
 
 # Check
-# Checkmate
+# Legal moves
 # Self into check
 # En Passant
 # Pawn Transformation
 # Castle
-# Draw
 # 3 move draw
 
 ###########################################################
 
+# Every square of the board as a bit mask
+ALL_SQUARES = (1 << 64) - 1
+
+# Pieces a pawn can be promoted to
+PROMOTION_PIECES = ["Queen", "Rook", "Bishop", "Knight"]
+
+
+def square_mask(squares):
+    """
+    :param squares: iterable of square numbers 0 - 63
+    :return: bit mask with bit n set for square n
+    """
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
 
 class ChessRules:
 
     #####################################################################
     # Check
     #
-    # Rule description: King can be captured next turn
-    #
+    # Rule description: King can be captured next turn. Read from the attack
+    # map of the opponent; checkmate and stalemate follow from the legal
+    # moves left to the defending player
     #
     #####################################################################
 
-    def check(self, oppenent, defending_player):
-        def_player_in_check = False
-
-        def_king = defending_player.get_king()
-        def_king_loc = def_king.get_location()
-        opp_roster = oppenent.get_roster()
-
-        # See if any pieces in oppenents roster can capture King
-        for opp_piece in opp_roster:
-            opp_moves = opp_piece.get_possible_moves()
+    def check(self, oppenent, defending_player, board, legal_moves=None):
+        """
+        :param oppenent: player who just moved
+        :param defending_player: player to move next
+        :param board: GameBoard
+        :param legal_moves: legal moves of the defending player if already
+        generated
+        :return: "CHECK", "CHECKMATE", "STALEMATE" or False
+        """
+        if legal_moves is None:
+            legal_moves = self.legal_moves(defending_player, oppenent, board)
+        in_check = self.in_check(defending_player, oppenent, board)
+
+        if in_check:
+            return "CHECK" if legal_moves else "CHECKMATE"
+        if not legal_moves:
+            return "STALEMATE"
+        return False
 
-            if def_king_loc in opp_moves:
-                def_player_in_check = "CHECK"
-                if self.checkmate(oppenent, defending_player,
-                                  opp_moves[def_king_loc], opp_piece):
-                    def_player_in_check = "CHECKMATE"
-        return def_player_in_check
+    def in_check(self, player, oppenent, board):
+        """
+        :return: True if the player's king is attacked by the opponent
+        """
+        king_loc = player.get_king().get_location()
+        return board.is_square_attacked(king_loc, oppenent.get_turn())
 
     #####################################################################
-    # Checkmate
+    # Legal moves
     #
-    # Rule description: King will be captured next turn
+    # Rule description: A move may not leave the moving player's king
+    # attacked.
     #
+    # Generated in one pass over the possible moves of each piece without
+    # trying any move on the board. With one piece giving check, other
+    # pieces must capture it or block between it and the king; with two only
+    # the king moves. A piece pinned to the king keeps the moves along its
+    # pin ray. The king moves to squares outside the opponent's attack map,
+    # extended past the king along the ray of a checking slider
     #
     #####################################################################
 
-    def checkmate(self, attacking_player, defending_player, attack_moves,
-                   attack_piece):
+    def legal_moves(self, player, oppenent, board):
         """
-        Checks to see if opponents piece is in checkmate, i.e see if there are
-        any ways to get out of check
-        Chess Rule - Ways to get out of check:
-        1. King moves to new location
-        2. King captures attacking piece
-        3. Another piece blocks path to the king
-        4. Another piece captures the attacking piece
-        :param player_moved:
-        :param moves:
-        :return:
+        Every legal move of a player, including castling, en passant and one
+        move per promotion piece
+        :param player: player to generate the moves of
+        :param oppenent: other player
+        :param board: GameBoard
+        :return: list of (cur_loc, tar_loc, promotion, special) where
+        promotion is the name of the new piece or None and special is
+        "En Passant", "Castle" or None
         """
-        def_roster = defending_player.get_roster()
-
-        for atk_move in attack_moves:
-            for piece in def_roster:
-                piece_moves = piece.get_possible_moves()
-
-                if piece.get_name() == "King":
-                    for move in piece_moves:
-                        self_in_check = self.self_into_check(move,
-                                                             attacking_player.get_roster())
-
-                        if self_in_check is False:
-                            #  2. King captures attacking piece
-                            if move == atk_move and atk_move == attack_piece.get_location():
-                                return False
-
-                            #  1. King moves to new location
-                            if move != atk_move and move not in attack_moves:
-                                return False
-
-                #  3. Another piece blocks path to the king
-                #  4. Another piece captures the attacking piece
-                elif piece.get_name() != "King":
-                    if atk_move in piece_moves:
-                        return False
-
-        return True
+        king = player.get_king()
+        king_loc = king.get_location()
+        attacker = oppenent.get_turn()
+
+        checkers = self.checkers(king_loc, oppenent)
+        pins = self.pin_rays(king_loc, player, board)
+
+        # Target squares allowed to pieces other than the king
+        if not checkers:
+            evasions = ALL_SQUARES
+        elif len(checkers) == 1:
+            checker_loc = checkers[0].get_location()
+            evasions = square_mask(BETWEEN[king_loc][checker_loc]) | \
+                1 << checker_loc
+        else:
+            evasions = 0
+
+        king_danger = board.get_attack_map(attacker)
+        for checker in checkers:
+            king_danger |= self.xray_square(king_loc, checker)
+
+        moves = []
+        for piece in player.get_roster():
+            cur_loc = piece.get_location()
+
+            if piece is king:
+                for tar_loc in piece.get_possible_moves():
+                    if not king_danger >> tar_loc & 1:
+                        moves.append((cur_loc, tar_loc, None, None))
+
+                if not checkers and not piece.has_moved():
+                    for col_dist in 2, -2:
+                        tar_loc = board.get_neighbor_loc(cur_loc, col_dist, 0)
+                        if tar_loc is not None and \
+                                self.castle(cur_loc, tar_loc, board) and \
+                                not self.castle_through_check(
+                                    cur_loc, tar_loc, board) and \
+                                not king_danger >> tar_loc & 1:
+                            moves.append((cur_loc, tar_loc, None, "Castle"))
+                continue
+
+            pin_ray = pins.get(cur_loc, ALL_SQUARES)
+            allowed = evasions & pin_ray
+            for tar_loc in piece.get_possible_moves():
+                if allowed >> tar_loc & 1:
+                    if board.is_promotion(piece, tar_loc):
+                        for promotion in PROMOTION_PIECES:
+                            moves.append((cur_loc, tar_loc, promotion, None))
+                    else:
+                        moves.append((cur_loc, tar_loc, None, None))
+
+            if piece.get_name() == "Pawn" and piece.available_en_passant():
+                en_passant_moves = piece.get_en_passant_moves()
+                capture_loc = en_passant_moves["Capture"]
+                tar_loc = en_passant_moves["Move"]
+                # Blocks the check, or captures the pawn giving it
+                if (allowed >> tar_loc & 1 or
+                        pin_ray >> tar_loc & 1 and
+                        evasions >> capture_loc & 1) and \
+                        not self.en_passant_discovers_check(
+                            king_loc, cur_loc, capture_loc, oppenent, board):
+                    moves.append((cur_loc, tar_loc, None, "En Passant"))
+
+        return moves
 
     #####################################################################
     # Self into check
     #
-    # Rule description: King cannot move themselves into check
-    #
+    # Rule description: King cannot move themselves into check. Found from
+    # the pieces giving check and the pieces pinned to the king
     #
     #####################################################################
-    def self_into_check(self, king_move, opp_roster):
+    def checkers(self, king_loc, oppenent):
+        """
+        :return: list of the opponent's pieces attacking the king square
+        """
+        return [piece for piece in oppenent.get_roster()
+                if piece.get_attack_mask() >> king_loc & 1]
 
-        for piece in opp_roster:
-            all_moves = piece.get_possible_moves()
-            if king_move in all_moves:
-                return True
+    def pin_rays(self, king_loc, player, board):
+        """
+        Follows every line out of the king; a player's piece followed by an
+        opponent slider moving along that line is pinned
+        :return: dict of pinned piece location to a mask of the squares it
+        may still move to
+        """
+        game_board = board.get_board()
+        player_turn = player.get_turn()
+        pins = dict()
 
+        for step in QUEEN_MOVES:
+            if 0 in step:
+                sliders = ("Rook", "Queen")
+            else:
+                sliders = ("Bishop", "Queen")
+
+            ray_mask = 0
+            pinned_loc = None
+            for loc in DIRECTION_RAYS[step][king_loc]:
+                ray_mask |= 1 << loc
+                piece = game_board[loc]
+                if piece is None:
+                    continue
+                if piece.get_player() != player_turn:
+                    if pinned_loc is not None and \
+                            piece.get_name() in sliders:
+                        pins[pinned_loc] = ray_mask
+                    break
+                if pinned_loc is not None:
+                    break
+                pinned_loc = loc
+
+        return pins
+
+    def xray_square(self, king_loc, checker):
+        """
+        The king cannot step back along the line of a checking slider; that
+        square is hidden from the attack map by the king itself
+        :return: mask of the square behind the king, or 0
+        """
+        if checker.get_name() not in ("Rook", "Bishop", "Queen"):
+            return 0
+
+        checker_loc = checker.get_location()
+        col_dist = (king_loc & 7) - (checker_loc & 7)
+        row_dist = (king_loc >> 3) - (checker_loc >> 3)
+        step = ((col_dist > 0) - (col_dist < 0),
+                (row_dist > 0) - (row_dist < 0))
+        return square_mask(DIRECTION_RAYS[step][king_loc][:1])
+
+    def en_passant_discovers_check(self, king_loc, cur_loc, capture_loc,
+                                   oppenent, board):
+        """
+        En passant empties two squares of one row, which can open the row
+        between the king and an opponent rook or queen
+        :return: True if the capture leaves the king attacked along the row
+        """
+        if king_loc >> 3 != cur_loc >> 3:
+            return False
+
+        game_board = board.get_board()
+        step = (1, 0) if cur_loc > king_loc else (-1, 0)
+        for loc in DIRECTION_RAYS[step][king_loc]:
+            piece = game_board[loc]
+            if piece is None or loc in (cur_loc, capture_loc):
+                continue
+            return piece.get_player() == oppenent.get_turn() and \
+                piece.get_name() in ("Rook", "Queen")
         return False
 
     #####################################################################
@@ -132,12 +266,9 @@ class ChessRules:
             return
 
         cur_loc = pawn.get_location()
-        rows = board.get_cols_and_rows()[1]
 
         # Only Pawn that moves 2 spaces is eligible
-        move_start = rows.index(start_loc[1])
-        move_end = rows.index(end_loc[1])
-        eligible_move = abs(move_start - move_end) == 2
+        eligible_move = abs(start_loc - end_loc) == 16
 
         if not eligible_move:
             return
@@ -149,12 +280,14 @@ class ChessRules:
             if neighbor_loc is not None:
                 neighbor = board.get_board_loc(neighbor_loc)
 
-                if neighbor is not None and neighbor.get_name() == "Pawn":
+                if neighbor is not None and neighbor.get_name() == "Pawn" \
+                        and neighbor.get_player() != pawn.get_player():
 
-                    if neighbor.get_color() == "W":  # Move north of target pawn
-                        en_move = board.get_neighbor_loc(cur_loc, 0, 1)
-                    else:  # Move south
-                        en_move = board.get_neighbor_loc(cur_loc, 0, -1)
+                    # Move in the capturing pawns direction of travel
+                    if neighbor.get_color() == "W":
+                        en_move = cur_loc + 8
+                    else:
+                        en_move = cur_loc - 8
 
                     neighbor.set_en_passant(cur_loc, en_move)
 
@@ -179,8 +312,9 @@ class ChessRules:
 
         transform = pieces[transform_selection]
         transform.set_location(pawn_loc)
-        transform.set_player(pawn)
-        transform.set_image(pawn_color)
+        transform.set_player(pawn_player)
+        transform.set_image_path(pawn_color)
+        transform.set_has_moved()
 
         return transform
 
@@ -194,10 +328,10 @@ class ChessRules:
     def castle(self, cur_loc, tar_loc, board):
         king = board.get_board_loc(cur_loc)
 
-        cur_col, cur_row = board.get_board_col_row(cur_loc)
-        tar_col, tar_row = board.get_board_col_row(tar_loc)
+        cur_col, cur_row = cur_loc & 7, cur_loc >> 3
+        tar_col, tar_row = tar_loc & 7, tar_loc >> 3
         col_move = cur_col - tar_col
-        row_move = tar_row - tar_row
+        row_move = tar_row - cur_row
 
         if row_move != 0:
             logging.debug("Not horizontal move")
@@ -212,12 +346,15 @@ class ChessRules:
         else:
             return False
 
-        rook_loc = board.get_location_format(rook_col, cur_row)
+        rook_loc = cur_row * 8 + rook_col
         rook = board.get_board_loc(rook_loc)
 
+        if rook is None or rook.get_name() != "Rook" or \
+                rook.get_player() != king.get_player():
+            return False
+
         for col in range(cur_col + direction, rook_col, direction):
-            piece_loc = board.get_location_format(col, cur_row)
-            piece = board.get_board_loc(piece_loc)
+            piece = board.get_board_loc(cur_row * 8 + col)
             if piece is not None:
                 return False
 
@@ -227,43 +364,30 @@ class ChessRules:
         return True
 
     #####################################################################
-    # Draw
+    # Castle through check
     #
-    # Rule description: Player cannot make any moves
+    # Rule description: King cannot castle out of or through check
     #
     #
     #####################################################################
-    def draw(self, player):
-        roster = player.get_roster()
-        for piece in roster:
-            moves = piece.get_possible_moves()
-            if piece.get_name != "Pawn":
-                if len(moves) != 0:
-                    return False
-            else:
-                for move_set in roster:
-                    if len(move_set) != 0:
-                        return False
-        return True
+    def castle_through_check(self, cur_loc, tar_loc, board):
+        king = board.get_board_loc(cur_loc)
+        attacker = 2 if king.get_player() == 1 else 1
+
+        pass_loc = (cur_loc + tar_loc) // 2
+
+        for loc in cur_loc, pass_loc:
+            if board.is_square_attacked(loc, attacker):
+                return True
+
+        return False
 
     #####################################################################
-    # Player is still in check after move
-    #
-    # Rule description: Can only move out of check when in check
+    # 3 move draw
     #
+    # Rule description: The same position occurs three times with the same
+    # player to move, castling rights and en passant options
     #
     #####################################################################
-
-    def still_in_check(self, move, game):
-        new_game = deepcopy(game)
-        new_game.make_move(move)
-
-        if new_game.get_player_turn() == 1:
-            atk_player = new_game.get_player(2)
-            def_player = new_game.get_player(1)
-        else:
-            atk_player = new_game.get_player(1)
-            def_player = new_game.get_player(2)
-
-        if self.check(atk_player, def_player) is not False:
-            return False
+    def threefold_repetition(self, position_count):
+        return position_count >= 3
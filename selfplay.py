@@ -0,0 +1,219 @@
+from chess import Chess
+from player import RandomBot, EngineBot
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+###########################################################
+# Self-play
+#
+# Plays batches of complete games between bots without the pygame
+# interface, to stress-test the rules and collect statistics. Games are
+# dealt out to a process pool and every finished game is streamed as one
+# JSON line with its moves, result and termination reason. Throughput is
+# reported per worker process and for the whole batch.
+#
+###########################################################
+
+BOT_TYPES = ["random", "engine"]
+
+# Result string and termination reason for a finished game status
+RESULTS = {"Player 1 Wins": "1-0", "Player 2 Wins": "0-1", "Draw": "1/2-1/2"}
+
+
+def new_bot(bot_type, player_turn, color, seed=None, node_limit=2000,
+            max_depth=64):
+    """
+    :param bot_type: "random" or "engine"
+    :param seed: seed of a random bot
+    :param node_limit: nodes per move of an engine bot
+    :return: RandomBot or EngineBot
+    """
+    if bot_type == "random":
+        return RandomBot(player_turn, color, seed)
+    if bot_type == "engine":
+        return EngineBot(player_turn, color, time_limit=None,
+                         node_limit=node_limit, max_depth=max_depth, hash_mb=1)
+    raise ValueError("Unknown bot type " + bot_type)
+
+
+def play_game(number, white="random", black="random", max_plies=300,
+              seed=None, node_limit=2000):
+    """
+    Play one game; player 1 has white
+    :param number: game number, copied to the result
+    :param white: bot type of white
+    :param black: bot type of black
+    :param max_plies: the game is stopped unfinished after this many plies
+    :param seed: seed of the random bots, white uses seed and black seed + 1
+    :param node_limit: nodes per move of engine bots
+    :return: dict with game, white, black, moves, plies, result,
+    termination, fen, seconds and pid
+    """
+    start = time.perf_counter()
+    black_seed = None if seed is None else seed + 1
+    bots = {1: new_bot(white, 1, "W", seed, node_limit),
+            2: new_bot(black, 2, "B", black_seed, node_limit)}
+    game = Chess(bots[1], bots[2])
+    moves = []
+    termination = "max plies"
+
+    while len(moves) < max_plies:
+        move = bots[game.get_turn()].get_move(game)
+        if move is None or not game.validate_move(move):
+            termination = "no move"
+            break
+
+        game.make_move(move)
+        game.set_player_turn()
+        moves.append(move)
+
+        status = game.get_game_status()
+        if status != "INCOMPLETE":
+            if status != "Draw":
+                termination = "checkmate"
+            elif game.get_repetition_count() >= 3:
+                termination = "threefold repetition"
+            else:
+                termination = "stalemate"
+            break
+
+    for bot in bots.values():
+        if isinstance(bot, EngineBot):
+            bot.close()
+
+    return {"game": number, "white": white, "black": black, "moves": moves,
+            "plies": len(moves),
+            "result": RESULTS.get(game.get_game_status(), "*"),
+            "termination": termination, "fen": game.to_fen(),
+            "seconds": time.perf_counter() - start, "pid": os.getpid()}
+
+
+def _play_job(job):
+    """
+    Worker entry point
+    :param job: (game number, keyword arguments of play_game)
+    """
+    number, options = job
+    return play_game(number, **options)
+
+
+def run_selfplay(games, workers=1, white="random", black="random",
+                 max_plies=300, seed=None, node_limit=2000, out=None,
+                 report=print):
+    """
+    Play a batch of games and report games/sec and plies/sec per worker
+    and in total
+    :param games: number of games
+    :param workers: number of worker processes; 1 plays in this process
+    :param seed: seed of game 0; game n uses seed + 2 * n
+    :param out: file the JSON lines are written to as games finish, or None
+    :param report: function called with each report line
+    :return: dict with games, plies, seconds, games_per_sec, plies_per_sec,
+    results, terminations and workers, a dict of pid to games, plies,
+    seconds, games_per_sec and plies_per_sec
+    """
+    options = {"white": white, "black": black, "max_plies": max_plies,
+               "node_limit": node_limit}
+    jobs = []
+    for number in range(games):
+        job_options = dict(options)
+        job_options["seed"] = None if seed is None else seed + 2 * number
+        jobs.append((number, job_options))
+
+    start = time.perf_counter()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        records = pool.imap_unordered(_play_job, jobs)
+    else:
+        records = map(_play_job, jobs)
+
+    plies = 0
+    per_worker = dict()
+    results = dict()
+    terminations = dict()
+    try:
+        for record in records:
+            if out is not None:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+
+            plies += record["plies"]
+            results[record["result"]] = results.get(record["result"], 0) + 1
+            terminations[record["termination"]] = \
+                terminations.get(record["termination"], 0) + 1
+
+            worker = per_worker.setdefault(
+                record["pid"], {"games": 0, "plies": 0, "seconds": 0.0})
+            worker["games"] += 1
+            worker["plies"] += record["plies"]
+            worker["seconds"] += record["seconds"]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    seconds = time.perf_counter() - start
+
+    for pid in sorted(per_worker):
+        worker = per_worker[pid]
+        busy = worker["seconds"]
+        worker["games_per_sec"] = worker["games"] / busy if busy > 0 else 0.0
+        worker["plies_per_sec"] = worker["plies"] / busy if busy > 0 else 0.0
+        report("Worker {} games {} plies {} games/sec {:.2f} plies/sec "
+               "{:.0f}".format(pid, worker["games"], worker["plies"],
+                               worker["games_per_sec"],
+                               worker["plies_per_sec"]))
+
+    games_per_sec = games / seconds if seconds > 0 else 0.0
+    plies_per_sec = plies / seconds if seconds > 0 else 0.0
+    report("Games {} plies {} time {:.3f}s games/sec {:.2f} plies/sec "
+           "{:.0f}".format(games, plies, seconds, games_per_sec,
+                           plies_per_sec))
+    report("Results {} terminations {}".format(
+        json.dumps(results, sort_keys=True),
+        json.dumps(terminations, sort_keys=True)))
+
+    return {"games": games, "plies": plies, "seconds": seconds,
+            "games_per_sec": games_per_sec, "plies_per_sec": plies_per_sec,
+            "results": results, "terminations": terminations,
+            "workers": per_worker}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Headless self-play, one JSON line per game")
+    parser.add_argument("--games", type=int, default=10,
+                        help="number of games")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--white", choices=BOT_TYPES, default="random")
+    parser.add_argument("--black", choices=BOT_TYPES, default="random")
+    parser.add_argument("--max-plies", type=int, default=300,
+                        help="stop unfinished games after this many plies")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random bots")
+    parser.add_argument("--nodes", type=int, default=2000,
+                        help="nodes per move of engine bots")
+    parser.add_argument("--out", default=None,
+                        help="JSON lines file, defaults to standard output")
+    args = parser.parse_args(argv)
+
+    def report(line):
+        print(line, file=sys.stderr)
+
+    out = sys.stdout if args.out is None else open(args.out, "w")
+    try:
+        run_selfplay(args.games, args.workers, args.white, args.black,
+                     args.max_plies, args.seed, args.nodes, out, report)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+from chess import Chess
+from player import Player
+import argparse
+import asyncio
+import concurrent.futures
+import json
+
+###########################################################
+# Game server
+#
+# Hosts many concurrent Chess games behind an asyncio server on a TCP or
+# Unix socket. Clients send one command per line and get one reply per
+# line, "OK <json>" or "ERR <message>"; subscribers also receive
+# "EVENT <json>" lines when a move is made in a game they follow.
+#
+#   NEW [fen]           create a game, reply {"game": id}
+#   MOVE <id> <move>    make a move, example "MOVE 1 e2 e4"
+#   BOARD <id>          FEN of the position
+#   STATUS <id>         side to move, game status and check
+#   MOVES <id>          legal moves of the side to move
+#   SUBSCRIBE <id>      receive an EVENT line after every move
+#   CLOSE <id>          remove a game
+#   QUIT                close the connection
+#
+# Move validation and generation run in an executor so a slow move never
+# stalls the event loop; a lock per game keeps one job per game at a time.
+#
+###########################################################
+
+
+class ProtocolError(Exception):
+    """
+    Command that cannot be carried out, sent back as an ERR line
+    """
+
+
+def game_state(game):
+    """
+    :param game: Chess game
+    :return: dict with turn, status, check and fen
+    """
+    player = game.get_player(game.get_turn())
+    return {"turn": player.get_color(), "status": game.get_game_status(),
+            "check": player.get_in_check(), "fen": game.to_fen()}
+
+
+def apply_move(game, move):
+    """
+    Validate and make a move; runs in the executor
+    :return: game state after the move, or None if the move is illegal
+    """
+    if not game.game_incomplete() or not game.validate_move(move):
+        return None
+    game.make_move(move)
+    game.set_player_turn()
+    return game_state(game)
+
+
+class GameSession:
+    __slots__ = ("game", "lock", "subscribers")
+
+    def __init__(self, game):
+        self.game = game
+        self.lock = asyncio.Lock()
+        self.subscribers = set()
+
+
+class GameServer:
+    def __init__(self, executor=None, max_games=None):
+        """
+        :param executor: executor running the game work, defaults to a
+        thread pool
+        :param max_games: most games hosted at once, None for no limit
+        """
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor()
+        self._executor = executor
+        self._max_games = max_games
+        self._sessions = dict()
+        self._next_id = 1
+        self._server = None
+
+    def get_game_count(self):
+        return len(self._sessions)
+
+    def get_game(self, game_id):
+        return self._sessions[game_id].game
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """
+        Start listening on a TCP port or, when a path is given, a Unix
+        socket
+        :param port: TCP port, 0 picks a free port
+        :return: asyncio Server
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(
+                self.handle_client, path)
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_client, host, port)
+        return self._server
+
+    def get_port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def run_in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def handle_client(self, reader, writer):
+        """
+        Serve one connection until QUIT or end of stream
+        """
+        subscribed = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if not line:
+                    continue
+                if line.upper() == "QUIT":
+                    break
+
+                try:
+                    reply = await self.handle_command(line, writer,
+                                                      subscribed)
+                    writer.write(("OK " + json.dumps(reply) + "\n").encode())
+                except ProtocolError as error:
+                    writer.write(("ERR " + str(error) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in subscribed:
+                session = self._sessions.get(game_id)
+                if session is not None:
+                    session.subscribers.discard(writer)
+            writer.close()
+
+    def get_session(self, args):
+        try:
+            game_id = int(args[0])
+        except (IndexError, ValueError):
+            raise ProtocolError("expected a game id")
+        session = self._sessions.get(game_id)
+        if session is None:
+            raise ProtocolError("no game {}".format(game_id))
+        return game_id, session
+
+    async def handle_command(self, line, writer, subscribed):
+        """
+        :param line: command line without the line end
+        :param writer: StreamWriter of the connection, for subscriptions
+        :param subscribed: ids of the games the connection subscribed to
+        :return: reply dict
+        """
+        command, *args = line.split()
+        command = command.upper()
+
+        if command == "NEW":
+            if self._max_games is not None and \
+                    len(self._sessions) >= self._max_games:
+                raise ProtocolError("too many games")
+            fen = " ".join(args)
+            try:
+                if fen:
+                    game = await self.run_in_executor(Chess.from_fen, fen)
+                else:
+                    game = await self.run_in_executor(
+                        Chess, Player(1, "W"), Player(2, "B"))
+            except ValueError as error:
+                raise ProtocolError(str(error))
+            game_id = self._next_id
+            self._next_id += 1
+            self._sessions[game_id] = GameSession(game)
+            return {"game": game_id}
+
+        game_id, session = self.get_session(args)
+
+        if command == "MOVE":
+            move = " ".join(args[1:])
+            async with session.lock:
+                state = await self.run_in_executor(apply_move, session.game,
+                                                   move)
+            if state is None:
+                raise ProtocolError("illegal move " + move)
+            state["game"] = game_id
+            state["move"] = move
+            self.publish(session, state)
+            return state
+
+        if command == "BOARD":
+            async with session.lock:
+                return {"game": game_id, "fen": session.game.to_fen()}
+
+        if command == "STATUS":
+            async with session.lock:
+                state = game_state(session.game)
+            state["game"] = game_id
+            return state
+
+        if command == "MOVES":
+            async with session.lock:
+                moves = await self.run_in_executor(session.game.legal_moves)
+            return {"game": game_id, "moves": moves}
+
+        if command == "SUBSCRIBE":
+            session.subscribers.add(writer)
+            subscribed.add(game_id)
+            return {"game": game_id}
+
+        if command == "CLOSE":
+            del self._sessions[game_id]
+            return {"game": game_id}
+
+        raise ProtocolError("unknown command " + command)
+
+    def publish(self, session, state):
+        """
+        Send an EVENT line to every subscriber of a game
+        """
+        line = ("EVENT " + json.dumps(state) + "\n").encode()
+        for writer in list(session.subscribers):
+            if writer.is_closing():
+                session.subscribers.discard(writer)
+            else:
+                writer.write(line)
+
+
+async def serve(host="127.0.0.1", port=8765, path=None, max_games=None):
+    server = GameServer(max_games=max_games)
+    listener = await server.start(host, port, path)
+    address = path if path is not None else "{}:{}".format(
+        host, server.get_port())
+    print("Serving on " + address)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None,
+                        help="Unix socket path instead of TCP")
+    parser.add_argument("--max-games", type=int, default=None,
+                        help="most games hosted at once")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.max_games))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,748 @@
+from pieces import KING_TARGETS, KNIGHT_TARGETS, PAWN_CAPTURES, ROOK_RAYS, \
+    BISHOP_RAYS, BETWEEN
+from bitboard import Bitboard, PIECE_NAMES, iter_bits
+import argparse
+import multiprocessing
+import numpy as np
+import os
+import struct
+import time
+
+###########################################################
+# Endgame tablebases
+#
+# Distance to mate tables for endings of up to four pieces, built by
+# retrograde analysis. Every position of an ending is decoded from its
+# index into NumPy arrays of piece squares, so move generation runs over
+# whole arrays of positions at once:
+#
+# 1. Each position counts its legal moves that stay in the ending and
+#    scores its moves that leave it, captures and promotions, from the
+#    smaller tables. Checkmates are lost at ply 0.
+# 2. Working outwards one ply at a time, the positions decided at the
+#    last ply are unmoved to their predecessors. A predecessor of a lost
+#    position is won; a predecessor of a won position loses a move, and
+#    is lost once every move it has leads to a won position.
+#
+# Both passes are split into chunks of positions handed to a process
+# pool. Each table is a file of one signed byte per position, memory
+# mapped for probing, so a probe is one index computation and one read.
+#
+# Value of a position for the side to move:
+#    0       draw, or not a legal position
+#    d > 0   wins, mate in d plies
+#    v < 0   loses, mated in -v - 1 plies
+#
+# Tables ignore castling and en passant; probes return None when either
+# is possible.
+#
+###########################################################
+
+TYPE_ORDER = "KQRBNP"
+TYPE_VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+MAX_PIECES = 4
+CHUNK_SIZE = 1 << 18
+
+TABLE_MAGIC = b"CHSTB001"
+TABLE_HEADER = struct.Struct("<8sB15s")
+
+# Bitboard piece names to type letters
+PIECE_LETTERS = {name: "N" if name == "Knight" else name[0]
+                 for name in PIECE_NAMES}
+
+NO_WIN = 127
+NO_LOSS = -1
+
+
+class TablebaseError(Exception):
+    """
+    Unknown ending or unreadable table file
+    """
+
+
+###########################################################
+# Square tables as NumPy arrays, indexed [from square, to square]
+###########################################################
+
+def _reach_table(targets):
+    table = np.zeros((64, 64), dtype=bool)
+    for square in range(64):
+        table[square, targets[square]] = True
+    return table
+
+
+def _line_table(ray_table):
+    table = np.zeros((64, 64), dtype=bool)
+    for square in range(64):
+        for ray in ray_table[square]:
+            table[square, ray] = True
+    return table
+
+
+KING_REACH = _reach_table(KING_TARGETS)
+KNIGHT_REACH = _reach_table(KNIGHT_TARGETS)
+PAWN_CAPTURE_REACH = [_reach_table(PAWN_CAPTURES["W"]),
+                      _reach_table(PAWN_CAPTURES["B"])]
+ROOK_LINE = _line_table(ROOK_RAYS)
+BISHOP_LINE = _line_table(BISHOP_RAYS)
+SLIDER_LINES = {"R": ROOK_LINE, "B": BISHOP_LINE,
+                "Q": ROOK_LINE | BISHOP_LINE}
+BETWEEN_MASK = np.array([[sum(1 << square for square in BETWEEN[start][end])
+                          for end in range(64)] for start in range(64)],
+                        dtype=np.uint64)
+PAWN_STEP = [8, -8]
+PAWN_START_RANK = [1, 6]
+
+
+###########################################################
+# Signatures
+###########################################################
+
+def parse_signature(name):
+    """
+    :param name: ending such as "KQvK" or "KPvKP", white pieces first
+    :return: list of (color, type letter), white then black, each side in
+    TYPE_ORDER
+    """
+    sides = name.upper().split("V")
+    if len(sides) != 2:
+        raise TablebaseError("Ending needs two sides: " + name)
+
+    pieces = []
+    for color, letters in enumerate(sides):
+        if letters.count("K") != 1 or \
+                any(letter not in TYPE_ORDER for letter in letters):
+            raise TablebaseError("Bad ending: " + name)
+        pieces += [(color, letter) for letter in
+                   sorted(letters, key=TYPE_ORDER.index)]
+
+    if len(pieces) > MAX_PIECES:
+        raise TablebaseError("Endings have at most {} pieces: {}".format(
+            MAX_PIECES, name))
+    return pieces
+
+
+def signature_name(pieces):
+    sides = ["", ""]
+    for color, letter in sorted(pieces, key=lambda piece: (
+            piece[0], TYPE_ORDER.index(piece[1]))):
+        sides[color] += letter
+    return sides[0] + "v" + sides[1]
+
+
+def canonical(pieces):
+    """
+    Tables are stored with the stronger side as white
+    :return: (canonical name, True if colors must be flipped)
+    """
+    sides = [sorted((TYPE_VALUES[letter] for color, letter in pieces
+                     if color == side), reverse=True) for side in (0, 1)]
+    flipped = sides[1] > sides[0]
+    if flipped:
+        pieces = [(1 - color, letter) for color, letter in pieces]
+    return signature_name(pieces), flipped
+
+
+def sub_endings(pieces):
+    """
+    Endings reached by a capture or a promotion
+    :return: set of canonical names, without the bare kings
+    """
+    names = set()
+    for index, (color, letter) in enumerate(pieces):
+        if letter == "K":
+            continue
+        rest = pieces[:index] + pieces[index + 1:]
+        names.add(canonical(rest)[0])
+        if letter == "P":
+            for promotion in "QRBN":
+                names.add(canonical(rest + [(color, promotion)])[0])
+    names.discard("KvK")
+    return names
+
+
+###########################################################
+# Position arrays
+###########################################################
+
+def decode(count, indices):
+    """
+    :param count: number of pieces
+    :param indices: array of position indices
+    :return: list of square arrays, one per piece
+    """
+    return [(indices >> (6 * (count - 1 - slot))) & 63
+            for slot in range(count)]
+
+
+def encode(squares, side):
+    """
+    :param squares: list of square arrays, one per piece
+    :param side: side to move, 0 white or 1 black
+    :return: array of position indices
+    """
+    index = np.int64(side) << np.int64(6 * len(squares))
+    for slot, square in enumerate(squares):
+        index = index | (square.astype(np.int64) <<
+                         np.int64(6 * (len(squares) - 1 - slot)))
+    return index
+
+
+def bit(square):
+    return np.left_shift(np.uint64(1), np.asarray(square).astype(np.uint64))
+
+
+def occupancy(squares, removed=None):
+    occupied = np.zeros(len(squares[0]), dtype=np.uint64)
+    for slot, square in enumerate(squares):
+        if slot != removed:
+            occupied |= bit(square)
+    return occupied
+
+
+def reaches(letter, color, start, end, occupied):
+    """
+    Whether a piece on start attacks end, for arrays of positions
+    """
+    if letter == "K":
+        return KING_REACH[start, end]
+    if letter == "N":
+        return KNIGHT_REACH[start, end]
+    if letter == "P":
+        return PAWN_CAPTURE_REACH[color][start, end]
+    return SLIDER_LINES[letter][start, end] & \
+        ((BETWEEN_MASK[start, end] & occupied) == 0)
+
+
+def attacked(pieces, squares, target, by_color, occupied, removed=None):
+    """
+    :return: bool array, target square attacked by a color
+    """
+    hit = np.zeros(len(target), dtype=bool)
+    for slot, (color, letter) in enumerate(pieces):
+        if color == by_color and slot != removed:
+            hit |= reaches(letter, color, squares[slot], target, occupied)
+    return hit
+
+
+def is_empty(occupied, square):
+    return (occupied & bit(square)) == 0
+
+
+def legal_positions(pieces, squares, side):
+    """
+    :return: bool array of positions with distinct squares, no pawn on the
+    first or last rank and the side not to move out of check
+    """
+    valid = np.ones(len(squares[0]), dtype=bool)
+    for slot, square in enumerate(squares):
+        for other in range(slot):
+            valid &= square != squares[other]
+        if pieces[slot][1] == "P":
+            rank = square >> 3
+            valid &= (rank != 0) & (rank != 7)
+
+    king = pieces.index((1 - side, "K"))
+    valid &= ~attacked(pieces, squares, squares[king], side,
+                       occupancy(squares))
+    return valid
+
+
+###########################################################
+# Generation
+###########################################################
+
+# Tables read by sub_values, per process
+_worker_tables = None
+
+
+def _init_worker(directory):
+    global _worker_tables
+    _worker_tables = Tablebase(directory)
+
+
+def sub_values(tables, pieces, squares, side):
+    """
+    Values of positions in a smaller ending
+    :param tables: Tablebase holding the smaller endings
+    :param pieces: list of (color, type letter) in any order
+    :param squares: list of square arrays matching pieces
+    :param side: side to move
+    :return: int array of values for the side to move
+    """
+    name, flipped = canonical(pieces)
+    if name == "KvK":
+        return np.zeros(len(squares[0]), dtype=np.int64)
+    if flipped:
+        pieces = [(1 - color, letter) for color, letter in pieces]
+        squares = [square ^ 56 for square in squares]
+        side = 1 - side
+
+    order = sorted(range(len(pieces)), key=lambda slot: (
+        pieces[slot][0], TYPE_ORDER.index(pieces[slot][1])))
+    indices = encode([squares[slot] for slot in order], side)
+    return tables.get_table(name)[indices].astype(np.int64)
+
+
+def pawn_moves(color, start, end, occupied):
+    """
+    Pawn pushes from start to end, for arrays of positions
+    """
+    step = PAWN_STEP[color]
+    moves = (end == start + step) & is_empty(occupied, end)
+    if 0 <= end - step < 64:
+        moves |= (end == start + 2 * step) & \
+            (start >> 3 == PAWN_START_RANK[color]) & \
+            is_empty(occupied, end) & is_empty(occupied, end - step)
+    return moves
+
+
+def analyse_positions(name, side, start, stop, tables):
+    """
+    First pass over positions start to stop of one side to move
+    :return: (valid, moves, exit_win, exit_loss, blocked) arrays; moves
+    counts the legal moves staying in the ending, exit_win is the
+    shortest win and exit_loss the longest loss through captures and
+    promotions, blocked marks positions with a drawn or winning exit
+    """
+    pieces = parse_signature(name)
+    count = len(pieces)
+    indices = np.arange(start, stop, dtype=np.int64)
+    squares = decode(count, indices)
+    occupied = occupancy(squares)
+
+    valid = legal_positions(pieces, squares, side)
+    moves = np.zeros(len(indices), dtype=np.uint8)
+    exit_win = np.full(len(indices), NO_WIN, dtype=np.int64)
+    exit_loss = np.full(len(indices), NO_LOSS, dtype=np.int64)
+    blocked = np.zeros(len(indices), dtype=bool)
+    any_move = np.zeros(len(indices), dtype=bool)
+
+    own_king = pieces.index((side, "K"))
+    enemy_king = pieces.index((1 - side, "K"))
+
+    for slot, (color, letter) in enumerate(pieces):
+        if color != side:
+            continue
+        start_squares = squares[slot]
+
+        for end in range(64):
+            if letter == "P":
+                pushes = pawn_moves(color, start_squares, end, occupied)
+                captures = PAWN_CAPTURE_REACH[color][start_squares, end]
+            else:
+                pushes = captures = reaches(letter, color, start_squares,
+                                            end, occupied)
+
+            targets = valid & (pushes | captures) & \
+                (squares[enemy_king] != end)
+            for other, (other_color, other_letter) in enumerate(pieces):
+                if other_color == side and other != slot:
+                    targets &= squares[other] != end
+            if not targets.any():
+                continue
+
+            moved = list(squares)
+            moved[slot] = np.full(len(indices), end, dtype=np.int64)
+            moved_occupied = (occupied & ~bit(start_squares)) | bit(end)
+            promotes = letter == "P" and end >> 3 in (0, 7)
+
+            # Quiet moves, then one group per captured piece
+            groups = []
+            quiet = targets & pushes
+            for other, (other_color, other_letter) in enumerate(pieces):
+                if other_color != side and other != enemy_king:
+                    taken = targets & captures & (squares[other] == end)
+                    quiet &= ~taken
+                    groups.append((taken, other))
+            groups.append((quiet, None))
+
+            for group, taken in groups:
+                if not group.any():
+                    continue
+                legal = group & ~attacked(pieces, moved, moved[own_king],
+                                          1 - side, moved_occupied, taken)
+                if not legal.any():
+                    continue
+                any_move |= legal
+
+                if taken is None and not promotes:
+                    moves += legal
+                    continue
+
+                rest = [slot_index for slot_index in range(count)
+                        if slot_index != taken]
+                new_letters = "QRBN" if promotes else letter
+                for new_letter in new_letters:
+                    new_pieces = [(color, new_letter) if slot_index == slot
+                                  else pieces[slot_index]
+                                  for slot_index in rest]
+                    new_squares = [moved[slot_index][legal]
+                                   for slot_index in rest]
+                    values = sub_values(tables, new_pieces, new_squares,
+                                        1 - side)
+
+                    # Seen from the side making the move
+                    positions = np.nonzero(legal)[0]
+                    wins = values < 0
+                    np.minimum.at(exit_win, positions[wins], -values[wins])
+                    losses = values > 0
+                    np.maximum.at(exit_loss, positions[losses],
+                                  values[losses] + 1)
+                    blocked[positions[values <= 0]] = True
+
+    # No legal move: checkmate or stalemate
+    in_check = attacked(pieces, squares, squares[own_king], 1 - side,
+                        occupied)
+    stuck = valid & ~any_move
+    exit_loss[stuck & in_check] = 0
+    blocked[stuck & ~in_check] = True
+
+    return valid, moves, exit_win.astype(np.int8), \
+        exit_loss.astype(np.int8), blocked
+
+
+def predecessors(name, side, indices):
+    """
+    Positions one move before, with the other side to move; captures and
+    promotions lead into other endings and are not unmade
+    :param side: side to move in the given positions
+    :param indices: array of position indices
+    :return: array of predecessor indices, one per move
+    """
+    pieces = parse_signature(name)
+    squares = decode(len(pieces), indices)
+    occupied = occupancy(squares)
+    mover = 1 - side
+    king = pieces.index((side, "K"))
+    found = []
+
+    for slot, (color, letter) in enumerate(pieces):
+        if color != mover:
+            continue
+        end_squares = squares[slot]
+
+        for start in range(64):
+            if letter == "P":
+                step = PAWN_STEP[color]
+                if start >> 3 in (0, 7):
+                    continue
+                back = (end_squares == start + step) & \
+                    is_empty(occupied, start)
+                if start >> 3 == PAWN_START_RANK[color]:
+                    back |= (end_squares == start + 2 * step) & \
+                        is_empty(occupied, start) & \
+                        is_empty(occupied, start + step)
+            else:
+                back = reaches(letter, color, end_squares, start,
+                               occupied) & is_empty(occupied, start)
+            if not back.any():
+                continue
+
+            before = [square[back] for square in squares]
+            before[slot] = np.full(len(before[0]), start, dtype=np.int64)
+            before_occupied = occupancy(before)
+            legal = ~attacked(pieces, before, before[king], mover,
+                              before_occupied)
+            found.append(encode([square[legal] for square in before], mover))
+
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(found)
+
+
+def _analyse_job(job):
+    name, side, start, stop = job
+    return analyse_positions(name, side, start, stop, _worker_tables)
+
+
+def _predecessor_job(job):
+    name, side, indices = job
+    return predecessors(name, side, indices)
+
+
+def table_path(directory, name):
+    return os.path.join(directory, name + ".tb")
+
+
+def generate(name, directory, workers=1, out=print):
+    """
+    Build one table and every smaller table it depends on
+    :param name: ending such as "KRvK"
+    :param directory: directory the .tb files are written to
+    :param workers: number of processes
+    :return: path of the table
+    """
+    pieces = parse_signature(name)
+    name, flipped = canonical(pieces)
+    path = table_path(directory, name)
+    if os.path.exists(path):
+        return path
+
+    for sub_name in sorted(sub_endings(parse_signature(name))):
+        generate(sub_name, directory, workers, out)
+
+    os.makedirs(directory, exist_ok=True)
+    start_time = time.perf_counter()
+    count = len(parse_signature(name))
+    half = 1 << (6 * count)
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (directory,))
+        run = pool.map
+    else:
+        _init_worker(directory)
+        run = lambda func, jobs: [func(job) for job in jobs]
+
+    try:
+        jobs = [(name, side, side * half + start,
+                 side * half + min(start + CHUNK_SIZE, half))
+                for side in (0, 1) for start in range(0, half, CHUNK_SIZE)]
+        results = run(_analyse_job, [(job_name, side, start - side * half,
+                                      stop - side * half)
+                                     for job_name, side, start, stop in jobs])
+        valid, moves, exit_win, exit_loss, blocked = [
+            np.concatenate([result[part] for result in results])
+            for part in range(5)]
+
+        values = np.zeros(2 * half, dtype=np.int8)
+        decided = ~valid
+        buckets = dict()
+
+        def add(depth, positions):
+            if len(positions):
+                buckets.setdefault(depth, []).append(positions)
+
+        wins = np.nonzero(valid & (exit_win != NO_WIN))[0]
+        for depth in np.unique(exit_win[wins]):
+            add(int(depth), wins[exit_win[wins] == depth])
+        lost = np.nonzero(valid & (moves == 0) & ~blocked &
+                          (exit_win == NO_WIN) & (exit_loss != NO_LOSS))[0]
+        for depth in np.unique(exit_loss[lost]):
+            add(int(depth), lost[exit_loss[lost] == depth])
+
+        depth = 0
+        while buckets:
+            if depth not in buckets:
+                depth += 1
+                continue
+            if depth > 126:
+                raise TablebaseError("Distance to mate too long for " + name)
+
+            frontier = np.unique(np.concatenate(buckets.pop(depth)))
+            frontier = frontier[~decided[frontier]]
+            decided[frontier] = True
+            values[frontier] = depth if depth % 2 else -depth - 1
+
+            for side in 0, 1:
+                side_frontier = frontier[(frontier >= half) == bool(side)]
+                if not len(side_frontier):
+                    continue
+                chunks = [side_frontier[offset:offset + CHUNK_SIZE]
+                          for offset in range(0, len(side_frontier),
+                                              CHUNK_SIZE)]
+                found = run(_predecessor_job,
+                            [(name, side, chunk) for chunk in chunks])
+                found = np.concatenate(found)
+                found = found[~decided[found]]
+
+                if depth % 2 == 0:
+                    # Predecessors of lost positions are won
+                    add(depth + 1, np.unique(found))
+                else:
+                    found, counts = np.unique(found, return_counts=True)
+                    moves[found] -= counts.astype(np.uint8)
+                    lost = found[(moves[found] == 0) & ~blocked[found]]
+                    loss_depth = np.maximum(depth + 1,
+                                            exit_loss[lost].astype(np.int64))
+                    for loss in np.unique(loss_depth):
+                        add(int(loss), lost[loss_depth == loss])
+            depth += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    write_table(path, name, values)
+    out("{} positions {} wins {} losses {} time {:.1f}s".format(
+        name, int(valid.sum()), int((values > 0).sum()),
+        int((values < 0).sum()), time.perf_counter() - start_time))
+    return path
+
+
+def write_table(path, name, values):
+    count = len(parse_signature(name))
+    with open(path, "wb") as table_file:
+        table_file.write(TABLE_HEADER.pack(TABLE_MAGIC, count,
+                                           name.encode()))
+        values.tofile(table_file)
+
+
+###########################################################
+# Probing
+###########################################################
+
+def describe(value):
+    """
+    :param value: table value
+    :return: ("win", plies), ("loss", plies) or ("draw", 0)
+    """
+    if value > 0:
+        return "win", int(value)
+    if value < 0:
+        return "loss", int(-value - 1)
+    return "draw", 0
+
+
+class Tablebase:
+    def __init__(self, directory):
+        """
+        Tables are mapped from the directory when first probed
+        :param directory: directory of .tb files
+        """
+        self._directory = directory
+        self._tables = dict()
+
+    def get_table(self, name):
+        """
+        :param name: canonical ending name
+        :return: memory mapped array of values
+        """
+        table = self._tables.get(name)
+        if table is None:
+            path = table_path(self._directory, name)
+            if not os.path.exists(path):
+                raise TablebaseError("No table for " + name)
+            count = len(parse_signature(name))
+            size = 2 << (6 * count)
+            if os.path.getsize(path) != TABLE_HEADER.size + size:
+                raise TablebaseError("Bad table file " + path)
+            with open(path, "rb") as table_file:
+                magic, stored_count, stored_name = TABLE_HEADER.unpack(
+                    table_file.read(TABLE_HEADER.size))
+            if magic != TABLE_MAGIC or stored_count != count or \
+                    stored_name.rstrip(b"\0") != name.encode():
+                raise TablebaseError("Bad table file " + path)
+            table = np.memmap(path, dtype=np.int8, mode="r",
+                              offset=TABLE_HEADER.size, shape=(size,))
+            self._tables[name] = table
+        return table
+
+    def has_table(self, name):
+        return os.path.exists(table_path(self._directory, name))
+
+    def probe_pieces(self, pieces, side):
+        """
+        :param pieces: list of (color, type letter, square), color 0 white
+        :param side: side to move, 0 white or 1 black
+        :return: value for the side to move, or None without a table
+        """
+        name, flipped = canonical([(color, letter)
+                                   for color, letter, square in pieces])
+        if name == "KvK":
+            return 0
+        if not self.has_table(name):
+            return None
+        if flipped:
+            pieces = [(1 - color, letter, square ^ 56)
+                      for color, letter, square in pieces]
+            side = 1 - side
+
+        pieces = sorted(pieces, key=lambda piece: (
+            piece[0], TYPE_ORDER.index(piece[1])))
+        index = side << (6 * len(pieces))
+        for slot, (color, letter, square) in enumerate(pieces):
+            index |= square << (6 * (len(pieces) - 1 - slot))
+        return int(self.get_table(name)[index])
+
+    def probe(self, position):
+        """
+        :param position: Bitboard
+        :return: value for the side to move, or None when the position is
+        not covered
+        """
+        occupied = position.get_occupied()
+        if bin(occupied).count("1") > MAX_PIECES or \
+                position.get_castling() or position.ep_hash():
+            return None
+
+        pieces = []
+        for square in iter_bits(occupied):
+            color, piece_type = position.get_piece(square)
+            pieces.append((color, PIECE_LETTERS[PIECE_NAMES[piece_type]],
+                           square))
+        return self.probe_pieces(pieces, position.get_side())
+
+    def probe_game(self, game):
+        """
+        :param game: Chess game
+        :return: value for the player to move, or None
+        """
+        return self.probe(game.get_position())
+
+    def best_move(self, position):
+        """
+        Move keeping the best result: the fastest win, a draw, or the
+        longest loss
+        :param position: Bitboard, left unchanged
+        :return: encoded move, or None when the position is not covered
+        """
+        if self.probe(position) is None:
+            return None
+
+        best_move, best_key = None, None
+        for move in position.legal_moves():
+            position.make_move(move)
+            value = self.probe(position)
+            position.unmake_move()
+            if value is None:
+                continue
+
+            # Rank moves by the opponent's result: lost soonest first,
+            # then drawn, then won latest
+            if value < 0:
+                key = (0, -value)
+            elif value == 0:
+                key = (1, 0)
+            else:
+                key = (2, -value)
+            if best_key is None or key < best_key:
+                best_move, best_key = move, key
+        return best_move
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("generate", help="build tables")
+    build.add_argument("endings", nargs="+", help='endings such as "KRvK"')
+    build.add_argument("--dir", default="tables",
+                       help="directory of the table files")
+    build.add_argument("--workers", type=int, default=os.cpu_count(),
+                       help="number of processes")
+
+    probe = commands.add_parser("probe", help="look up a position")
+    probe.add_argument("fen", help="position in Forsyth-Edwards Notation")
+    probe.add_argument("--dir", default="tables",
+                       help="directory of the table files")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for ending in args.endings:
+            generate(ending, args.dir, args.workers)
+        return 0
+
+    value = Tablebase(args.dir).probe(Bitboard.from_fen(args.fen))
+    if value is None:
+        print("Not in the tablebase")
+        return 1
+    result, plies = describe(value)
+    print("{} in {} plies".format(result, plies) if plies or
+          result != "draw" else result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,34 @@
 import unittest
-from player import Player
+from player import Player, EngineBot
 from board import *
 from chess import Chess
+import perft
+from bitboard import Bitboard, move_name, square_index, square_name, \
+    WHITE, BLACK, KING, QUEEN, ROOK
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from parallel import ParallelSearch
 import logging
+import random
+import pgn
+import footprint
+import selfplay
+import json
+import asyncio
+import server
+import loadgen
+import book
+import tablebase
+import background
+import instrument
+import time
+try:
+    import gui
+except ImportError:
+    gui = None
+import io
+import os
+import gzip
+import tempfile
 logging.basicConfig(level=logging.DEBUG)
 
 DEBUG = False
@@ -18,16 +44,21 @@ class TestPieces(unittest.TestCase):
     ######################################################################
     def empty_board_test(self, piece):
         piece.set_player(1)
+        piece.set_color("W")
         p1 = Player(1, "W")
         p2 = Player(2, "B")
         board = GameBoard(p1, p2)
-        board._game_board = [[None] * 8 for i in range(8)]
-        board._game_board[4][4] = piece
+        board._game_board = [None] * 64
+        board._game_board[piece.get_location()] = piece
         piece.set_possible_moves(board)
-        return piece.get_possible_moves()
+
+        # Compare square names and the paths leading to each target
+        return {square_name(target): [square_name(loc) for loc in
+                                      piece.get_path(target)]
+                for target in piece.get_possible_moves()}
 
     def test_queen(self):
-        queen = Queen("e5")
+        queen = Queen(square_index("e5"))
         actual = self.empty_board_test(queen)
         expected = {
             # South
@@ -53,7 +84,7 @@ class TestPieces(unittest.TestCase):
         self.assertEqual(expected, actual)
 
     def test_king(self):
-        king = King("e5")
+        king = King(square_index("e5"))
         actual = self.empty_board_test(king)
         expected = {
             # South
@@ -76,7 +107,7 @@ class TestPieces(unittest.TestCase):
         self.assertEqual(expected, actual)
 
     def test_rook(self):
-        rook = Rook("e5")
+        rook = Rook(square_index("e5"))
         actual = self.empty_board_test(rook)
         expected = {
             # South
@@ -93,7 +124,7 @@ class TestPieces(unittest.TestCase):
         self.assertEqual(expected, actual)
 
     def test_bishop(self):
-        bishop = Bishop("e5")
+        bishop = Bishop(square_index("e5"))
         actual = self.empty_board_test(bishop)
         expected = {
             # Northeast
@@ -109,7 +140,7 @@ class TestPieces(unittest.TestCase):
         self.assertEqual(expected, actual)
 
     def test_knight(self):
-        knight = Knight("e5")
+        knight = Knight(square_index("e5"))
         actual = self.empty_board_test(knight)
 
         expected = {
@@ -133,8 +164,8 @@ class TestPieces(unittest.TestCase):
         self.assertDictEqual(expected, actual)
 
     def test_pawn_second_move(self):
-        pawn = Pawn("e5")
-        pawn.has_moved()
+        pawn = Pawn(square_index("e5"))
+        pawn.set_has_moved()
         actual = self.empty_board_test(pawn)
 
         expected = {
@@ -145,7 +176,7 @@ class TestPieces(unittest.TestCase):
         self.assertDictEqual(expected, actual)
 
     def test_pawn_first_move(self):
-        pawn = Pawn("e5")
+        pawn = Pawn(square_index("e5"))
         actual = self.empty_board_test(pawn)
         expected = {
             # North
@@ -385,5 +416,1520 @@ class TestPieces(unittest.TestCase):
         self.simulate_moves(true_moves, false_moves, False)
 
 
+class TestIncrementalMoves(unittest.TestCase):
+    ######################################################################
+    #   Incremental move regeneration
+    #
+    #   Every move is checked against a full recompute of all pieces
+    #
+    ######################################################################
+    def setUp(self):
+        import board
+        self._board_module = board
+        board.VERIFY_INCREMENTAL = True
+
+    def tearDown(self):
+        self._board_module.VERIFY_INCREMENTAL = False
+
+    def play_random_game(self, seed, plies):
+        rng = random.Random(seed)
+        chess = Chess(Player(1, "W"), Player(2, "B"))
+
+        for ply in range(plies):
+            player = chess.get_player(chess.get_turn())
+            moves = []
+            for piece in player.get_roster():
+                start_loc = square_name(piece.get_location())
+                for end_loc in piece.get_possible_moves():
+                    moves.append(start_loc + " " + square_name(end_loc))
+            rng.shuffle(moves)
+
+            for move in moves:
+                if chess.validate_move(move):
+                    chess.make_move(move)
+                    chess.set_player_turn()
+                    break
+            else:
+                break
+
+            if not chess.game_incomplete():
+                break
+
+    def test_random_games_match_full_recompute(self):
+        for seed in range(4):
+            self.play_random_game(seed, 40)
+
+    def test_castling_matches_full_recompute(self):
+        moves = ["g1 f3", "g8 f6", "g2 g3", "g7 g6", "f1 g2", "f8 g7",
+                 "e1 g1", "e8 g8"]
+        chess = Chess(Player(1, "W"), Player(2, "B"))
+        for move in moves:
+            self.assertTrue(chess.validate_move(move))
+            chess.make_move(move)
+            chess.set_player_turn()
+
+
+class TestMakeUnmake(unittest.TestCase):
+    ######################################################################
+    #   Reversible moves
+    #
+    #   Making and unmaking a move must restore the exact game state
+    #
+    ######################################################################
+    def snapshot(self, chess):
+        board = []
+        for piece in chess.get_board():
+            if piece is None:
+                board.append(None)
+            else:
+                board.append((piece, piece.get_location(),
+                              piece.has_moved(),
+                              set(piece.get_possible_moves())))
+        players = []
+        for player in chess.get_player(1), chess.get_player(2):
+            roster = player.get_roster()
+            # Every piece knows its place in the roster
+            self.assertEqual(list(range(len(roster))),
+                             [piece.get_roster_index() for piece in roster])
+            players.append((list(roster),
+                            list(player.get_captured_pieces()),
+                            player.get_in_check()))
+        en_passant = chess.get_game_board().get_en_passant_state()
+        return board, players, en_passant, chess.get_game_status()
+
+    def make_and_unmake(self, chess, move):
+        before = self.snapshot(chess)
+        self.assertTrue(chess.validate_move(move))
+        chess.make_move(move)
+        chess.unmake_move()
+        self.assertEqual(before, self.snapshot(chess))
+
+    def play(self, moves):
+        chess = Chess(Player(1, "W"), Player(2, "B"))
+        for move in moves:
+            self.assertTrue(chess.validate_move(move))
+            chess.make_move(move)
+            chess.set_player_turn()
+        return chess
+
+    def test_unmake_capture(self):
+        chess = self.play(["e2 e4", "d7 d5"])
+        self.make_and_unmake(chess, "e4 d5")
+
+    def test_unmake_castle(self):
+        chess = self.play(["g1 f3", "g8 f6", "g2 g3", "g7 g6", "f1 g2",
+                           "f8 g7"])
+        self.make_and_unmake(chess, "e1 g1")
+
+    def test_unmake_checkmate(self):
+        chess = self.play(["e2 e3", "f7 f6", "c2 c3", "g7 g5"])
+        self.make_and_unmake(chess, "d1 h5")
+        self.assertEqual("INCOMPLETE", chess.get_game_status())
+
+    def test_capture_keeps_roster_indexes(self):
+        chess = self.play(["e2 e4", "d7 d5", "e4 d5", "d8 d5", "b1 c3"])
+        self.make_and_unmake(chess, "d5 a2")
+        pawn = chess.get_board_location("a2")
+        self.assertTrue(chess.validate_move("d5 a2"))
+        chess.make_move("d5 a2")
+        self.snapshot(chess)
+        self.assertNotIn(pawn, chess.get_player(1).get_roster())
+        self.assertIs(pawn, chess.get_player(1).get_captured_pieces()[-1])
+
+    def test_unmake_restores_en_passant_state(self):
+        chess = self.play(["e2 e4", "a7 a6", "e4 e5"])
+        self.make_and_unmake(chess, "f7 f5")
+
+    def test_validate_move_leaves_game_unchanged(self):
+        chess = self.play(["d2 d4", "e7 e5", "f2 f3", "f8 b4"])
+        before = self.snapshot(chess)
+        self.assertFalse(chess.validate_move("f3 f4"))
+        self.assertEqual(before, self.snapshot(chess))
+
+
+class TestPerft(unittest.TestCase):
+    ######################################################################
+    #   Perft
+    #
+    #   Leaf node counts compared to published results
+    #
+    ######################################################################
+    def test_start_position(self):
+        for color in "W", "B":
+            game = perft.new_game(p1_color=color)
+            for depth in 1, 2:
+                expected = perft.PERFT_RESULTS["startpos"][depth]
+                self.assertEqual(expected, perft.perft(game, depth))
+
+    def test_start_position_depth_3(self):
+        game = perft.new_game()
+        self.assertEqual(8902, perft.perft(game, 3))
+
+    def test_divide_sums_to_perft(self):
+        game = perft.new_game(["e2 e4", "d7 d5"])
+        results = perft.divide(game, 2)
+        self.assertEqual(perft.perft(game, 2), sum(results.values()))
+        self.assertEqual(len(game.legal_moves()), len(results))
+
+    def test_en_passant(self):
+        game = perft.new_game(["e2 e4", "a7 a6", "e4 e5", "f7 f5"])
+        self.assertIn("e5 f6", game.legal_moves())
+        self.assertTrue(game.validate_move("e5 f6"))
+        game.make_move("e5 f6")
+        self.assertIsNone(game.get_board_location("f5"))
+
+    def test_cannot_castle_through_check(self):
+        game = perft.new_game(["e2 e3", "b7 b6", "g1 f3", "c8 a6", "g2 g3",
+                               "h7 h5", "f1 h3", "h5 h4"])
+        self.assertNotIn("e1 g1", game.legal_moves())
+        game.make_move("f3 g5")
+        game.set_player_turn()
+        game.make_move("a6 b7")
+        game.set_player_turn()
+        self.assertIn("e1 g1", game.legal_moves())
+
+    def test_pawn_single_step_after_first_move(self):
+        game = perft.new_game(["e2 e3", "e7 e6"])
+        self.assertFalse(game.validate_move("e3 e5"))
+
+
+class TestBitboard(unittest.TestCase):
+    ######################################################################
+    #   Bitboard backend
+    #
+    #   Compared to published perft results and to the GameBoard rules
+    #
+    ######################################################################
+    def test_start_position_perft(self):
+        position = Bitboard()
+        for depth in 1, 2, 3:
+            expected = perft.PERFT_RESULTS["startpos"][depth]
+            self.assertEqual(expected, position.perft(depth))
+
+    def test_unmake_restores_position(self):
+        position = Bitboard()
+        before = position.get_placement()
+        for move in position.legal_moves():
+            position.make_move(move)
+            position.unmake_move()
+            self.assertEqual(before, position.get_placement())
+
+    def test_legal_moves_match_game_board(self):
+        rng = random.Random(7)
+        for color in "W", "B":
+            game = perft.new_game(p1_color=color)
+            for ply in range(30):
+                expected = sorted(game.legal_moves())
+                position = perft.game_position(game)
+                actual = sorted(move_name(move)
+                                for move in position.legal_moves())
+                self.assertEqual(expected, actual)
+                if not expected:
+                    break
+
+                move = rng.choice(expected)
+                self.assertTrue(game.validate_move(move))
+                game.make_move(move)
+                game.set_player_turn()
+
+                rebuilt = perft.game_position(game)
+                self.assertEqual(rebuilt.get_placement(),
+                                 game.get_position().get_placement())
+
+    def test_legal_moves_match_filtered_pseudo_legal(self):
+        rng = random.Random(11)
+        for name in "kiwipete", "position3", "position4", "position5":
+            position = Bitboard.from_fen(perft.PERFT_POSITIONS[name])
+            for ply in range(40):
+                side = position.get_side()
+                expected = []
+                for move in position.pseudo_legal_moves():
+                    position.make_move(move)
+                    if not position.in_check(side):
+                        expected.append(move)
+                    position.unmake_move()
+                moves = position.legal_moves()
+                self.assertEqual(sorted(expected), sorted(moves))
+                if not moves:
+                    break
+                position.make_move(rng.choice(moves))
+
+    def test_pins_and_checks(self):
+        # The rook is pinned on the e-file and cannot block the bishop
+        position = Bitboard.from_fen("4r1k1/8/8/8/1b6/8/4R3/4K3 w - - 0 1")
+        pin_ray = 0
+        for name in "e2", "e3", "e4", "e5", "e6", "e7", "e8":
+            pin_ray |= 1 << square_index(name)
+        self.assertEqual({square_index("e2"): pin_ray},
+                         position.pins(square_index("e1")))
+        self.assertEqual(["e1 d1", "e1 f1", "e1 f2"],
+                         sorted(move_name(move)
+                                for move in position.legal_moves()))
+
+
+class TestRepetition(unittest.TestCase):
+    ######################################################################
+    #   Zobrist keys and threefold repetition
+    #
+    ######################################################################
+    shuffle = ["g1 f3", "g8 f6", "f3 g1", "f6 g8"]
+
+    def test_hash_matches_after_transposition(self):
+        game_1 = perft.new_game(["e2 e4", "e7 e5", "g1 f3"])
+        game_2 = perft.new_game(["g1 f3", "e7 e5", "e2 e4"])
+        self.assertEqual(game_1.get_hash(), game_2.get_hash())
+        self.assertEqual(game_1.get_position().compute_hash(),
+                         game_1.get_hash())
+
+    def test_hash_includes_side_to_move(self):
+        game_1 = perft.new_game(["e2 e3", "e7 e6", "e3 e4"])
+        game_2 = perft.new_game(["e2 e4", "e7 e6"])
+        self.assertNotEqual(game_1.get_hash(), game_2.get_hash())
+
+    def test_threefold_repetition(self):
+        game = perft.new_game(self.shuffle)
+        self.assertEqual(2, game.get_repetition_count())
+        self.assertTrue(game.game_incomplete())
+
+        for move in self.shuffle:
+            self.assertTrue(game.validate_move(move))
+            game.make_move(move)
+            game.set_player_turn()
+
+        self.assertEqual(3, game.get_repetition_count())
+        self.assertEqual("Draw", game.get_game_status())
+
+        game.set_player_turn()
+        game.unmake_move()
+        self.assertTrue(game.game_incomplete())
+        self.assertEqual(2, game.get_repetition_count())
+
+
+class TestEngineBot(unittest.TestCase):
+    ######################################################################
+    #   Engine bot
+    #
+    ######################################################################
+    def test_finds_mate_in_one(self):
+        game = perft.new_game(["e2 e3", "f7 f6", "c2 c3", "g7 g5"])
+        bot = EngineBot(1, "W", time_limit=None, max_depth=2)
+        move = bot.get_move(game)
+        self.assertEqual("d1 h5", move)
+        self.assertTrue(game.validate_move(move))
+
+    def test_search_info_and_node_limit(self):
+        game = perft.new_game(["e2 e4", "d7 d5"])
+        bot = EngineBot(1, "W", time_limit=None, node_limit=2048)
+        bot.set_game(game)
+        move = bot.get_move()
+        self.assertIn(move, game.legal_moves())
+
+        info = bot.get_search_info()
+        self.assertEqual(move, info["move"])
+        self.assertGreaterEqual(info["depth"], 1)
+        self.assertLessEqual(info["nodes"], 2048)
+        self.assertGreater(info["nps"], 0)
+
+    def test_engine_game_plays_legal_moves(self):
+        game = Chess(EngineBot(1, "W", node_limit=500),
+                     EngineBot(2, "B", node_limit=500))
+        for ply in range(6):
+            move = game.get_player(game.get_turn()).get_move(game)
+            self.assertTrue(game.validate_move(move))
+            game.make_move(move)
+            game.set_player_turn()
+
+    def test_promotion(self):
+        game = perft.new_game(["a2 a4", "b7 b5", "a4 b5", "a7 a6", "b5 a6",
+                               "c8 b7", "a6 b7", "b8 c6"])
+        self.assertIn("b7 a8n", game.legal_moves())
+        self.assertFalse(game.validate_move("b7 a8x"))
+        self.assertTrue(game.validate_move("b7 a8n"))
+        game.make_move("b7 a8n")
+        self.assertEqual("Knight", game.get_board_location("a8").get_name())
+        self.assertEqual(game.get_position().compute_hash(), game.get_hash())
+
+        game.unmake_move()
+        self.assertEqual("Pawn", game.get_board_location("b7").get_name())
+        self.assertEqual("Rook", game.get_board_location("a8").get_name())
+        self.assertEqual(perft.game_position(game).perft(2),
+                         perft.perft(game, 2))
+
+
+class TestTranspositionTable(unittest.TestCase):
+    ######################################################################
+    #   Transposition table
+    #
+    ######################################################################
+    def test_store_and_probe(self):
+        table = TranspositionTable(1)
+        table.store(12345, 4, -250, LOWER, 777)
+        self.assertEqual((4, -250, LOWER, 777), table.probe(12345))
+        self.assertIsNone(table.probe(54321))
+        stats = table.get_stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(1, stats["misses"])
+
+    def test_memory_cap(self):
+        table = TranspositionTable(1)
+        self.assertLessEqual(table.get_memory_bytes(), 1024 * 1024)
+        self.assertEqual(1024 * 1024 // 16, table.get_size())
+
+    def test_depth_preferred_replacement(self):
+        table = TranspositionTable(1)
+        buckets = table.get_size() // 2
+        deep, shallow, newer = 5, 5 + buckets, 5 + 2 * buckets
+
+        table.store(deep, 8, 10, EXACT, 1)
+        table.store(shallow, 2, 20, EXACT, 2)
+        table.store(newer, 3, 30, EXACT, 3)
+
+        # The deep entry survives, the always-replace slot holds the newest
+        self.assertEqual((8, 10, EXACT, 1), table.probe(deep))
+        self.assertEqual((3, 30, EXACT, 3), table.probe(newer))
+        self.assertIsNone(table.probe(shallow))
+        self.assertEqual(1, table.get_stats()["collisions"])
+
+        table.store(shallow, 9, 40, UPPER, 4)
+        self.assertEqual((9, 40, UPPER, 4), table.probe(shallow))
+        self.assertEqual((8, 10, EXACT, 1), table.probe(deep))
+
+    def test_search_with_table(self):
+        game = perft.new_game(["e2 e3", "f7 f6", "c2 c3", "g7 g5"])
+        bot = EngineBot(1, "W", time_limit=None, max_depth=3, hash_mb=1)
+        self.assertEqual("d1 h5", bot.get_move(game))
+        self.assertGreater(bot.get_search_info()["table"]["stores"], 0)
+
+
+class TestParallelSearch(unittest.TestCase):
+    ######################################################################
+    #   Parallel root splitting search
+    #
+    ######################################################################
+    def test_finds_mate_with_workers(self):
+        game = perft.new_game(["e2 e3", "f7 f6", "c2 c3", "g7 g5"])
+        bot = EngineBot(1, "W", time_limit=None, max_depth=2, hash_mb=1,
+                        workers=2)
+        try:
+            self.assertEqual("d1 h5", bot.get_move(game))
+            info = bot.get_search_info()
+            self.assertEqual(2, info["workers"])
+            self.assertGreater(info["nodes"], 0)
+        finally:
+            bot.close()
+
+    def test_workers_share_table(self):
+        with ParallelSearch(2, hash_mb=1) as search:
+            move = search.search(Bitboard(), max_depth=3)
+            self.assertIsNotNone(move)
+            self.assertEqual(3, search.get_info()["depth"])
+            table = search.get_table()
+            self.assertGreater(table.fill(table.get_size()), 0)
+
+
+class TestFen(unittest.TestCase):
+    ######################################################################
+    #   FEN
+    #
+    #   Loading and saving positions in Forsyth-Edwards Notation
+    #
+    ######################################################################
+    def test_round_trip(self):
+        for fen in perft.PERFT_POSITIONS.values():
+            self.assertEqual(fen, Chess.from_fen(fen).to_fen())
+            self.assertEqual(fen, Bitboard.from_fen(fen).to_fen())
+
+    def test_start_position_matches_set_up_board(self):
+        game = Chess.from_fen(perft.PERFT_POSITIONS["startpos"])
+        self.assertEqual(perft.new_game().get_hash(), game.get_hash())
+        self.assertEqual(perft.PERFT_POSITIONS["startpos"],
+                         perft.new_game().to_fen())
+
+    def test_perft_positions(self):
+        for name in "kiwipete", "position3", "position4", "position5":
+            for color in "W", "B":
+                game = perft.new_game(p1_color=color,
+                                      fen=perft.PERFT_POSITIONS[name])
+                for depth in 1, 2:
+                    self.assertEqual(perft.PERFT_RESULTS[name][depth],
+                                     perft.perft(game, depth))
+
+    def test_side_to_move(self):
+        game = Chess.from_fen("4k3/8/8/8/8/8/4P3/4K3 b - - 0 1")
+        self.assertEqual(2, game.get_turn())
+        self.assertTrue(game.validate_move("e8 d8"))
+
+    def test_en_passant(self):
+        game = Chess.from_fen(
+            "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3")
+        self.assertIn("e5 f6", game.legal_moves())
+        self.assertNotIn("e5 d6", game.legal_moves())
+
+    def test_castling_rights(self):
+        game = Chess.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w Kq - 0 1")
+        moves = game.legal_moves()
+        self.assertIn("e1 g1", moves)
+        self.assertNotIn("e1 c1", moves)
+
+    def test_castling_rights_need_king_and_rook(self):
+        fen = "4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1"
+        position = Bitboard.from_fen(fen)
+        self.assertEqual(0, position.get_castling())
+        self.assertEqual("4k3/8/8/8/8/8/8/4K3 w - - 0 1", position.to_fen())
+        self.assertNotIn("e1 c1", [move_name(move)
+                                   for move in position.legal_moves()])
+        self.assertEqual(sorted(Chess.from_fen(fen).legal_moves()),
+                         sorted(move_name(move)
+                                for move in position.legal_moves()))
+        # Only the right whose rook is home is kept
+        self.assertEqual("r3k3/8/8/8/8/8/8/4K2R w Kq - 0 1",
+                         Bitboard.from_fen(
+                             "r3k3/8/8/8/8/8/8/4K2R w KQkq - 0 1").to_fen())
+
+    def test_side_not_to_move_in_check(self):
+        with self.assertRaises(ValueError):
+            Bitboard.from_fen("4k2R/8/8/8/8/8/8/4K3 w - - 0 1")
+        with self.assertRaises(ValueError):
+            Chess.from_fen("4k3/4R3/8/8/8/8/8/4K3 w - - 0 1")
+        Bitboard.from_fen("4k3/4R3/8/8/8/8/8/4K3 b - - 0 1")
+
+    def test_en_passant_square_needs_double_step(self):
+        # No white pawn in front of the square
+        with self.assertRaises(ValueError):
+            Chess.from_fen("4k3/8/8/8/3p4/8/8/4K3 b - e3 0 1")
+        # Rank of the wrong side to move
+        with self.assertRaises(ValueError):
+            Bitboard.from_fen("4k3/8/8/8/3pP3/8/8/4K3 w - e3 0 1")
+        # Square behind the pawn taken
+        with self.assertRaises(ValueError):
+            Bitboard.from_fen("4k3/8/8/8/3pP3/8/4N3/4K3 b - e3 0 1")
+        fen = "4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1"
+        position = Bitboard.from_fen(fen)
+        self.assertEqual(fen, position.to_fen())
+        self.assertIn("d4 e3", [move_name(move)
+                                for move in position.legal_moves()])
+        self.assertIn("d4 e3", Chess.from_fen(fen).legal_moves())
+
+    def test_clocks_after_moves(self):
+        game = perft.new_game(["g1 f3", "g8 f6", "e2 e4"])
+        self.assertEqual(
+            "rnbqkb1r/pppppppp/5n2/8/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq e3 0 2",
+            game.to_fen())
+        game = perft.new_game(["g1 f3", "g8 f6"])
+        self.assertTrue(game.to_fen().endswith(" w KQkq - 2 2"))
+
+
+class TestPgn(unittest.TestCase):
+    ######################################################################
+    #   PGN
+    #
+    #   Streaming games and replaying SAN moves
+    #
+    ######################################################################
+    GAMES = '\n'.join([
+        '[Event "Ruy Lopez"]',
+        '[Result "1-0"]',
+        '',
+        '1. e4 e5 2. Nf3 Nc6 {comment} 3. Bb5 a6 (3... Nf6 4. O-O) 4. Ba4',
+        'Nf6 5. O-O Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O 9. h3 Nb8 10. d4 Nbd7',
+        '$1 1-0',
+        '',
+        '[Event "Promotion"]',
+        '[FEN "8/P7/8/8/8/8/8/k6K w - - 0 1"]',
+        '[Result "*"]',
+        '',
+        '1. a8=Q+ Kb2 *',
+        '',
+        '[Event "Illegal"]',
+        '[Result "*"]',
+        '',
+        '1. e4 e5 2. Ke3 *',
+        ''])
+
+    def test_read_games(self):
+        games = list(pgn.read_games(io.StringIO(self.GAMES)))
+        self.assertEqual(3, len(games))
+        self.assertEqual("Ruy Lopez", games[0][0]["Event"])
+        moves, result = pgn.parse_movetext(games[0][1])
+        self.assertEqual(20, len(moves))
+        self.assertEqual("Nbd7", moves[-1])
+        self.assertEqual("1-0", result)
+
+    def test_line_comment(self):
+        lines = ['[Result "*"]', '', '1. e4 ; comment', 'e5 2. Nf3 Nc6 *']
+        games = list(pgn.read_games(lines))
+        self.assertEqual((["e4", "e5", "Nf3", "Nc6"], "*"),
+                         pgn.parse_movetext(games[0][1]))
+
+    def test_games_without_moves(self):
+        lines = ['[FEN "4k3/8/8/8/8/8/8/4K3 w - - 0 1"]', '[Result "*"]', '',
+                 '[Result "1/2-1/2"]', '',
+                 '[Result "1-0"]', '', '1. e4 e5 1-0']
+        games = list(pgn.read_games(lines))
+        self.assertEqual(3, len(games))
+        self.assertEqual({"FEN": "4k3/8/8/8/8/8/8/4K3 w - - 0 1",
+                          "Result": "*"}, games[0][0])
+        self.assertEqual(({"Result": "1/2-1/2"}, ""), games[1])
+        self.assertEqual({"Result": "1-0"}, games[2][0])
+        self.assertEqual((["e4", "e5"], "1-0"),
+                         pgn.parse_movetext(games[2][1]))
+
+    def test_san_to_move(self):
+        game = perft.new_game(["e2 e4", "d7 d5"])
+        self.assertEqual("e4 d5", pgn.san_to_move(game, "exd5"))
+        self.assertEqual("g1 f3", pgn.san_to_move(game, "Nf3"))
+        self.assertRaises(pgn.PgnError, pgn.san_to_move, game, "Nd2")
+        self.assertRaises(pgn.PgnError, pgn.san_to_move, game, "Zz9")
+
+    def test_replay_games(self):
+        records = list(pgn.replay_games(io.StringIO(self.GAMES)))
+        self.assertEqual([20, 2, 2], [record["plies"] for record in records])
+        self.assertEqual("e1 g1", records[0]["moves"][8])
+        self.assertEqual("a7 a8q", records[1]["moves"][0])
+        self.assertIsNone(records[0]["error"])
+        self.assertIn("Ke3", records[2]["error"])
+
+    def test_gzip_positions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "games.pgn.gz")
+            with gzip.open(path, "wt") as file:
+                file.write(self.GAMES)
+            with pgn.open_pgn(path) as lines:
+                positions = list(pgn.iter_positions(lines))
+        self.assertEqual(24, len(positions))
+        self.assertEqual((2, 1, "Q7/8/8/8/8/8/8/k6K b - - 0 1"),
+                         positions[20])
+
+    def test_throughput(self):
+        result = pgn.run_replay(io.StringIO(self.GAMES), out=lambda line: None)
+        self.assertEqual(3, result["games"])
+        self.assertEqual(1, result["errors"])
+        self.assertGreater(result["plies_per_sec"], 0)
+
+
+class TestMoveTables(unittest.TestCase):
+    ######################################################################
+    #   Move tables
+    #
+    #   Precomputed targets compared to the bitboard attack masks
+    #
+    ######################################################################
+    def mask(self, squares):
+        bits = 0
+        for square in squares:
+            bits |= 1 << square
+        return bits
+
+    def test_step_targets_match_bitboard(self):
+        import bitboard
+        for square in range(64):
+            self.assertEqual(bitboard.KNIGHT_ATTACKS[square],
+                             self.mask(KNIGHT_TARGETS[square]))
+            self.assertEqual(bitboard.KING_ATTACKS[square],
+                             self.mask(KING_TARGETS[square]))
+            self.assertEqual(bitboard.PAWN_ATTACKS[0][square],
+                             self.mask(PAWN_CAPTURES["W"][square]))
+            self.assertEqual(bitboard.PAWN_ATTACKS[1][square],
+                             self.mask(PAWN_CAPTURES["B"][square]))
+
+    def test_rays(self):
+        a1 = square_index("a1")
+        self.assertEqual(["b2", "c3", "d4", "e5", "f6", "g7", "h8"],
+                         [square_name(square)
+                          for square in DIRECTION_RAYS[(1, 1)][a1]])
+        self.assertEqual(2, len(ROOK_RAYS[a1]))
+        self.assertEqual(3, len(QUEEN_RAYS[a1]))
+        self.assertEqual(27, sum(len(ray) for ray in
+                                 QUEEN_RAYS[square_index("e5")]))
+        self.assertEqual([square_index("e3"), square_index("e4")],
+                         PAWN_PUSHES["W"][square_index("e2")])
+
+    def test_between(self):
+        a1, h8, e1 = square_index("a1"), square_index("h8"), square_index("e1")
+        self.assertEqual(["b2", "c3", "d4", "e5", "f6", "g7"],
+                         [square_name(square) for square in BETWEEN[a1][h8]])
+        self.assertEqual(BETWEEN[h8][a1], BETWEEN[a1][h8][::-1])
+        self.assertEqual([], BETWEEN[a1][square_index("b3")])
+        self.assertEqual([], BETWEEN[e1][square_index("f1")])
+
+    def test_check_along_path(self):
+        # The g7 pawn blocks the queen's diagonal, so the check is not mate
+        game = perft.new_game(["e2 e4", "f7 f6", "d2 d4", "e7 e5", "d1 h5"])
+        self.assertEqual("INCOMPLETE", game.get_game_status())
+        self.assertTrue(game.validate_move("g7 g6"))
+
+        # With g7 gone nothing can block
+        game = perft.new_game(["e2 e4", "f7 f6", "d2 d4"])
+        self.assertTrue(game.validate_move("g7 g5"))
+        game.make_move("g7 g5")
+        game.set_player_turn()
+        queen = game.get_board_location("d1")
+        self.assertIsInstance(queen.get_possible_moves(), set)
+        self.assertEqual([square_index(loc) for loc in ("e2", "f3", "g4",
+                                                        "h5")],
+                         queen.get_path(square_index("h5")))
+        game.make_move("d1 h5")
+        self.assertEqual("Player 1 Wins", game.get_game_status())
+
+    def test_build_time(self):
+        self.assertLess(TABLE_BUILD_SECONDS, 0.1)
+
+
+class TestFootprint(unittest.TestCase):
+    ######################################################################
+    #   Memory footprint
+    #
+    #   Slotted pieces and players and the bytes held per game
+    #
+    ######################################################################
+    def test_no_instance_dict(self):
+        for piece in Pawn(8), Knight(1), Bishop(2), Rook(0), Queen(3), \
+                King(4):
+            self.assertFalse(hasattr(piece, "__dict__"))
+        self.assertFalse(hasattr(Player(1, "W"), "__dict__"))
+        self.assertFalse(hasattr(EngineBot(1, "W", hash_mb=0), "__dict__"))
+
+    def test_move_tables_shared(self):
+        game = perft.new_game()
+        white_pawns = [game.get_board_location(col + "2") for col in "abc"]
+        self.assertIs(white_pawns[0]._ray_table, white_pawns[1]._ray_table)
+        self.assertEqual("Pawn", white_pawns[2].get_name())
+        self.assertEqual(os.path.join("Assets", "W_Pawn.PNG"),
+                         white_pawns[2].get_image_path())
+
+    def test_bytes_per_game(self):
+        size = footprint.bytes_per_game(games=20)
+        self.assertGreater(size, 0)
+        self.assertLess(size, 40000)
+
+
+class TestAttackMaps(unittest.TestCase):
+    ######################################################################
+    #   Attack maps
+    #
+    #   Check, checkmate and stalemate read from the attack maps and the
+    #   legal move count
+    #
+    ######################################################################
+    def test_maps_match_bitboard(self):
+        game = perft.new_game(p1_color="B",
+                              fen=perft.PERFT_POSITIONS["kiwipete"])
+        board = game.get_game_board()
+        position = game.get_position()
+        for square in range(64):
+            # Player 1 plays black
+            for player, color in (1, BLACK), (2, WHITE):
+                self.assertEqual(position.is_attacked(square, color),
+                                 board.is_square_attacked(square, player))
+
+    def test_legal_move_count(self):
+        for name, fen in perft.PERFT_POSITIONS.items():
+            game = perft.new_game(fen=fen)
+            rng = random.Random(name)
+            for ply in range(30):
+                moves = game.legal_moves()
+                self.assertEqual(len(game.get_position().legal_moves()),
+                                 game.legal_move_count())
+                if not moves or not game.game_incomplete():
+                    break
+                move = rng.choice(moves)
+                self.assertTrue(game.validate_move(move))
+                game.make_move(move)
+                game.set_player_turn()
+
+    def test_is_square_attacked(self):
+        game = Chess(Player(1, "W"), Player(2, "B"))
+        self.assertTrue(game.is_square_attacked("f3", 1))
+        self.assertFalse(game.is_square_attacked("e4", 1))
+        self.assertTrue(game.is_square_attacked("f6", 2))
+        self.assertEqual(20, game.legal_move_count())
+
+    def test_checkmate_with_pinned_defender(self):
+        # The knight could capture the rook but is pinned by the bishop
+        game = Chess.from_fen("4R2k/7p/5n1P/8/8/8/1B6/6K1 b - - 0 1")
+        self.assertEqual("CHECKMATE", game.get_player(2).get_in_check())
+        self.assertEqual("Player 1 Wins", game.get_game_status())
+
+    def test_no_castling_out_of_check(self):
+        game = Chess.from_fen("4k3/8/8/8/8/4q3/8/4K2R w K - 0 1")
+        self.assertEqual("CHECK", game.get_player(1).get_in_check())
+        self.assertFalse(game.validate_move("e1 g1"))
+        self.assertTrue(game.validate_move("e1 f1"))
+
+    def test_stalemate(self):
+        game = Chess.from_fen("7k/8/6K1/8/8/8/8/5Q2 w - - 0 1")
+        game.validate_move("f1 f7")
+        game.make_move("f1 f7")
+        self.assertEqual("Draw", game.get_game_status())
+        self.assertFalse(game.get_player(2).get_in_check())
+
+        board = game.get_game_board()
+        self.assertEqual("STALEMATE", ChessRules().check(
+            game.get_player(1), game.get_player(2), board))
+
+    def test_no_draw_with_moves_left(self):
+        game = Chess(Player(1, "W"), Player(2, "B"))
+        board = game.get_game_board()
+        for player, opponent in (1, 2), (2, 1):
+            self.assertFalse(ChessRules().check(game.get_player(opponent),
+                                                game.get_player(player),
+                                                board))
+
+
+class TestLegalMoves(unittest.TestCase):
+    ######################################################################
+    #   Legal move generation
+    #
+    #   Pins, checks, castling, en passant and promotions in one pass
+    #
+    ######################################################################
+    def moves_from(self, game, square):
+        return sorted(move[3:] for move in game.legal_moves()
+                      if move[:2] == square)
+
+    def test_pinned_piece_moves_along_pin(self):
+        game = Chess.from_fen("4k3/8/8/8/8/2b5/3R4/4K3 w - - 0 1")
+        self.assertEqual([], self.moves_from(game, "d2"))
+        game = Chess.from_fen("4k3/4r3/8/8/8/8/4R3/4K3 w - - 0 1")
+        self.assertEqual(["e3", "e4", "e5", "e6", "e7"],
+                         self.moves_from(game, "e2"))
+
+    def test_single_check_capture_or_block(self):
+        game = Chess.from_fen("4k3/8/8/8/8/1N6/8/r3K3 w - - 0 1")
+        self.assertEqual(["a1", "c1"], self.moves_from(game, "b3"))
+        self.assertEqual(["d2", "e2", "f2"], self.moves_from(game, "e1"))
+
+    def test_double_check_king_moves_only(self):
+        game = Chess.from_fen("4k3/8/8/8/1b6/8/8/r3K1N1 w - - 0 1")
+        self.assertEqual([], self.moves_from(game, "g1"))
+        self.assertTrue(all(move[:2] == "e1" for move in game.legal_moves()))
+
+    def test_king_cannot_retreat_along_check(self):
+        game = Chess.from_fen("4k3/8/8/8/8/8/8/r3K3 w - - 0 1")
+        self.assertNotIn("f1", self.moves_from(game, "e1"))
+
+    def test_en_passant_opening_row(self):
+        game = Chess.from_fen("8/8/8/KPp4r/8/8/8/7k w - c6 0 1")
+        self.assertEqual(["b6"], self.moves_from(game, "b5"))
+        game = Chess.from_fen("8/8/8/1Pp4r/8/8/8/K6k w - c6 0 1")
+        self.assertEqual(["b6", "c6"], self.moves_from(game, "b5"))
+        self.assertTrue(game.validate_move("b5 c6"))
+
+    def test_en_passant_captures_checking_pawn(self):
+        game = Chess.from_fen("8/8/8/2pP4/1K6/8/8/7k w - c6 0 1")
+        self.assertIn("c6", self.moves_from(game, "d5"))
+
+    def test_promotions_and_castling(self):
+        game = Chess.from_fen("3k4/1P6/8/8/8/8/8/R3K2R w KQ - 0 1")
+        self.assertEqual(["b8b", "b8n", "b8q", "b8r"],
+                         self.moves_from(game, "b7"))
+        self.assertIn("e1 g1", game.legal_moves())
+        self.assertIn("e1 c1", game.legal_moves())
+        self.assertTrue(game.validate_move("b7 b8"))
+
+    def test_moves_reused_until_position_changes(self):
+        game = Chess(Player(1, "W"), Player(2, "B"))
+        moves = game.get_legal_moves(1)
+        self.assertTrue(game.validate_move("e2 e4"))
+        self.assertIs(moves, game.get_legal_moves(1))
+        game.make_move("e2 e4")
+        game.set_player_turn()
+        self.assertEqual(20, game.legal_move_count())
+        self.assertFalse(game.validate_move("e2 e4"))
+
+    def test_matches_bitboard(self):
+        for name, fen in perft.PERFT_POSITIONS.items():
+            for color in "W", "B":
+                game = perft.new_game(p1_color=color, fen=fen)
+                expected = sorted(move_name(move) for move in
+                                  game.get_position().legal_moves())
+                self.assertEqual(expected, sorted(game.legal_moves()))
+
+
+class TestSelfPlay(unittest.TestCase):
+    ######################################################################
+    #   Self-play
+    #
+    #   Headless bot games streamed as JSON lines
+    #
+    ######################################################################
+    def test_seeded_game_repeats(self):
+        first = selfplay.play_game(0, max_plies=60, seed=5)
+        second = selfplay.play_game(0, max_plies=60, seed=5)
+        self.assertEqual(first["moves"], second["moves"])
+
+    def test_game_replays_legally(self):
+        record = selfplay.play_game(3, max_plies=120, seed=11)
+        self.assertEqual(record["plies"], len(record["moves"]))
+        game = perft.new_game(record["moves"])
+        self.assertEqual(record["fen"], game.to_fen())
+        if record["termination"] == "max plies":
+            self.assertEqual("*", record["result"])
+
+    def test_checkmate_result(self):
+        record = selfplay.play_game(0, "engine", "random", max_plies=120,
+                                    seed=3, node_limit=300)
+        self.assertEqual("checkmate", record["termination"])
+        self.assertEqual("1-0", record["result"])
+
+    def test_json_lines_and_report(self):
+        out = io.StringIO()
+        lines = []
+        summary = selfplay.run_selfplay(4, workers=1, max_plies=40, seed=1,
+                                        out=out, report=lines.append)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([0, 1, 2, 3], sorted(record["game"]
+                                              for record in records))
+        self.assertEqual(summary["plies"],
+                         sum(record["plies"] for record in records))
+        self.assertEqual(1, len(summary["workers"]))
+        self.assertIn("games/sec", lines[-2])
+
+    def test_no_pygame_import(self):
+        import subprocess
+        import sys
+        code = "import selfplay, sys; print('pygame' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(
+                                    os.path.abspath(__file__)))
+        self.assertEqual("False", output.stdout.strip())
+
+
+class TestGameServer(unittest.TestCase):
+    ######################################################################
+    #   Game server
+    #
+    #   Line protocol over a local socket and the load generator
+    #
+    ######################################################################
+    def run_client(self, client):
+        async def run():
+            game_server = server.GameServer()
+            await game_server.start()
+            try:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", game_server.get_port())
+                result = await client(game_server, reader, writer)
+                writer.close()
+                return result
+            finally:
+                await game_server.close()
+        return asyncio.run(run())
+
+    def test_play_to_checkmate(self):
+        async def client(game_server, reader, writer):
+            reply = await loadgen.request(reader, writer, "NEW")
+            game_id = reply["game"]
+            for move in "f2 f3", "e7 e5", "g2 g4":
+                await loadgen.request(reader, writer,
+                                      "MOVE {} {}".format(game_id, move))
+            state = await loadgen.request(reader, writer,
+                                          "MOVE {} d8 h4".format(game_id))
+            status = await loadgen.request(reader, writer,
+                                           "STATUS {}".format(game_id))
+            return state, status, game_server.get_game(game_id)
+
+        state, status, game = self.run_client(client)
+        self.assertEqual("Player 2 Wins", state["status"])
+        self.assertEqual("CHECKMATE", status["check"])
+        self.assertEqual("W", status["turn"])
+        self.assertEqual(game.to_fen(), status["fen"])
+
+    def test_errors(self):
+        async def client(game_server, reader, writer):
+            errors = []
+            await loadgen.request(reader, writer, "NEW")
+            for line in "MOVE 1 e2 e5", "BOARD 7", "FOO 1", "NEW 8/8 w":
+                try:
+                    await loadgen.request(reader, writer, line)
+                except loadgen.ServerError as error:
+                    errors.append(str(error))
+            return errors
+
+        errors = self.run_client(client)
+        self.assertEqual(["illegal move e2 e5", "no game 7",
+                          "unknown command FOO"], errors[:3])
+        self.assertEqual(4, len(errors))
+
+    def test_subscribe(self):
+        async def client(game_server, reader, writer):
+            game_id = (await loadgen.request(reader, writer, "NEW"))["game"]
+            watcher = await asyncio.open_connection(
+                "127.0.0.1", game_server.get_port())
+            await loadgen.request(*watcher, "SUBSCRIBE {}".format(game_id))
+            await loadgen.request(reader, writer,
+                                  "MOVE {} e2 e4".format(game_id))
+            event = await watcher[0].readline()
+            watcher[1].close()
+            return event.decode()
+
+        event = self.run_client(client)
+        self.assertTrue(event.startswith("EVENT "))
+        self.assertEqual("e2 e4", json.loads(event[6:])["move"])
+
+    def test_fen_and_moves(self):
+        async def client(game_server, reader, writer):
+            fen = "4k3/8/8/8/8/8/8/4K2R w K - 0 1"
+            game_id = (await loadgen.request(reader, writer,
+                                             "NEW " + fen))["game"]
+            board = await loadgen.request(reader, writer,
+                                          "BOARD {}".format(game_id))
+            moves = await loadgen.request(reader, writer,
+                                          "MOVES {}".format(game_id))
+            return fen, board, moves
+
+        fen, board, moves = self.run_client(client)
+        self.assertEqual(fen, board["fen"])
+        self.assertIn("e1 g1", moves["moves"])
+
+    def test_load_generator(self):
+        lines = []
+        result = asyncio.run(loadgen.run_local(8, max_plies=10, seed=2,
+                                               out=lines.append))
+        self.assertEqual(80, result["moves"])
+        self.assertLessEqual(result["p50"], result["p99"])
+        self.assertIn("p99", lines[0])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, loadgen.percentile(values, 0.5))
+        self.assertEqual(99, loadgen.percentile(values, 0.99))
+        self.assertEqual(0.0, loadgen.percentile([], 0.5))
+
+
+class TestOpeningBook(unittest.TestCase):
+    ######################################################################
+    #   Opening book
+    #
+    #   Books compiled from PGN, memory mapped and binary searched
+    #
+    ######################################################################
+    GAMES = '\n'.join([
+        '[Result "1-0"]', '', '1. e4 e5 2. Nf3 Nc6 3. Bb5 1-0', '',
+        '[Result "0-1"]', '', '1. e4 c5 2. Nf3 d6 0-1', '',
+        '[Result "1/2-1/2"]', '', '1. d4 d5 2. c4 1/2-1/2', '',
+        '[Result "*"]', '', '1. e4 e5 2. Ke3 *', ''])
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, "test.book")
+        self._result = book.build_book(io.StringIO(self.GAMES), self._path)
+        self._book = book.OpeningBook(self._path)
+
+    def tearDown(self):
+        self._book.close()
+        self._dir.cleanup()
+
+    def test_build(self):
+        self.assertEqual(4, self._result["games"])
+        self.assertEqual(1, self._result["errors"])
+        self.assertEqual(self._result["records"], len(self._book))
+        keys = [self._book.get_record(index)[0]
+                for index in range(len(self._book))]
+        self.assertEqual(sorted(keys), keys)
+
+    def test_lookup(self):
+        start = perft.new_game()
+        self.assertEqual([("e2 e4", 3), ("d2 d4", 1)],
+                         self._book.lookup(start.get_hash()))
+        after_e4 = perft.new_game(["e2 e4"])
+        self.assertEqual([("e7 e5", 2), ("c7 c5", 1)],
+                         self._book.lookup(after_e4.get_hash()))
+        out_of_book = perft.new_game(["a2 a3"])
+        self.assertEqual([], self._book.lookup(out_of_book.get_hash()))
+        self.assertIsNone(self._book.get_move(out_of_book))
+
+    def test_get_move(self):
+        game = perft.new_game()
+        self.assertEqual("e2 e4", self._book.get_move(game))
+        picks = {self._book.get_move(game, random.Random(seed))
+                 for seed in range(40)}
+        self.assertEqual({"e2 e4", "d2 d4"}, picks)
+
+    def test_engine_plays_book_move(self):
+        bot = EngineBot(1, "W", time_limit=None, node_limit=200, hash_mb=0,
+                        book=self._book)
+        game = perft.new_game()
+        self.assertEqual("e2 e4", bot.get_move(game))
+        self.assertTrue(bot.get_search_info()["book"])
+        game = perft.new_game(["a2 a3", "a7 a6"])
+        bot.get_move(game)
+        self.assertNotIn("book", bot.get_search_info())
+
+    def test_shared_mapping(self):
+        with book.OpeningBook(self._path) as other:
+            self.assertEqual(self._book.lookup(perft.new_game().get_hash()),
+                             other.lookup(perft.new_game().get_hash()))
+
+    def test_bad_file(self):
+        path = os.path.join(self._dir.name, "bad.book")
+        with open(path, "wb") as bad_file:
+            bad_file.write(b"not a book at all")
+        self.assertRaises(book.BookError, book.OpeningBook, path)
+        with open(path, "wb") as bad_file:
+            bad_file.write(b"x")
+        self.assertRaises(book.BookError, book.OpeningBook, path)
+
+
+class TestTablebase(unittest.TestCase):
+    ######################################################################
+    #   Endgame tablebases
+    #
+    #   Retrograde distance to mate tables checked against the move
+    #   generator
+    #
+    ######################################################################
+    @classmethod
+    def setUpClass(cls):
+        cls._dir = tempfile.TemporaryDirectory()
+        for ending in "KQvK", "KRvK":
+            tablebase.generate(ending, cls._dir.name, out=lambda text: None)
+        cls._tablebase = tablebase.Tablebase(cls._dir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tablebase = None
+        cls._dir.cleanup()
+
+    def probe_fen(self, fen):
+        return self._tablebase.probe(Bitboard.from_fen(fen))
+
+    def test_signatures(self):
+        self.assertEqual([(0, "K"), (0, "Q"), (1, "K"), (1, "R")],
+                         tablebase.parse_signature("KQvKR"))
+        self.assertEqual(("KQvK", True),
+                         tablebase.canonical(tablebase.parse_signature("KvKQ")))
+        self.assertEqual({"KQvK", "KRvK", "KBvK", "KNvK"},
+                         tablebase.sub_endings(
+                             tablebase.parse_signature("KPvK")))
+        for name in "KQK", "KQvQ", "KQvKRR", "KXvK":
+            with self.assertRaises(tablebase.TablebaseError):
+                tablebase.parse_signature(name)
+
+    def test_longest_mates(self):
+        # Mate in 10 with the queen and in 16 with the rook
+        self.assertEqual(19, self._tablebase.get_table("KQvK").max())
+        self.assertEqual(31, self._tablebase.get_table("KRvK").max())
+
+    def test_probe(self):
+        self.assertEqual(("win", 1), tablebase.describe(
+            self.probe_fen("7k/8/5K2/8/8/8/8/6Q1 w - - 0 1")))
+        self.assertEqual(("loss", 0), tablebase.describe(
+            self.probe_fen("7k/6Q1/5K2/8/8/8/8/8 b - - 0 1")))
+        # Colors flipped
+        self.assertEqual(("loss", 0), tablebase.describe(
+            self.probe_fen("8/8/8/8/8/5k2/6q1/7K w - - 0 1")))
+        # The king takes the unprotected queen
+        self.assertEqual(0, self.probe_fen("6Qk/8/5K2/8/8/8/8/8 b - - 0 1"))
+        self.assertIsNone(self.probe_fen(
+            "4k3/8/8/8/8/8/8/R3K3 w Q - 0 1"))
+        self.assertIsNone(self.probe_fen(
+            "k7/8/8/8/8/8/8/KBB5 w - - 0 1"))
+
+    def test_consistent_with_moves(self):
+        rng = random.Random(3)
+        for ending in "KQvK", "KRvK":
+            checked = 0
+            while checked < 150:
+                squares = rng.sample(range(64), 3)
+                position = Bitboard.empty()
+                position.put_piece(WHITE, KING, squares[0])
+                position.put_piece(WHITE, QUEEN if
+                                   ending == "KQvK" else ROOK,
+                                   squares[1])
+                position.put_piece(BLACK, KING, squares[2])
+                fen = position.to_fen().split()
+                fen[1] = rng.choice("wb")
+                if position.in_check(BLACK if fen[1] == "w" else WHITE):
+                    continue
+                position = Bitboard.from_fen(" ".join(fen))
+                checked += 1
+
+                values = []
+                for move in position.legal_moves():
+                    position.make_move(move)
+                    values.append(self._tablebase.probe(position))
+                    position.unmake_move()
+                if not values:
+                    expected = -1 if position.in_check() else 0
+                elif any(value < 0 for value in values):
+                    expected = min(-value for value in values if value < 0)
+                elif 0 in values:
+                    expected = 0
+                else:
+                    expected = -max(values) - 2
+                self.assertEqual(expected, self._tablebase.probe(position),
+                                 position.to_fen())
+
+    def test_engine_bot(self):
+        game = Chess.from_fen("7k/8/5K2/8/8/8/8/6Q1 w - - 0 1")
+        bot = EngineBot(1, "W", tablebase=self._tablebase)
+        self.assertEqual("g1 g7", bot.get_move(game))
+        self.assertTrue(bot.get_search_info()["tablebase"])
+
+    def test_bad_table_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(tablebase.table_path(directory, "KRvK"), "wb") as file:
+                file.write(b"not a table")
+            with self.assertRaises(tablebase.TablebaseError):
+                tablebase.Tablebase(directory).get_table("KRvK")
+
+
+@unittest.skipIf(gui is None, "pygame is not installed")
+class TestSpriteCache(unittest.TestCase):
+    ######################################################################
+    #   GUI sprite cache
+    #
+    #   Piece images decoded once per asset and scaled once per tile size,
+    #   drawn on the SDL dummy video driver
+    #
+    ######################################################################
+    def setUp(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        self._interface = gui.ChessInterface()
+        self._interface.initialize_game("W", "B")
+
+    def tearDown(self):
+        gui.pg.quit()
+
+    def test_images_decoded_once(self):
+        sprites = self._interface.get_sprite_cache()
+        for frame in range(5):
+            self._interface.set_pieces(None)
+        # Six piece types for each color
+        self.assertEqual(12, sprites.get_load_count())
+        pawn = self._interface._chess.get_board_location("e2")
+        image = sprites.get_tile_image(pawn.get_image_path())
+        self.assertEqual((sprites.get_tile_size(),) * 2, image.get_size())
+
+    def test_captured_pieces(self):
+        sprites = self._interface.get_sprite_cache()
+        pawn = self._interface._chess.get_board_location("e2")
+        for frame in range(3):
+            self._interface.display_captured_pieces(600, 100, [pawn] * 4)
+        self.assertEqual(1, sprites.get_load_count())
+        self.assertEqual((30, 30), sprites.get_capture_image(
+            pawn.get_image_path()).get_size())
+
+    def test_tile_size_change(self):
+        sprites = self._interface.get_sprite_cache()
+        path = self._interface._chess.get_board_location("e2").get_image_path()
+        sprites.get_tile_image(path)
+        sprites.set_tile_size(40)
+        self.assertEqual((40, 40), sprites.get_tile_image(path).get_size())
+        self.assertEqual(1, sprites.get_load_count())
+
+    def test_resolve_asset(self):
+        self.assertTrue(os.path.exists(gui.resolve_asset(
+            os.path.join("Assets", "W_PAWN.PNG"))))
+        missing = os.path.join("Assets", "Missing.png")
+        self.assertEqual(missing, gui.resolve_asset(missing))
+
+
+@unittest.skipIf(gui is None, "pygame is not installed")
+class TestFrameLoop(unittest.TestCase):
+    ######################################################################
+    #   GUI frame loop
+    #
+    #   Frame rate cap and dirty rectangle redraws, measured headless
+    #
+    ######################################################################
+    def setUp(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    def test_idle_frames_not_redrawn(self):
+        stats = gui.benchmark(0.3, fps=100)
+        self.assertGreater(stats["frames"], 5)
+        self.assertEqual(1, stats["redraws"])
+        # Capped near the frame rate
+        self.assertLess(stats["fps"], 130)
+
+    def test_drag_redraws(self):
+        stats = gui.benchmark(0.3, drag=True, fps=100)
+        self.assertGreater(stats["redraws"], 5)
+        self.assertGreaterEqual(stats["cpu_ms_per_frame"], 0)
+
+    def test_move_by_mouse(self):
+        interface = gui.ChessInterface()
+        interface.set_colors(("W", "B"))
+        interface.set_fps(1000)
+        events = [("MOUSEBUTTONDOWN", "e2"), ("MOUSEBUTTONUP", "e4")]
+
+        def post_events(frame):
+            if frame < len(events):
+                event_type, loc = events[frame]
+                gui.pg.event.post(gui.pg.event.Event(
+                    getattr(gui.pg, event_type), button=1,
+                    pos=interface.square_rect(loc).center))
+            else:
+                gui.pg.event.post(gui.pg.event.Event(gui.pg.QUIT))
+
+        interface.set_frame_hook(post_events)
+        self.assertFalse(interface.play_chess())
+        self.assertEqual("Pawn",
+                         interface._chess.get_board_location("e4").get_name())
+        self.assertIsNone(interface._chess.get_board_location("e2"))
+        # The first frame and the move
+        self.assertEqual(2, interface.get_frame_stats()["redraws"])
+        gui.pg.quit()
+
+
+@unittest.skipIf(gui is None, "pygame is not installed")
+class TestTextCache(unittest.TestCase):
+    ######################################################################
+    #   GUI text and side panel caches
+    #
+    #   Fonts looked up and labels rendered once; the side panel composed
+    #   again only when captures or check change
+    #
+    ######################################################################
+    def setUp(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        self._interface = gui.ChessInterface()
+        self._interface.initialize_game("W", "B")
+
+    def tearDown(self):
+        gui.pg.quit()
+
+    def test_render_cached(self):
+        text = self._interface.get_text_cache()
+        first = text.render("Comic Sans MS", 27, "Player 1", "black")
+        self.assertIs(first, text.render("Comic Sans MS", 27, "Player 1",
+                                         "black"))
+        self.assertIsNot(first, text.render("Comic Sans MS", 27, "Player 1",
+                                            "yellow"))
+        self.assertEqual(2, text.get_counts()["renders"])
+
+    def test_panel_recomposed_on_change(self):
+        interface = self._interface
+        text = interface.get_text_cache()
+        interface.player_display()
+        panel = interface.get_panel_surface()
+        counts = dict(text.get_counts())
+        for frame in range(5):
+            interface.player_display()
+        self.assertIs(panel, interface.get_panel_surface())
+        self.assertEqual(counts, text.get_counts())
+
+        game = interface._chess
+        for move in "e2 e4", "d7 d5", "e4 d5":
+            self.assertTrue(game.validate_move(move))
+            game.make_move(move)
+            game.set_player_turn()
+        interface.player_display()
+        self.assertIsNot(panel, interface.get_panel_surface())
+        self.assertEqual(counts["fonts"], text.get_counts()["fonts"])
+
+
+class TestBackgroundEngine(unittest.TestCase):
+    ######################################################################
+    #   Background engine
+    #
+    #   Bot moves computed in a worker thread or process, polled without
+    #   blocking and cancelled on request
+    #
+    ######################################################################
+    def test_engine_move_in_process(self):
+        with background.BackgroundEngine(node_limit=3000) as engine:
+            engine.think(Bitboard())
+            self.assertTrue(engine.is_thinking())
+            move = engine.wait(30)
+            self.assertFalse(engine.is_thinking())
+            self.assertIn(move, perft.new_game().legal_moves())
+            self.assertGreater(engine.get_info()["nodes"], 0)
+
+    def test_random_move_in_thread(self):
+        with background.BackgroundEngine("random", use_process=False,
+                                         seed=1) as engine:
+            engine.think(Bitboard())
+            self.assertIn(engine.wait(10), perft.new_game().legal_moves())
+
+    def test_cancel(self):
+        with background.BackgroundEngine(time_limit=30,
+                                         use_process=False) as engine:
+            engine.think(Bitboard())
+            time.sleep(0.3)
+            self.assertIsNotNone(engine.get_progress())
+            start = time.perf_counter()
+            engine.cancel()
+            self.assertFalse(engine.is_thinking())
+            self.assertIsNone(engine.poll())
+            # A new job replaces the cancelled one
+            engine.think(Bitboard(), [])
+            engine.cancel()
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_progress(self):
+        with background.BackgroundEngine(time_limit=1.0,
+                                         use_process=False) as engine:
+            engine.think(Bitboard())
+            while engine.is_thinking() and \
+                    engine.get_progress()["nodes"] == 0:
+                engine.poll()
+                time.sleep(0.01)
+            self.assertGreater(engine.get_progress()["nps"], 0)
+            engine.wait(30)
+
+    @unittest.skipIf(gui is None, "pygame is not installed")
+    def test_gui_keeps_drawing_while_thinking(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        interface = gui.ChessInterface()
+        interface.set_colors(("W", "B"))
+        interface.set_fps(200)
+        engine = background.BackgroundEngine(time_limit=0.5)
+        interface.set_computer(engine)
+        events = [("MOUSEBUTTONDOWN", "e2"), ("MOUSEBUTTONUP", "e4")]
+        thinking_frames = []
+
+        def post_events(frame):
+            if frame < len(events):
+                event_type, loc = events[frame]
+                gui.pg.event.post(gui.pg.event.Event(
+                    getattr(gui.pg, event_type), button=1,
+                    pos=interface.square_rect(loc).center))
+            elif engine.is_thinking():
+                thinking_frames.append(frame)
+            elif frame > 1000 or interface._chess.get_player_turn() == 1:
+                gui.pg.event.post(gui.pg.event.Event(gui.pg.QUIT))
+
+        interface.set_frame_hook(post_events)
+        try:
+            interface.play_chess()
+        finally:
+            engine.close()
+            gui.pg.quit()
+        self.assertEqual(1, interface._chess.get_player_turn())
+        self.assertIsNone(interface._chess.get_board_location("e2"))
+        # Frames kept coming while the worker searched
+        self.assertGreater(len(thinking_frames), 20)
+
+    @unittest.skipIf(gui is None, "pygame is not installed")
+    def test_gui_rethinks_rejected_move(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+        class StaleEngine:
+            # Answers the first job with a move of another position
+            def __init__(self):
+                self.jobs = 0
+                self.thinking = False
+
+            def think(self, position, history=None):
+                self.jobs += 1
+                self.thinking = True
+
+            def cancel(self):
+                self.thinking = False
+
+            def is_thinking(self):
+                return self.thinking
+
+            def get_progress(self):
+                return {"nodes": 0, "seconds": 0.0, "nps": 0.0}
+
+            def poll(self):
+                self.thinking = False
+                return "e2 e4" if self.jobs == 1 else "e7 e5"
+
+            def close(self):
+                pass
+
+        interface = gui.ChessInterface()
+        interface.set_colors(("W", "B"))
+        interface.set_fps(200)
+        engine = StaleEngine()
+        interface.set_computer(engine)
+        events = [("MOUSEBUTTONDOWN", "d2"), ("MOUSEBUTTONUP", "d4")]
+
+        def post_events(frame):
+            if frame < len(events):
+                event_type, loc = events[frame]
+                gui.pg.event.post(gui.pg.event.Event(
+                    getattr(gui.pg, event_type), button=1,
+                    pos=interface.square_rect(loc).center))
+            elif frame > 100 or interface._chess.get_player_turn() == 1 \
+                    and frame > len(events):
+                gui.pg.event.post(gui.pg.event.Event(gui.pg.QUIT))
+
+        interface.set_frame_hook(post_events)
+        try:
+            interface.play_chess()
+        finally:
+            gui.pg.quit()
+        self.assertEqual(2, engine.jobs)
+        self.assertEqual(1, interface._chess.get_player_turn())
+        self.assertIsNotNone(interface._chess.get_board_location("e5"))
+
+
+class TestInstrumentation(unittest.TestCase):
+    ######################################################################
+    #   Instrumentation
+    #
+    #   Call counters and timers, switched on and off by wrapping methods
+    #
+    ######################################################################
+    def setUp(self):
+        instrument.disable()
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_off_by_default(self):
+        self.assertFalse(instrument.is_enabled())
+        self.assertFalse(hasattr(GameBoard.make_move, "__wrapped__"))
+        game = perft.new_game(["e2 e4", "e7 e5"])
+        self.assertEqual({"enabled": False, "moves": 0, "counters": {}},
+                         game.stats())
+
+    def test_counts_moves(self):
+        instrument.enable()
+        game = perft.new_game(["e2 e4", "e7 e5", "g1 f3"])
+        stats = game.stats()
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(3, stats["moves"])
+        counters = stats["counters"]
+        for name in "GameBoard.make_move", "Chess.make_move", \
+                "ChessRules.check", "ChessRules.legal_moves", \
+                "GamePiece.set_possible_moves":
+            self.assertIn(name, counters)
+        self.assertEqual(3, counters["GameBoard.make_move"]["calls"])
+        summary = counters["Chess.make_move"]
+        self.assertLessEqual(summary["min_us"], summary["p50_us"])
+        self.assertLessEqual(summary["p50_us"], summary["p99_us"])
+        self.assertLessEqual(summary["p99_us"], summary["max_us"])
+        self.assertAlmostEqual(summary["total_ms"] * 1000 / 3,
+                               summary["per_move_us"])
+
+        instrument.disable()
+        self.assertFalse(hasattr(GameBoard.make_move, "__wrapped__"))
+        game.validate_move("b8 c6")
+        game.make_move("b8 c6")
+        self.assertEqual(3, game.stats()["moves"])
+
+    def test_json_export(self):
+        instrument.enable()
+        game = perft.new_game(["d2 d4"])
+        stats = json.loads(instrument.to_json(game.stats()))
+        self.assertEqual(1, stats["moves"])
+        self.assertEqual(1, stats["counters"]["Chess.make_move"]["calls"])
+
+    def test_reset(self):
+        instrument.enable()
+        perft.new_game(["d2 d4"])
+        instrument.reset()
+        self.assertTrue(instrument.is_enabled())
+        self.assertEqual({}, instrument.snapshot())
+        perft.new_game(["d2 d4"])
+        self.assertEqual(1, instrument.stats()["moves"])
+
+    def test_percentile(self):
+        self.assertEqual(0, instrument.percentile([], 0.5))
+        values = list(range(1, 201))
+        self.assertEqual(100, instrument.percentile(values, 0.5))
+        self.assertEqual(198, instrument.percentile(values, 0.99))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
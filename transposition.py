@@ -0,0 +1,198 @@
+from array import array
+
+###########################################################
+# Transposition table
+#
+# Fixed size table keyed by 64 bit position hashes. Memory is allocated
+# once as two flat arrays of unsigned 64 bit integers (keys and packed
+# data) so it stays flat however long the table is used. The arrays can
+# also live in a shared memory buffer used by several processes.
+#
+# Each bucket holds two slots: the first is depth-preferred and only
+# replaced by an entry searched at least as deep, the second is always
+# replaced.
+#
+# The key array stores key XOR data, so an entry torn by two processes
+# writing at once fails the key check instead of returning wrong data.
+#
+###########################################################
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+SLOT_BYTES = 16
+BUCKET_SLOTS = 2
+
+# Packed data layout: move (16 bits), depth (8 bits), bound (2 bits),
+# score + SCORE_OFFSET (32 bits)
+SCORE_OFFSET = 1 << 31
+MOVE_MASK = 0xFFFF
+DEPTH_SHIFT = 16
+BOUND_SHIFT = 24
+SCORE_SHIFT = 26
+
+
+def table_slots(size_mb):
+    """
+    :param size_mb: memory cap in megabytes
+    :return: number of slots, the largest power of two bucket count that
+    fits times the slots per bucket
+    """
+    max_buckets = max(1, int(size_mb * 1024 * 1024) //
+                      (SLOT_BYTES * BUCKET_SLOTS))
+    buckets = 1
+    while buckets * 2 <= max_buckets:
+        buckets *= 2
+    return buckets * BUCKET_SLOTS
+
+
+def table_bytes(size_mb):
+    return table_slots(size_mb) * SLOT_BYTES
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, buffer=None):
+        """
+        :param size_mb: memory cap in megabytes; the bucket count is the
+        largest power of two that fits
+        :param buffer: optional writable buffer of table_bytes(size_mb)
+        bytes, such as shared memory, to hold the table
+        """
+        self._size = table_slots(size_mb)
+        self._mask = self._size // BUCKET_SLOTS - 1
+
+        if buffer is None:
+            self._keys = array("Q", bytes(8 * self._size))
+            self._data = array("Q", bytes(8 * self._size))
+        else:
+            view = memoryview(buffer).cast("B")[:table_bytes(size_mb)]
+            view = view.cast("Q")
+            self._keys = view[:self._size]
+            self._data = view[self._size:]
+
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def get_size(self):
+        return self._size
+
+    def get_memory_bytes(self):
+        return self._size * SLOT_BYTES
+
+    def clear(self):
+        self._keys[:] = array("Q", bytes(8 * self._size))
+        self._data[:] = array("Q", bytes(8 * self._size))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._replacements = 0
+
+    def get_stats(self):
+        """
+        :return: dict with hits, misses, collisions, stores, replacements
+        and the fraction of slots in use
+        """
+        probes = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "collisions": self._collisions,
+            "stores": self._stores,
+            "replacements": self._replacements,
+            "hit_rate": self._hits / probes if probes else 0.0,
+            "fill": self.fill()
+        }
+
+    def fill(self, sample=1000):
+        """
+        Fraction of used slots, estimated from the first slots
+        """
+        sample = min(sample, self._size)
+        used = sum(1 for index in range(sample) if self._data[index])
+        return used / sample
+
+    def probe(self, key):
+        """
+        Look up a position
+        :param key: 64 bit position hash
+        :return: (depth, score, bound, move) or None
+        """
+        index = (key & self._mask) * BUCKET_SLOTS
+        keys = self._keys
+        data = self._data
+        for slot in index, index + 1:
+            entry = data[slot]
+            if entry and keys[slot] ^ entry == key:
+                self._hits += 1
+                return unpack(entry)
+
+        self._misses += 1
+        if data[index] or data[index + 1]:
+            # Bucket holds other positions sharing the same index
+            self._collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Store a search result
+        :param key: 64 bit position hash
+        :param depth: remaining search depth of the result
+        :param score: score from the side to move
+        :param bound: EXACT, LOWER or UPPER
+        :param move: best encoded move or 0
+        :return: None
+        """
+        index = (key & self._mask) * BUCKET_SLOTS
+        keys = self._keys
+        data = self._data
+        entry = pack(depth, score, bound, move)
+        self._stores += 1
+
+        # Same position: overwrite, keeping the earlier best move if the new
+        # result has none
+        for slot in index, index + 1:
+            stored = data[slot]
+            if stored and keys[slot] ^ stored == key:
+                if move == 0:
+                    entry = pack(depth, score, bound, stored & MOVE_MASK)
+                keys[slot] = key ^ entry
+                data[slot] = entry
+                return
+
+        stored = data[index]
+        if stored == 0 or depth >= (stored >> DEPTH_SHIFT) & 0xFF:
+            if stored:
+                # Demote the old entry to the always-replace slot
+                if data[index + 1]:
+                    self._replacements += 1
+                keys[index + 1] = keys[index]
+                data[index + 1] = stored
+            keys[index] = key ^ entry
+            data[index] = entry
+        else:
+            if data[index + 1]:
+                self._replacements += 1
+            keys[index + 1] = key ^ entry
+            data[index + 1] = entry
+
+
+def pack(depth, score, bound, move):
+    depth = max(0, min(depth, 255))
+    return (move & MOVE_MASK) | (depth << DEPTH_SHIFT) | \
+        (bound << BOUND_SHIFT) | ((score + SCORE_OFFSET) << SCORE_SHIFT)
+
+
+def unpack(data):
+    """
+    :return: (depth, score, bound, move)
+    """
+    return ((data >> DEPTH_SHIFT) & 0xFF,
+            (data >> SCORE_SHIFT) - SCORE_OFFSET,
+            (data >> BOUND_SHIFT) & 3,
+            data & MOVE_MASK)